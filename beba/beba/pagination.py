@@ -0,0 +1,171 @@
+import base64
+import binascii
+import datetime
+import json
+import math
+from decimal import Decimal
+
+from django.core.exceptions import BadRequest, FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+# Larger integers overflow the database driver
+MAX_CURSOR_INTEGER = 2 ** 63 - 1
+
+
+def encode_cursor(values, direction):
+    """Opaque, URL-safe cursor for the row holding `values`"""
+    payload = []
+    for value in values:
+        if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            value = str(value)
+        payload.append(value)
+    raw = json.dumps({"v": payload, "d": direction}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _valid_cursor_value(value):
+    """Only what encode_cursor() writes: strings and finite numbers the database can hold"""
+    if isinstance(value, str):
+        return True
+    if isinstance(value, int):
+        return abs(value) <= MAX_CURSOR_INTEGER
+    return isinstance(value, float) and math.isfinite(value)
+
+
+def decode_cursor(cursor):
+    """(values, direction) from a cursor; BadRequest (a 400) if it was not made by encode_cursor()"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        values, direction = data["v"], data["d"]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise BadRequest("Invalid page cursor.")
+    if direction not in ("next", "prev") or not isinstance(values, list):
+        raise BadRequest("Invalid page cursor.")
+    if not all(_valid_cursor_value(value) for value in values):
+        raise BadRequest("Invalid page cursor.")
+    return values, direction
+
+
+class KeysetPage:
+    """Stands in for Django's Page in list templates (page_obj)"""
+
+    def __init__(self, object_list, next_querystring=None, previous_querystring=None):
+        self.object_list = object_list
+        self.next_querystring = next_querystring
+        self.previous_querystring = previous_querystring
+
+    def has_next(self):
+        return self.next_querystring is not None
+
+    def has_previous(self):
+        return self.previous_querystring is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginationMixin:
+    """
+    Seek pagination for ListViews: each page is found with a WHERE on the
+    ordering columns rather than an OFFSET, so deep pages cost the same as
+    the first one.
+
+    `ordering` must name non-null model fields; the primary key is appended
+    as a tiebreaker if it isn't already last. Pages are addressed by an
+    opaque ?cursor= value, exposed in templates as
+    page_obj.next_querystring / page_obj.previous_querystring.
+    """
+    paginate_by = 20
+    cursor_kwarg = "cursor"
+
+    def get_keyset_ordering(self):
+        ordering = self.get_ordering() or []
+        if isinstance(ordering, str):
+            ordering = [ordering]
+        ordering = list(ordering)
+        if not ordering or ordering[-1].lstrip("-") not in ("pk", "id"):
+            descending = bool(ordering) and ordering[-1].startswith("-")
+            ordering.append("-pk" if descending else "pk")
+        return [(name.lstrip("-"), name.startswith("-")) for name in ordering]
+
+    def _keyset_field(self, name):
+        meta = self.model._meta
+        try:
+            return meta.pk if name == "pk" else meta.get_field(name)
+        except FieldDoesNotExist:
+            raise ValueError(f"Keyset ordering must use fields of {meta.label}, got '{name}'")
+
+    def _row_values(self, obj, ordering):
+        return [
+            obj.pk if name == "pk" else self._keyset_field(name).value_from_object(obj)
+            for name, descending in ordering
+        ]
+
+    def _seek_filter(self, ordering, values, backwards):
+        """
+        (a > x) OR (a = x AND b > y) OR ..., with each comparison flipped for
+        descending columns. The redundant a >= x in front gives the planner a
+        plain range on the leading column, so it can walk the index in order.
+        """
+        condition = Q()
+        equal_so_far = Q()
+        for (name, descending), value in zip(ordering, values):
+            lookup = "lt" if descending != backwards else "gt"
+            condition |= equal_so_far & Q(**{f"{name}__{lookup}": value})
+            equal_so_far &= Q(**{name: value})
+        (first, descending), first_value = ordering[0], values[0]
+        lookup = "lte" if descending != backwards else "gte"
+        return Q(**{f"{first}__{lookup}": first_value}) & condition
+
+    def _querystring(self, cursor):
+        params = self.request.GET.copy()
+        params.pop("page", None)
+        params[self.cursor_kwarg] = cursor
+        return params.urlencode()
+
+    def paginate_queryset(self, queryset, page_size):
+        ordering = self.get_keyset_ordering()
+        cursor = self.request.GET.get(self.cursor_kwarg)
+        backwards = False
+
+        if cursor:
+            values, direction = decode_cursor(cursor)
+            if len(values) != len(ordering):
+                raise BadRequest("Invalid page cursor.")
+            try:
+                values = [
+                    self._keyset_field(name).to_python(value)
+                    for (name, descending), value in zip(ordering, values)
+                ]
+            except (ValidationError, TypeError, ValueError, OverflowError):
+                raise BadRequest("Invalid page cursor.")
+            backwards = direction == "prev"
+            queryset = queryset.filter(self._seek_filter(ordering, values, backwards))
+
+        order_by = [
+            f"-{name}" if descending != backwards else name
+            for name, descending in ordering
+        ]
+        rows = list(queryset.order_by(*order_by)[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if backwards:
+            rows.reverse()
+
+        has_next = has_more if not backwards else True
+        has_previous = has_more if backwards else bool(cursor)
+        page = KeysetPage(
+            rows,
+            self._querystring(encode_cursor(self._row_values(rows[-1], ordering), "next")) if rows and has_next else None,
+            self._querystring(encode_cursor(self._row_values(rows[0], ordering), "prev")) if rows and has_previous else None,
+        )
+        return (None, page, rows, page.has_other_pages())
@@ -31,6 +31,10 @@ urlpatterns = [
     path('logout/', views.oauth.logout, name='logout'),
     path('operator/login/', views.oauth.login_internal, name='operator_login'),
     path('management/staff', include('staff.urls')),
+    path('management/locations/', include('locations.urls')),
     path('transit/', include('transit.urls')),
+    path('parcels/', include('parcels.urls')),
+    path('track/', include('tracking.urls')),
+    path('billing/', include('billing.urls')),
     
 ]
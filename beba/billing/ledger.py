@@ -0,0 +1,208 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.transaction import TransactionManagementError
+from django.db.models import Count, Max, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import CustomerLedger, Invoice, Payment, Refund
+
+OPEN_STATUSES = ("unpaid", "overdue")
+LEDGER_COLUMNS = ("total_invoiced", "total_paid", "total_refunded", "open_invoices", "last_payment_at", "last_payment_amount")
+ZERO = Decimal("0.00")
+EMPTY_LEDGER = (ZERO, ZERO, ZERO, 0, None, None)
+# Ledgers locked, read and upserted per statement when applying changes
+WRITE_BATCH = 500
+
+
+def _money(value):
+    return value if isinstance(value, Decimal) else Decimal(str(value or 0))
+
+
+class LedgerChanges:
+    """
+    Ledger deltas collected per customer and written together by apply().
+    The single-object signals and the bulk paths (billing runs, statement
+    reconciliation) both go through here, so every change reaches the
+    ledger in the transaction that made it.
+    """
+
+    def __init__(self):
+        self.deltas = defaultdict(dict)  # customer_id -> {field: delta}
+        self.last_payments = {}  # customer_id -> (payment id, timestamp, amount)
+        self.stale_last_payments = set()
+
+    def add(self, customer_id, **deltas):
+        if customer_id is None:
+            return
+        fields = self.deltas[customer_id]
+        for field, delta in deltas.items():
+            fields[field] = fields.get(field, 0) + delta
+
+    def invoice(self, customer_id, amount_due, status, sign=1):
+        self.add(
+            customer_id,
+            total_invoiced=sign * _money(amount_due) if status != "cancelled" else ZERO,
+            open_invoices=sign if status in OPEN_STATUSES else 0,
+        )
+
+    def payment(self, customer_id, amount, sign=1):
+        self.add(customer_id, total_paid=sign * _money(amount))
+
+    def refund(self, customer_id, amount, sign=1):
+        self.add(customer_id, total_refunded=sign * _money(amount))
+
+    def payment_recorded(self, payment):
+        """A new payment: count it and make it the customer's last one"""
+        self.payment(payment.customer_id, payment.amount)
+        if payment.customer_id is not None:
+            last = self.last_payments.get(payment.customer_id)
+            if last is None or payment.pk > last[0]:
+                self.last_payments[payment.customer_id] = (payment.pk, payment.timestamp, _money(payment.amount))
+
+    def apply(self):
+        """
+        Write the collected deltas: the customers' ledgers are locked and
+        read, the deltas added, and the results upserted in batches. Must be
+        called inside the transaction.atomic() block that made the changes;
+        in autocommit the ledger could commit without them, or they without
+        the ledger.
+        """
+        if not transaction.get_connection().in_atomic_block:
+            raise TransactionManagementError("LedgerChanges.apply() must run inside the transaction that made the changes.")
+        customer_ids = sorted(
+            {customer_id for customer_id, fields in self.deltas.items() if any(fields.values())}
+            | set(self.last_payments)
+        )
+        for start in range(0, len(customer_ids), WRITE_BATCH):
+            self._write(customer_ids[start:start + WRITE_BATCH])
+        stale = self.stale_last_payments - set(self.last_payments)
+        if stale:
+            refresh_last_payments(stale)
+        self.deltas.clear()
+        self.last_payments.clear()
+        self.stale_last_payments.clear()
+
+    def _write(self, customer_ids):
+        now = timezone.now()
+        # Create missing ledgers first: select_for_update() cannot lock rows that do not exist yet
+        CustomerLedger.objects.bulk_create(
+            [CustomerLedger(customer_id=customer_id, updated_at=now) for customer_id in customer_ids],
+            ignore_conflicts=True,
+        )
+        stored = {
+            row[0]: row[1:]
+            for row in CustomerLedger.objects.select_for_update().filter(customer_id__in=customer_ids)
+            .values_list("customer_id", *LEDGER_COLUMNS)
+        }
+        ledgers = []
+        for customer_id in customer_ids:
+            values = dict(zip(LEDGER_COLUMNS, stored[customer_id]))
+            for field, delta in self.deltas.get(customer_id, {}).items():
+                values[field] += delta
+            if customer_id in self.last_payments:
+                payment_id, values["last_payment_at"], values["last_payment_amount"] = self.last_payments[customer_id]
+            ledgers.append(CustomerLedger(customer_id=customer_id, updated_at=now, **values))
+        CustomerLedger.objects.bulk_create(
+            ledgers,
+            update_conflicts=True,
+            unique_fields=["customer"],
+            update_fields=LEDGER_COLUMNS + ("updated_at",),
+        )
+
+
+def _latest_payment(field):
+    return Subquery(
+        Payment.objects.filter(customer_id=OuterRef("customer_id")).order_by("-pk").values(field)[:1]
+    )
+
+
+def refresh_last_payments(customer_ids):
+    """Re-read the last payment of customers after one of theirs was removed or moved"""
+    CustomerLedger.objects.filter(customer_id__in=customer_ids).update(
+        last_payment_at=_latest_payment("timestamp"),
+        last_payment_amount=_latest_payment("amount"),
+        updated_at=timezone.now(),
+    )
+
+
+def fresh_ledgers():
+    """
+    {customer_id: values in LEDGER_COLUMNS order} aggregated from scratch
+    with one grouped query per table. The last payment is the most
+    recently recorded one.
+    """
+    ledgers = defaultdict(lambda: list(EMPTY_LEDGER))
+    for customer_id, invoiced, open_count in (
+        Invoice.objects.filter(customer__isnull=False).values("customer_id")
+        .annotate(
+            invoiced=Sum("amount_due", filter=~Q(status="cancelled")),
+            open_count=Count("pk", filter=Q(status__in=OPEN_STATUSES)),
+        ).values_list("customer_id", "invoiced", "open_count").order_by()
+    ):
+        ledgers[customer_id][0] = invoiced or ZERO
+        ledgers[customer_id][3] = open_count
+
+    last_ids = []
+    for customer_id, paid, last_id in (
+        Payment.objects.filter(customer__isnull=False).values("customer_id")
+        .annotate(paid=Sum("amount"), last_id=Max("pk")).values_list("customer_id", "paid", "last_id").order_by()
+    ):
+        ledgers[customer_id][1] = paid
+        last_ids.append(last_id)
+    for start in range(0, len(last_ids), 1000):
+        for customer_id, timestamp, amount in Payment.objects.filter(pk__in=last_ids[start:start + 1000]).values_list(
+            "customer_id", "timestamp", "amount"
+        ):
+            ledgers[customer_id][4:6] = [timestamp, amount]
+
+    for customer_id, refunded in (
+        Refund.objects.annotate(owner=Coalesce("customer_id", "payment__customer_id"))
+        .filter(owner__isnull=False).values("owner")
+        .annotate(refunded=Sum("amount")).values_list("owner", "refunded").order_by()
+    ):
+        ledgers[customer_id][2] = refunded
+    return {customer_id: tuple(values) for customer_id, values in ledgers.items()}
+
+
+def rebuild_ledgers(save=False):
+    """
+    Compare every CustomerLedger with fresh_ledgers(). Returns
+    [(customer_id, stored values or None, fresh values)] for the ledgers
+    that differ; with `save`, those are rewritten in one transaction.
+    """
+    with transaction.atomic():
+        fresh = fresh_ledgers()
+        stored = {
+            row[0]: tuple(row[1:])
+            for row in CustomerLedger.objects.select_for_update().values_list("customer_id", *LEDGER_COLUMNS)
+        }
+        mismatches = [
+            (customer_id, stored.get(customer_id), values)
+            for customer_id, values in fresh.items()
+            if stored.get(customer_id, EMPTY_LEDGER) != values
+        ]
+        mismatches.extend(
+            (customer_id, values, EMPTY_LEDGER)
+            for customer_id, values in stored.items()
+            if customer_id not in fresh and values != EMPTY_LEDGER
+        )
+        mismatches.sort(key=lambda mismatch: mismatch[0])
+        if save and mismatches:
+            now = timezone.now()
+            ledgers = [
+                CustomerLedger(customer_id=customer_id, updated_at=now, **dict(zip(LEDGER_COLUMNS, values)))
+                for customer_id, before, values in mismatches
+            ]
+            CustomerLedger.objects.bulk_create(
+                [ledger for ledger, (customer_id, before, values) in zip(ledgers, mismatches) if before is None],
+                batch_size=1000,
+            )
+            CustomerLedger.objects.bulk_update(
+                [ledger for ledger, (customer_id, before, values) in zip(ledgers, mismatches) if before is not None],
+                LEDGER_COLUMNS + ("updated_at",),
+                batch_size=1000,
+            )
+    return mismatches
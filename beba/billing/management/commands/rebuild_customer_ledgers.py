@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from billing.ledger import LEDGER_COLUMNS, rebuild_ledgers
+
+
+class Command(BaseCommand):
+    help = (
+        "Check every customer ledger against a fresh aggregate of invoices, payments and refunds. "
+        "Run with --save once after deploying the ledgers, and to repair any drift."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--save", action="store_true", help="Rewrite the ledgers that differ (default: only report)")
+        parser.add_argument("--show", type=int, default=20, help="How many differing ledgers to list")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        mismatches = rebuild_ledgers(save=options["save"])
+        for customer_id, stored, fresh in mismatches[:options["show"]]:
+            if stored is None:
+                self.stdout.write(f"  customer {customer_id}: no ledger")
+                continue
+            changes = ", ".join(
+                f"{column} {before} -> {after}"
+                for column, before, after in zip(LEDGER_COLUMNS, stored, fresh)
+                if before != after
+            )
+            self.stdout.write(f"  customer {customer_id}: {changes}")
+
+        elapsed = time.monotonic() - started
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS(f"All customer ledgers match ({elapsed:.2f}s)"))
+        elif options["save"]:
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(mismatches)} customer ledgers ({elapsed:.2f}s)"))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"{len(mismatches)} customer ledgers differ from the aggregate ({elapsed:.2f}s); run with --save to fix them"
+            ))
@@ -0,0 +1,45 @@
+import csv
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from billing.reconcile import (
+    DEFAULT_CHUNK_SIZE, STATEMENT_METHODS, StatementError, read_statement, reconcile_statement
+)
+
+
+class Command(BaseCommand):
+    help = "Record the credits of a mobile-money statement (CSV) as payments against open invoices."
+
+    def add_arguments(self, parser):
+        parser.add_argument("statement", help="Path to the statement CSV")
+        parser.add_argument("--method", choices=STATEMENT_METHODS, default="mpesa")
+        parser.add_argument("--exceptions", help="Write unmatched lines to this CSV file (default: <statement>.exceptions.csv)")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        path = options["statement"]
+        report_path = options["exceptions"] or f"{os.path.splitext(path)[0]}.exceptions.csv"
+        try:
+            with open(path, newline="", encoding="utf-8-sig") as stream, \
+                    open(report_path, "w", newline="", encoding="utf-8") as report:
+                result = reconcile_statement(
+                    read_statement(stream),
+                    method=options["method"],
+                    file_name=os.path.basename(path),
+                    exceptions=csv.writer(report),
+                    chunk_size=options["chunk_size"],
+                )
+        except OSError as exc:
+            raise CommandError(str(exc))
+        except StatementError as exc:
+            # Chunks before the failing line stay reconciled
+            raise CommandError(f"{path}: {exc}")
+
+        if result.unmatched:
+            self.stderr.write(f"{result.unmatched} lines did not match, see {report_path}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Matched {result.matched} of {result.lines} lines ({result.amount} paid, {result.invoices_paid} invoices "
+            f"settled, {result.overpaid} overpaid, {result.skipped} skipped) in {result.elapsed:.2f}s "
+            f"({result.rate:.0f} lines/sec)"
+        ))
@@ -0,0 +1,44 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from billing.runs import BillingRunError, month_bounds, run_billing
+
+
+class Command(BaseCommand):
+    help = (
+        "Issue consolidated monthly invoices to business customers. Safe to rerun: an interrupted "
+        "run resumes after the last customer it finished."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--month", help="Month to bill, YYYY-MM (default: last month)")
+
+    def handle(self, *args, **options):
+        if options["month"]:
+            try:
+                day = datetime.datetime.strptime(options["month"], "%Y-%m").date()
+            except ValueError:
+                raise CommandError("--month must look like 2024-05")
+        else:
+            day = timezone.localdate().replace(day=1) - datetime.timedelta(days=1)
+        start, end = month_bounds(day)
+
+        started = time.monotonic()
+
+        def progress(run):
+            if options["verbosity"] > 1:
+                rate = run.lines_created / (time.monotonic() - started)
+                self.stdout.write(f"  {run.invoices_created} invoices, {run.lines_created} lines ({rate:,.0f} lines/s)")
+
+        try:
+            run = run_billing(start, end, progress=progress)
+        except BillingRunError as exc:
+            raise CommandError(str(exc))
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{run}: {run.invoices_created} invoices, {run.lines_created} lines, "
+            f"{run.amount_billed} billed ({elapsed:.1f}s this session)"
+        ))
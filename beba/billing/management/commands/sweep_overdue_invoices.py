@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from billing.overdue import CHUNK_SIZE, overdue_totals_by_customer, pending_overdue, sweep_overdue
+
+
+class Command(BaseCommand):
+    help = "Mark unpaid invoices past their due date as overdue and queue a notice for each. Run it periodically."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+        parser.add_argument("--top", type=int, default=10, help="How many customers to list by overdue amount")
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would be flipped")
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be positive")
+        if options["dry_run"]:
+            count, outstanding = pending_overdue()
+            self.stdout.write(f"{count} unpaid invoices are past due ({outstanding} outstanding); nothing changed")
+            return
+
+        result = sweep_overdue(chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Flipped {result.flipped} invoices to overdue in {result.chunks} chunks, "
+            f"{result.notices} customers to notify, "
+            f"{result.elapsed:.2f}s ({result.rate:,.0f} rows/s)"
+        ))
+        if options["top"]:
+            for row in overdue_totals_by_customer()[:options["top"]]:
+                self.stdout.write(f"  customer {row['customer_id']}: {row['invoices']} invoices, {row['outstanding']} outstanding")
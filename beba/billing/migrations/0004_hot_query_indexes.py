@@ -0,0 +1,24 @@
+# Generated by Django 5.1.7 on 2026-10-17 22:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0003_initial'),
+        ('customers', '0001_initial'),
+        ('orders', '0002_initial'),
+        ('parcels', '0004_numbersequence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['status', 'due_date'], name='invoice_status_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(condition=models.Q(('status', 'unpaid')), fields=['due_date'], name='invoice_unpaid_due_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0004_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Surcharge',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('express', 'Express priority'), ('overnight', 'Overnight priority'), ('fragile', 'Fragile handling'), ('signature', 'Signature on delivery')], max_length=20, unique=True)),
+                ('multiplier', models.DecimalField(decimal_places=2, default=1, max_digits=5)),
+                ('flat_fee', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Tariff',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('origin_zone', models.CharField(default='*', max_length=100)),
+                ('destination_zone', models.CharField(default='*', max_length=100)),
+                ('min_weight', models.DecimalField(decimal_places=2, default=0, max_digits=8)),
+                ('max_weight', models.DecimalField(blank=True, decimal_places=2, max_digits=8, null=True)),
+                ('base_fee', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('per_kg_fee', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('active', models.BooleanField(default=True)),
+            ],
+            options={
+                'ordering': ['origin_zone', 'destination_zone', 'min_weight'],
+            },
+        ),
+    ]
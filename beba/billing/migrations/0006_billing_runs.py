@@ -0,0 +1,53 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0005_tariffs'),
+        ('orders', '0002_initial'),
+        ('parcels', '0006_change_seq'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillingRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField()),
+                ('period_end', models.DateField()),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='running', max_length=20)),
+                ('last_customer_id', models.BigIntegerField(default=0)),
+                ('invoices_created', models.PositiveIntegerField(default=0)),
+                ('lines_created', models.PositiveIntegerField(default=0)),
+                ('amount_billed', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('period_start', 'period_end'), name='billing_run_period_uniq')],
+            },
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='billing_run',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='invoices', to='billing.billingrun'),
+        ),
+        migrations.CreateModel(
+            name='InvoiceLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('description', models.CharField(max_length=200)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='billing.invoice')),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='invoice_lines', to='orders.order')),
+                ('parcel', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='invoice_lines', to='parcels.parcel')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('parcel__isnull', False)), fields=('parcel',), name='invoice_line_parcel_uniq'), models.UniqueConstraint(condition=models.Q(('order__isnull', False)), fields=('order',), name='invoice_line_order_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0006_billing_runs'),
+        ('customers', '0001_initial'),
+        ('orders', '0002_initial'),
+        ('parcels', '0007_sender_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OverdueNotice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('swept_at', models.DateTimeField()),
+                ('invoice_count', models.PositiveIntegerField()),
+                ('amount_outstanding', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('total_overdue', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('notified_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='overdue_since',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(condition=models.Q(('status', 'overdue')), fields=['overdue_since'], name='invoice_overdue_since_idx'),
+        ),
+        migrations.AddField(
+            model_name='overduenotice',
+            name='customer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='overdue_notices', to='customers.customer'),
+        ),
+        migrations.AddIndex(
+            model_name='overduenotice',
+            index=models.Index(fields=['swept_at'], name='overdue_notice_swept_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='overduenotice',
+            index=models.Index(condition=models.Q(('notified_at__isnull', True)), fields=['customer'], name='overdue_notice_pending_idx'),
+        ),
+    ]
@@ -1,7 +1,25 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.utils import timezone
 
-class Invoice(models.Model):
+
+class LedgerEntry(models.Model):
+    """
+    A row counted in its customer's ledger. The ledger receivers in
+    billing.signals run inside save(), so the row and the ledger change
+    commit together even in autocommit. Deletes already run in one
+    transaction with their signals.
+    """
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, using=None, **kwargs):
+        using = using or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, using=using, **kwargs)
+
+
+class Invoice(LedgerEntry):
     STATUS_CHOICES = [
         ("unpaid", "Unpaid"),
         ("paid", "Paid"),
@@ -23,11 +41,98 @@ class Invoice(models.Model):
     due_date = models.DateTimeField(null=True, blank=True)
 
     notes = models.TextField(blank=True)
+    billing_run = models.ForeignKey("BillingRun", on_delete=models.SET_NULL, null=True, blank=True, related_name="invoices")
+    overdue_since = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "due_date"], name="invoice_status_due_idx"),
+            # The overdue sweep only scans invoices that are still unpaid
+            models.Index(fields=["due_date"], condition=models.Q(status="unpaid"), name="invoice_unpaid_due_idx"),
+            models.Index(fields=["overdue_since"], condition=models.Q(status="overdue"), name="invoice_overdue_since_idx"),
+        ]
 
     def __str__(self):
         return f"Invoice {self.invoice_number} ({self.get_status_display()})"
 
-class Payment(models.Model):
+class InvoiceLine(models.Model):
+    """One billed parcel or order on a consolidated invoice"""
+    invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name="lines")
+    parcel = models.ForeignKey("parcels.Parcel", on_delete=models.SET_NULL, null=True, blank=True, related_name="invoice_lines")
+    order = models.ForeignKey("orders.Order", on_delete=models.SET_NULL, null=True, blank=True, related_name="invoice_lines")
+    description = models.CharField(max_length=200)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            # A parcel or order is billed once, however often a run is resumed
+            models.UniqueConstraint(fields=["parcel"], condition=models.Q(parcel__isnull=False), name="invoice_line_parcel_uniq"),
+            models.UniqueConstraint(fields=["order"], condition=models.Q(order__isnull=False), name="invoice_line_order_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.description}: {self.amount}"
+
+class BillingRun(models.Model):
+    """A monthly consolidated invoicing run over business customers (see billing.runs)"""
+    STATUS_CHOICES = [
+        ("running", "Running"),
+        ("completed", "Completed"),
+        ("failed", "Failed"),
+    ]
+
+    period_start = models.DateField()
+    period_end = models.DateField()  # exclusive
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="running")
+    # Customers are invoiced in id order; everyone up to this id is done, so a rerun resumes after it
+    last_customer_id = models.BigIntegerField(default=0)
+    invoices_created = models.PositiveIntegerField(default=0)
+    lines_created = models.PositiveIntegerField(default=0)
+    amount_billed = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["period_start", "period_end"], name="billing_run_period_uniq"),
+        ]
+
+    def __str__(self):
+        return f"Billing run {self.period_start} to {self.period_end} ({self.get_status_display()})"
+
+class OverdueNotice(models.Model):
+    """A customer's invoices that went overdue in one sweep (billing.overdue), waiting to be notified"""
+    customer = models.ForeignKey("customers.Customer", on_delete=models.CASCADE, related_name="overdue_notices")
+    swept_at = models.DateTimeField()
+    invoice_count = models.PositiveIntegerField()
+    amount_outstanding = models.DecimalField(max_digits=12, decimal_places=2)
+    total_overdue = models.DecimalField(max_digits=12, decimal_places=2)
+    notified_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["swept_at"], name="overdue_notice_swept_idx"),
+            models.Index(fields=["customer"], condition=models.Q(notified_at__isnull=True), name="overdue_notice_pending_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.invoice_count} overdue invoices for customer {self.customer_id}"
+
+class StatementImport(models.Model):
+    """One mobile-money provider statement reconciled into payments (see billing.reconcile)"""
+    file_name = models.CharField(max_length=255, blank=True)
+    method = models.CharField(max_length=20)
+    lines = models.PositiveIntegerField(default=0)
+    matched = models.PositiveIntegerField(default=0)
+    unmatched = models.PositiveIntegerField(default=0)
+    amount_matched = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Statement {self.file_name or self.pk}: {self.matched} of {self.lines} lines matched"
+
+class Payment(LedgerEntry):
     METHOD_CHOICES = [
         ("card", "Card"),
         ("mobile_money", "Mobile Money"),
@@ -42,12 +147,19 @@ class Payment(models.Model):
     method = models.CharField(max_length=20, choices=METHOD_CHOICES)
     reference_code = models.CharField(max_length=50, blank=True)  # e.g. transaction ID
     timestamp = models.DateTimeField(auto_now_add=True)
+    statement = models.ForeignKey(StatementImport, on_delete=models.SET_NULL, null=True, blank=True, related_name="payments", db_index=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["method", "reference_code"], name="payment_method_reference_idx"),
+            # Reconciliation sums a statement's new payments per invoice
+            models.Index(fields=["statement", "invoice"], name="payment_statement_invoice_idx"),
+        ]
 
     def __str__(self):
         return f"Payment {self.amount} via {self.get_method_display()} for {self.invoice.invoice_number}"
 
-class Refund(models.Model):
+class Refund(LedgerEntry):
     payment = models.ForeignKey(Payment, on_delete=models.CASCADE, related_name="refunds")
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     reason = models.TextField(blank=True)
@@ -57,3 +169,67 @@ class Refund(models.Model):
 
     def __str__(self):
         return f"Refund {self.amount} for Payment {self.payment.id}"
+
+class CustomerLedger(models.Model):
+    """
+    Running account totals of a customer, kept up to date by billing.ledger
+    whenever invoices, payments or refunds change, so pages never have to
+    sum the three tables. rebuild_customer_ledgers checks them against a
+    fresh aggregate.
+    """
+    customer = models.OneToOneField("customers.Customer", on_delete=models.CASCADE, primary_key=True, related_name="ledger")
+    total_invoiced = models.DecimalField(max_digits=14, decimal_places=2, default=0)  # invoices not cancelled
+    total_paid = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_refunded = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    open_invoices = models.IntegerField(default=0)  # unpaid or overdue
+    last_payment_at = models.DateTimeField(null=True, blank=True)
+    last_payment_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def balance(self):
+        """What the customer owes; negative when in credit"""
+        return self.total_invoiced - self.total_paid + self.total_refunded
+
+    def __str__(self):
+        return f"Ledger of customer {self.customer_id}: {self.balance}"
+
+class Tariff(models.Model):
+    """
+    One weight band of the price list between two zones. A location's zone
+    is its region (or its city when it has no region), compared without
+    case; "*" matches any zone. The fee is base_fee plus per_kg_fee for
+    every kg above min_weight.
+    """
+    ANY_ZONE = "*"
+
+    origin_zone = models.CharField(max_length=100, default=ANY_ZONE)
+    destination_zone = models.CharField(max_length=100, default=ANY_ZONE)
+    min_weight = models.DecimalField(max_digits=8, decimal_places=2, default=0)  # kg, exclusive except for 0
+    max_weight = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True)  # kg, inclusive; empty for no limit
+    base_fee = models.DecimalField(max_digits=10, decimal_places=2)
+    per_kg_fee = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    active = models.BooleanField(default=True)
+
+    class Meta:
+        ordering = ["origin_zone", "destination_zone", "min_weight"]
+
+    def __str__(self):
+        upper = f"{self.max_weight}" if self.max_weight is not None else "+"
+        return f"{self.origin_zone} → {self.destination_zone}, {self.min_weight}-{upper} kg"
+
+class Surcharge(models.Model):
+    """Extra charge for a parcel option; priority multipliers apply to the delivery fee"""
+    KIND_CHOICES = [
+        ("express", "Express priority"),
+        ("overnight", "Overnight priority"),
+        ("fragile", "Fragile handling"),
+        ("signature", "Signature on delivery"),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, unique=True)
+    multiplier = models.DecimalField(max_digits=5, decimal_places=2, default=1)
+    flat_fee = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: x{self.multiplier} + {self.flat_fee}"
@@ -0,0 +1,103 @@
+import time
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Max, Q, Sum
+from django.utils import timezone
+
+from .models import Invoice, OverdueNotice
+
+CHUNK_SIZE = 5000
+
+OUTSTANDING = ExpressionWrapper(F("amount_due") - F("amount_paid"), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+class SweepResult:
+    def __init__(self, swept_at):
+        self.swept_at = swept_at
+        self.flipped = 0
+        self.chunks = 0
+        self.notices = 0
+        self.elapsed = 0.0
+
+    @property
+    def rate(self):
+        return self.flipped / self.elapsed if self.elapsed else 0.0
+
+
+def _due(now):
+    # Served by the partial index on due_date over unpaid invoices
+    return Invoice.objects.filter(status="unpaid", due_date__lt=now)
+
+
+def overdue_totals_by_customer():
+    """Overdue invoice count and outstanding amount per customer, largest first, in one grouped query"""
+    return (
+        Invoice.objects.filter(status="overdue", customer__isnull=False)
+        .values("customer_id")
+        .annotate(invoices=Count("pk"), outstanding=Sum(OUTSTANDING))
+        .order_by("-outstanding")
+    )
+
+
+def _record_notices(swept_at):
+    """
+    One OverdueNotice per customer with invoices stamped overdue since the
+    last recorded sweep (including any sweep that stopped before getting
+    here), carrying their total overdue balance; one grouped query.
+    """
+    last = OverdueNotice.objects.aggregate(last=Max("swept_at"))["last"]
+    new = Q(overdue_since__isnull=False) if last is None else Q(overdue_since__gt=last)
+    rows = (
+        overdue_totals_by_customer()
+        .annotate(new_invoices=Count("pk", filter=new), new_outstanding=Sum(OUTSTANDING, filter=new))
+        .filter(new_invoices__gt=0)
+        .order_by()
+    )
+    return OverdueNotice.objects.bulk_create(
+        (
+            OverdueNotice(
+                customer_id=row["customer_id"],
+                swept_at=swept_at,
+                invoice_count=row["new_invoices"],
+                amount_outstanding=row["new_outstanding"],
+                total_overdue=row["outstanding"],
+            )
+            for row in rows.iterator(chunk_size=CHUNK_SIZE)
+        ),
+        batch_size=1000,
+    )
+
+
+def sweep_overdue(now=None, chunk_size=CHUNK_SIZE):
+    """
+    Move unpaid invoices past their due date to overdue, `chunk_size` at a
+    time, each chunk a single UPDATE in its own transaction that also
+    stamps overdue_since. Flipped rows leave the partial index, so every
+    chunk picks from the front again without an offset. The customers
+    affected then get one OverdueNotice each for the notifier. Unpaid and
+    overdue invoices both count as open, so customer ledgers do not move.
+    """
+    if chunk_size < 1:
+        raise ValueError("Chunk size must be at least 1")
+    now = now or timezone.now()
+    result = SweepResult(now)
+    started = time.monotonic()
+    while True:
+        with transaction.atomic():
+            flipped = Invoice.objects.filter(
+                pk__in=_due(now).order_by("due_date").values("pk")[:chunk_size], status="unpaid",
+            ).update(status="overdue", overdue_since=now)
+        result.flipped += flipped
+        result.chunks += 1
+        if flipped < chunk_size:
+            break
+    with transaction.atomic():
+        result.notices = len(_record_notices(now))
+    result.elapsed = time.monotonic() - started
+    return result
+
+
+def pending_overdue(now=None):
+    """(count, outstanding) of unpaid invoices a sweep would flip now"""
+    totals = _due(now or timezone.now()).aggregate(count=Count("pk"), outstanding=Sum(OUTSTANDING))
+    return totals["count"], totals["outstanding"] or 0
@@ -0,0 +1,264 @@
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from locations.models import Location
+from .models import Surcharge, Tariff
+
+PRIORITIES = ("standard", "express", "overnight")
+ANY_ZONE = Tariff.ANY_ZONE
+# Band lookups search on pair * WEIGHT_SPAN + weight; weights are below 10^6 kg
+WEIGHT_SPAN = 10_000_000.0
+VERSION_CACHE_KEY = "billing:tariff_version"
+VERSION_CHECK_INTERVAL = 5.0
+MAX_AGE = 600  # rebuild at least this often (seconds) in case a change was missed
+QUOTE_CACHE_SIZE = getattr(settings, "QUOTE_CACHE_SIZE", 8192)
+MAX_QUOTE_WEIGHT = Decimal("1000")
+CENT = Decimal("0.01")
+
+
+class QuoteError(ValueError):
+    """Raised for quote input that cannot be priced; the message is safe to show"""
+
+
+def zone_of(region, city):
+    return ((region or "").strip() or (city or "").strip()).casefold()
+
+
+def tag_key(tag):
+    """Location tags are matched case-insensitively, on this form"""
+    return (tag or "").strip().upper()
+
+
+class TariffTable:
+    """
+    The price list as numpy arrays. Bands are sorted by (zone pair, weight)
+    so a whole batch of parcels finds its bands with one searchsorted.
+    """
+
+    def __init__(self, version=None):
+        self.version = version
+        self.built = time.monotonic()
+        self.location_zones = {}  # location id -> zone
+        self.location_ids = {}  # tag_key(location_tag) -> id
+        for pk, tag, region, city in Location.objects.values_list("pk", "location_tag", "region", "city"):
+            self.location_zones[pk] = zone_of(region, city)
+            self.location_ids[tag_key(tag)] = pk
+
+        rows = sorted(
+            (zone_of(origin, ""), zone_of(destination, ""), float(low), float("inf") if high is None else float(high),
+             float(base), float(per_kg))
+            for origin, destination, low, high, base, per_kg in Tariff.objects.filter(active=True).values_list(
+                "origin_zone", "destination_zone", "min_weight", "max_weight", "base_fee", "per_kg_fee"
+            )
+        )
+        self.pairs = {}
+        for origin, destination, *band in rows:
+            self.pairs.setdefault((origin, destination), len(self.pairs))
+        self.band_pair = np.array([self.pairs[(row[0], row[1])] for row in rows], dtype=np.int64)
+        self.band_min = np.array([row[2] for row in rows], dtype=np.float64)
+        self.band_max = np.array([row[3] for row in rows], dtype=np.float64)
+        self.band_base = np.array([row[4] for row in rows], dtype=np.float64)
+        self.band_per_kg = np.array([row[5] for row in rows], dtype=np.float64)
+        self.band_key = self.band_pair * WEIGHT_SPAN + self.band_min
+
+        surcharges = {
+            kind: (float(multiplier), float(flat))
+            for kind, multiplier, flat in Surcharge.objects.values_list("kind", "multiplier", "flat_fee")
+        }
+        neutral = (1.0, 0.0)
+        self.priority_multiplier = np.array([surcharges.get(p, neutral)[0] for p in PRIORITIES])
+        self.priority_flat = np.array([surcharges.get(p, neutral)[1] for p in PRIORITIES])
+        self.fragile = surcharges.get("fragile", neutral)
+        self.signature = surcharges.get("signature", neutral)
+
+    def pair_for(self, origin_zone, destination_zone):
+        """Most specific zone pair with tariffs, or -1"""
+        for pair in (
+            (origin_zone, destination_zone),
+            (origin_zone, ANY_ZONE),
+            (ANY_ZONE, destination_zone),
+            (ANY_ZONE, ANY_ZONE),
+        ):
+            if pair in self.pairs:
+                return self.pairs[pair]
+        return -1
+
+    def price(self, origin_ids, destination_ids, weights, priorities, fragile, signature):
+        """
+        Price a batch given parallel sequences. Returns (delivery_fee,
+        extra_charges, priced) arrays; fees are rounded to cents and only
+        meaningful where `priced` is True.
+        """
+        weights = np.asarray(weights, dtype=np.float64)
+        count = len(weights)
+        if not count or not len(self.band_key):
+            return np.zeros(count), np.zeros(count), np.zeros(count, dtype=bool)
+
+        # Few distinct zone pairs per batch: resolve each once, then broadcast
+        zones = [
+            (self.location_zones.get(origin), self.location_zones.get(destination))
+            for origin, destination in zip(origin_ids, destination_ids)
+        ]
+        distinct = {pair: None for pair in zones}
+        for origin_zone, destination_zone in distinct:
+            if origin_zone is None or destination_zone is None:
+                distinct[(origin_zone, destination_zone)] = -1
+            else:
+                distinct[(origin_zone, destination_zone)] = self.pair_for(origin_zone, destination_zone)
+        pair = np.fromiter((distinct[zone] for zone in zones), dtype=np.int64, count=count)
+
+        position = np.searchsorted(self.band_key, pair * WEIGHT_SPAN + weights, side="left") - 1
+        safe = np.clip(position, 0, len(self.band_key) - 1)
+        priced = (
+            (pair >= 0) & (position >= 0) & (weights > 0)
+            & (self.band_pair[safe] == pair) & (weights <= self.band_max[safe])
+        )
+        base = self.band_base[safe] + self.band_per_kg[safe] * (weights - self.band_min[safe])
+
+        codes = np.fromiter((PRIORITIES.index(p) if p in PRIORITIES else 0 for p in priorities), dtype=np.int64, count=count)
+        delivery_fee = base * self.priority_multiplier[codes] + self.priority_flat[codes]
+        fragile = np.asarray(fragile, dtype=bool)
+        signature = np.asarray(signature, dtype=bool)
+        extra = (
+            fragile * (base * (self.fragile[0] - 1) + self.fragile[1])
+            + signature * (base * (self.signature[0] - 1) + self.signature[1])
+        )
+        return np.round(delivery_fee, 2), np.round(extra, 2), priced
+
+
+class _TableCache:
+    """Process-wide TariffTable, rebuilt when tariffs, surcharges or locations change"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._table = None
+        self._version = None
+        self._built = 0.0
+        self._checked = 0.0
+
+    def invalidate(self):
+        self._table = None
+        try:
+            cache.incr(VERSION_CACHE_KEY)
+        except ValueError:
+            cache.set(VERSION_CACHE_KEY, 1, None)
+
+    def get(self):
+        now = time.monotonic()
+        table = self._table
+        if table is not None and now - self._checked < VERSION_CHECK_INTERVAL:
+            return table
+        with self._lock:
+            version = cache.get(VERSION_CACHE_KEY)
+            if self._table is None or version != self._version or now - self._built > MAX_AGE:
+                self._table = TariffTable(version)
+                self._version = version
+                self._built = now
+            self._checked = now
+            return self._table
+
+
+tariff_table = _TableCache()
+
+
+def _money(value):
+    return Decimal(repr(float(value))).quantize(CENT)
+
+
+def apply_tariffs(parcels, overwrite=False):
+    """
+    Fill delivery_fee and extra_charges on (unsaved) parcels in one
+    vectorised pass. Only fields that are None are set unless `overwrite`;
+    parcels no tariff covers get 0.00. Returns how many were priced from a
+    tariff.
+    """
+    parcels = [
+        parcel for parcel in parcels
+        if overwrite or parcel.delivery_fee is None or parcel.extra_charges is None
+    ]
+    if not parcels:
+        return 0
+    fees, extras, priced = tariff_table.get().price(
+        [parcel.origin_id for parcel in parcels],
+        [parcel.destination_station_id for parcel in parcels],
+        [float(parcel.weight) for parcel in parcels],
+        [parcel.priority for parcel in parcels],
+        [parcel.fragile for parcel in parcels],
+        [parcel.requires_signature for parcel in parcels],
+    )
+    zero = Decimal("0.00")
+    for parcel, fee, extra, ok in zip(parcels, fees.tolist(), extras.tolist(), priced.tolist()):
+        if overwrite or parcel.delivery_fee is None:
+            parcel.delivery_fee = _money(fee) if ok else zero
+        if overwrite or parcel.extra_charges is None:
+            parcel.extra_charges = _money(extra) if ok else zero
+    return int(priced.sum())
+
+
+def normalise_quote(params):
+    """
+    Validated, canonical quote inputs from request parameters, so that
+    equivalent requests share a cache entry:
+    (origin_tag, destination_tag, weight, priority, fragile, signature)
+    """
+    origin = tag_key(params.get("origin"))
+    destination = tag_key(params.get("destination"))
+    if not origin or not destination:
+        raise QuoteError("origin and destination location tags are required.")
+    try:
+        weight = Decimal(params.get("weight") or "")
+        if not weight.is_finite():
+            raise QuoteError("weight must be a number of kg.")
+        weight = weight.quantize(CENT)
+    except InvalidOperation:
+        raise QuoteError("weight must be a number of kg.")
+    if not 0 < weight <= MAX_QUOTE_WEIGHT:
+        raise QuoteError(f"weight must be above 0 and at most {MAX_QUOTE_WEIGHT} kg.")
+    priority = (params.get("priority") or "standard").strip().lower()
+    if priority not in PRIORITIES:
+        raise QuoteError(f"priority must be one of {', '.join(PRIORITIES)}.")
+    flags = [
+        (params.get(name) or "").strip().lower() in ("1", "true", "yes", "on")
+        for name in ("fragile", "signature")
+    ]
+    return origin, destination, weight, priority, *flags
+
+
+@lru_cache(maxsize=QUOTE_CACHE_SIZE)
+def _quote(generation, origin, destination, weight, priority, fragile, signature):
+    # `generation` is only part of the key: each rebuilt table starts a fresh set of entries
+    table = tariff_table.get()
+    origin_id = table.location_ids.get(origin)
+    destination_id = table.location_ids.get(destination)
+    if origin_id is None or destination_id is None:
+        return None
+    fees, extras, priced = table.price(
+        [origin_id], [destination_id], [float(weight)], [priority], [fragile], [signature],
+    )
+    if not priced[0]:
+        return None
+    delivery_fee, extra = _money(fees[0]), _money(extras[0])
+    return {
+        "origin": origin,
+        "destination": destination,
+        "weight": str(weight),
+        "priority": priority,
+        "fragile": fragile,
+        "requires_signature": signature,
+        "delivery_fee": str(delivery_fee),
+        "extra_charges": str(extra),
+        "total": str(delivery_fee + extra),
+    }
+
+
+def get_quote(params):
+    """Price one parcel from request parameters; None if no tariff covers it"""
+    key = normalise_quote(params)
+    table = tariff_table.get()
+    return _quote((table.version, table.built), *key)
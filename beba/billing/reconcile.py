@@ -0,0 +1,258 @@
+import csv
+import re
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from .ledger import OPEN_STATUSES, LedgerChanges
+from .models import Invoice, Payment, StatementImport
+
+STATEMENT_METHODS = ("mpesa", "mobile_money")
+DEFAULT_CHUNK_SIZE = 5000
+CENT = Decimal("0.01")
+# Payment.amount holds 10 digits, 2 of them decimals
+MAX_AMOUNT = Decimal(10) ** 8
+
+# Provider exports name their columns differently; headers are compared
+# lower-cased with everything but letters and digits removed
+COLUMN_ALIASES = {
+    "reference": ("receiptno", "receipt", "transactionid", "transid", "reference", "referencecode"),
+    "amount": ("paidin", "amount", "credit", "transamount"),
+    "account": ("accountno", "acno", "account", "billrefnumber", "billreference", "accountreference", "invoice", "invoicenumber"),
+    "details": ("details", "description", "narrative"),
+    "status": ("transactionstatus", "status"),
+}
+COMPLETED_STATUSES = {"", "completed", "success", "successful"}
+INVOICE_NUMBER = re.compile(r"\bINV-\d+\b", re.IGNORECASE)
+EXCEPTION_COLUMNS = ("line", "reason", "reference", "account", "amount", "details")
+
+
+class StatementError(ValueError):
+    """Raised for a statement file that cannot be reconciled at all"""
+
+
+def _key(header):
+    return re.sub(r"[^a-z0-9]", "", (header or "").lower())
+
+
+def _unreadable(reader, exc):
+    # The stream decodes ahead of the reader, so bad bytes can lie beyond the next line
+    if isinstance(exc, UnicodeDecodeError):
+        return StatementError(f"line {reader.line_num + 1} or later is not valid UTF-8: {exc}")
+    return StatementError(f"line {reader.line_num} is not valid CSV: {exc}")
+
+
+def read_statement(stream):
+    """
+    Check a CSV statement's header, then return an iterator of
+    (line_number, {reference, amount, account, details, status}) that
+    reads the file lazily. The header is line 1. A file that cannot be
+    decoded or parsed raises StatementError naming the line, possibly
+    after earlier lines have been read.
+    """
+    reader = csv.reader(stream)
+    try:
+        headers = [_key(header) for header in next(reader, [])]
+    except (UnicodeDecodeError, csv.Error) as exc:
+        raise _unreadable(reader, exc)
+    columns = {}
+    for name, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in headers:
+                columns[name] = headers.index(alias)
+                break
+    missing = {"reference", "amount"} - set(columns)
+    if missing:
+        raise StatementError(f"The statement has no {' or '.join(sorted(missing))} column")
+
+    def rows():
+        try:
+            for row in reader:
+                if not row:
+                    continue
+                yield reader.line_num, {
+                    name: row[index].strip() if index < len(row) else ""
+                    for name, index in columns.items()
+                }
+        except (UnicodeDecodeError, csv.Error) as exc:
+            raise _unreadable(reader, exc)
+    return rows()
+
+
+class ReconcileResult:
+    """Running totals for a statement import"""
+
+    def __init__(self, statement):
+        self.statement = statement
+        self.lines = 0
+        self.matched = 0
+        self.amount = Decimal("0.00")
+        self.skipped = 0  # withdrawals and failed transactions
+        self.unmatched = 0
+        self.overpaid = 0
+        self.invoices_paid = 0
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+
+    @property
+    def rate(self):
+        return self.lines / self.elapsed if self.elapsed else 0.0
+
+
+def _amount(value):
+    """The amount as a Decimal in cents, or None unless it fits Payment.amount"""
+    try:
+        amount = Decimal(value.replace(",", ""))
+        if not amount.is_finite():
+            return None
+        amount = amount.quantize(CENT)
+    except InvalidOperation:
+        return None
+    return amount if amount.copy_abs() < MAX_AMOUNT else None
+
+
+def open_invoice_index():
+    """invoice_number -> [invoice id, customer id, outstanding] for every open invoice"""
+    return {
+        number.upper(): [pk, customer_id, amount_due - amount_paid]
+        for number, pk, customer_id, amount_due, amount_paid in Invoice.objects.filter(
+            status__in=OPEN_STATUSES
+        ).values_list("invoice_number", "pk", "customer_id", "amount_due", "amount_paid").iterator(chunk_size=DEFAULT_CHUNK_SIZE)
+    }
+
+
+def known_references(method):
+    return set(
+        Payment.objects.filter(method=method).exclude(reference_code="")
+        .values_list("reference_code", flat=True).iterator(chunk_size=DEFAULT_CHUNK_SIZE)
+    )
+
+
+def _save_chunk(statement, payments, result):
+    """
+    Write a chunk of payments and apply them to their invoices with two
+    UPDATEs: amount_paid grows by the chunk's payments (a correlated
+    subquery), then invoices now covered are marked paid. The customers'
+    ledgers move in the same transaction.
+    """
+    if not payments:
+        return
+    with transaction.atomic():
+        payments = Payment.objects.bulk_create(payments)
+        invoice_ids = {payment.invoice_id for payment in payments}
+        chunk_paid = (
+            Payment.objects.filter(statement=statement, pk__gte=min(payment.pk for payment in payments), invoice=OuterRef("pk"))
+            .values("invoice")
+            .annotate(total=Sum("amount"))
+            .values("total")
+        )
+        Invoice.objects.filter(pk__in=invoice_ids).update(amount_paid=F("amount_paid") + Subquery(chunk_paid))
+        settled = list(
+            Invoice.objects.filter(pk__in=invoice_ids, status__in=OPEN_STATUSES, amount_paid__gte=F("amount_due"))
+            .select_for_update().values_list("pk", "customer_id", "amount_due", "status")
+        )
+        result.invoices_paid += Invoice.objects.filter(pk__in=[row[0] for row in settled]).update(status="paid")
+
+        ledger = LedgerChanges()
+        for payment in payments:
+            ledger.payment_recorded(payment)
+        for pk, customer_id, amount_due, status in settled:
+            ledger.invoice(customer_id, amount_due, status, sign=-1)
+            ledger.invoice(customer_id, amount_due, "paid")
+        ledger.apply()
+        statement.lines = result.lines
+        statement.matched = result.matched
+        statement.unmatched = result.unmatched
+        statement.amount_matched = result.amount
+        statement.save(update_fields=["lines", "matched", "unmatched", "amount_matched"])
+
+
+def reconcile_statement(rows, method="mpesa", file_name="", exceptions=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Turn statement credits into Payments against open invoices.
+
+    `rows` yields (line_number, row) pairs from read_statement(). A line
+    matches the open invoice named in its account column (or, failing
+    that, in its details) unless its reference code was already recorded.
+    Open invoices and known references are loaded into dictionaries up
+    front, so matching is a single pass with no queries; payments are
+    written `chunk_size` at a time, each chunk in its own transaction.
+    Lines that do not match are written to `exceptions` (a csv.writer)
+    when given. Rerunning a statement only reports its lines as duplicates.
+    """
+    if method not in STATEMENT_METHODS:
+        raise StatementError(f"Statements can only be imported for {', '.join(STATEMENT_METHODS)}")
+    statement = StatementImport.objects.create(file_name=file_name[:255], method=method)
+    result = ReconcileResult(statement)
+    invoices = open_invoice_index()
+    references = known_references(method)
+    if exceptions is not None:
+        exceptions.writerow(EXCEPTION_COLUMNS)
+
+    def reject(line, row, reason):
+        result.unmatched += 1
+        if exceptions is not None:
+            exceptions.writerow([line, reason, row["reference"], row.get("account", ""), row["amount"], row.get("details", "")])
+
+    chunk = []
+    for line, row in rows:
+        result.lines += 1
+        if row.get("status", "").lower() not in COMPLETED_STATUSES:
+            result.skipped += 1
+            continue
+        amount = _amount(row["amount"]) if row["amount"] else Decimal("0.00")
+        if amount is None:
+            reject(line, row, f"amount is not a number: {row['amount']!r}")
+            continue
+        if amount <= 0:
+            result.skipped += 1
+            continue
+        reference = row["reference"][:50]
+        if not reference:
+            reject(line, row, "no reference code")
+            continue
+        if reference in references:
+            reject(line, row, "reference code already recorded")
+            continue
+
+        number = row.get("account", "").upper()
+        invoice = invoices.get(number)
+        if invoice is None:
+            found = INVOICE_NUMBER.search(row.get("details", ""))
+            invoice = invoices.get(found.group().upper()) if found else None
+        if invoice is None:
+            reject(line, row, f"no open invoice {number!r}" if number else "no invoice number")
+            continue
+        invoice_id, customer_id, outstanding = invoice
+        if outstanding <= 0:
+            reject(line, row, "invoice already settled by an earlier line")
+            continue
+
+        references.add(reference)
+        invoice[2] = outstanding - amount
+        if invoice[2] < 0:
+            result.overpaid += 1
+        result.matched += 1
+        result.amount += amount
+        chunk.append(Payment(
+            invoice_id=invoice_id,
+            customer_id=customer_id,
+            amount=amount,
+            method=method,
+            reference_code=reference,
+            statement=statement,
+        ))
+        if len(chunk) >= chunk_size:
+            _save_chunk(statement, chunk, result)
+            chunk = []
+
+    _save_chunk(statement, chunk, result)
+    statement.lines = result.lines
+    statement.unmatched = result.unmatched
+    statement.finished_at = timezone.now()
+    statement.save(update_fields=["lines", "unmatched", "finished_at"])
+    result.elapsed = time.monotonic() - result.started
+    return result
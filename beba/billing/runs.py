@@ -0,0 +1,223 @@
+import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from orders.models import Order
+from parcels.models import Parcel
+from parcels.sequences import reserve_in_transaction
+from .ledger import LedgerChanges
+from .models import BillingRun, Invoice, InvoiceLine
+
+INVOICE_SEQUENCE = "invoice"
+PAYMENT_TERMS_DAYS = getattr(settings, "BILLING_PAYMENT_TERMS_DAYS", 30)
+STREAM_CHUNK_SIZE = 5000
+# Invoices are written once this many lines (or customers) are waiting
+FLUSH_LINES = 20_000
+FLUSH_CUSTOMERS = 500
+LINE_BATCH_SIZE = 5000
+
+
+class BillingRunError(Exception):
+    """Raised when a billing run cannot be started"""
+
+
+def format_invoice_number(value):
+    return f"INV-{value:09d}"
+
+
+def month_bounds(day):
+    """(first day of the month, first day of the next month) for any date in it"""
+    start = day.replace(day=1)
+    end = (start + datetime.timedelta(days=32)).replace(day=1)
+    return start, end
+
+
+def _period_filter(prefix, start, end):
+    tz = timezone.get_current_timezone()
+    return {
+        f"{prefix}__gte": datetime.datetime.combine(start, datetime.time.min, tzinfo=tz),
+        f"{prefix}__lt": datetime.datetime.combine(end, datetime.time.min, tzinfo=tz),
+    }
+
+
+def billable_parcels(start, end, after_customer=0):
+    """Business customers' parcels sent in the period and not billed yet, in customer order"""
+    return (
+        Parcel.objects.filter(
+            sender_customer__customer_type="business",
+            sender_customer_id__gt=after_customer,
+            **_period_filter("created_at", start, end),
+        )
+        .exclude(status="cancelled")
+        .exclude(Exists(InvoiceLine.objects.filter(parcel=OuterRef("pk"))))
+        .exclude(Exists(Invoice.objects.filter(parcel=OuterRef("pk"))))
+        .order_by("sender_customer_id", "pk")
+        .values_list("sender_customer_id", "pk", "tracking_number", "delivery_fee", "extra_charges")
+    )
+
+
+def billable_orders(start, end, after_customer=0):
+    """Business customers' order-level charges in the period not billed yet, in customer order"""
+    return (
+        Order.objects.filter(
+            customer__customer_type="business",
+            customer_id__gt=after_customer,
+            **_period_filter("created_at", start, end),
+        )
+        .exclude(status="cancelled")
+        .exclude(delivery_fee=0, extra_charges=0)
+        .exclude(Exists(InvoiceLine.objects.filter(order=OuterRef("pk"))))
+        .exclude(Exists(Invoice.objects.filter(order=OuterRef("pk"))))
+        .order_by("customer_id", "pk")
+        .values_list("customer_id", "pk", "order_number", "delivery_fee", "extra_charges")
+    )
+
+
+def _grouped(rows):
+    """Yield (customer_id, [rows]) from rows sorted by customer id"""
+    customer_id, group = None, []
+    for row in rows:
+        if row[0] != customer_id:
+            if group:
+                yield customer_id, group
+            customer_id, group = row[0], []
+        group.append(row)
+    if group:
+        yield customer_id, group
+
+
+def _customers(parcels, orders):
+    """Merge the two customer-ordered streams into (customer_id, parcel_rows, order_rows)"""
+    parcels, orders = _grouped(parcels), _grouped(orders)
+    next_parcels, next_orders = next(parcels, None), next(orders, None)
+    while next_parcels or next_orders:
+        parcel_customer = next_parcels[0] if next_parcels else None
+        order_customer = next_orders[0] if next_orders else None
+        customer_id = min(c for c in (parcel_customer, order_customer) if c is not None)
+        parcel_rows = order_rows = []
+        if parcel_customer == customer_id:
+            parcel_rows = next_parcels[1]
+            next_parcels = next(parcels, None)
+        if order_customer == customer_id:
+            order_rows = next_orders[1]
+            next_orders = next(orders, None)
+        yield customer_id, parcel_rows, order_rows
+
+
+class _Batch:
+    """Invoices waiting to be written, with their lines as plain tuples"""
+
+    def __init__(self):
+        self.invoices = []  # [(customer_id, total, [(parcel_id, order_id, description, amount)])]
+        self.line_count = 0
+        self.last_customer_id = None
+
+    def add(self, customer_id, lines):
+        total = sum((amount for parcel_id, order_id, description, amount in lines), Decimal("0.00"))
+        self.invoices.append((customer_id, total, lines))
+        self.line_count += len(lines)
+        self.last_customer_id = customer_id
+
+    def due(self):
+        return self.line_count >= FLUSH_LINES or len(self.invoices) >= FLUSH_CUSTOMERS
+
+
+def _flush(run, batch, issue_date):
+    """Write a batch and move the run's resume point past it, atomically"""
+    if not batch.invoices:
+        return
+    with transaction.atomic():
+        # Numbers are reserved in this transaction, so a failed batch leaves no gap
+        numbers = reserve_in_transaction(INVOICE_SEQUENCE, len(batch.invoices))
+        due_date = issue_date + datetime.timedelta(days=PAYMENT_TERMS_DAYS)
+        invoices = Invoice.objects.bulk_create([
+            Invoice(
+                invoice_number=format_invoice_number(number),
+                customer_id=customer_id,
+                amount_due=total,
+                issue_date=issue_date,
+                due_date=due_date,
+                billing_run=run,
+                notes=f"Consolidated invoice for {run.period_start:%B %Y}",
+            )
+            for number, (customer_id, total, lines) in zip(numbers, batch.invoices)
+        ])
+        InvoiceLine.objects.bulk_create(
+            (
+                InvoiceLine(invoice=invoice, parcel_id=parcel_id, order_id=order_id, description=description, amount=amount)
+                for invoice, (customer_id, total, lines) in zip(invoices, batch.invoices)
+                for parcel_id, order_id, description, amount in lines
+            ),
+            batch_size=LINE_BATCH_SIZE,
+        )
+        ledger = LedgerChanges()
+        for customer_id, total, lines in batch.invoices:
+            ledger.invoice(customer_id, total, "unpaid")
+        ledger.apply()
+        run.last_customer_id = batch.last_customer_id
+        run.invoices_created += len(invoices)
+        run.lines_created += batch.line_count
+        run.amount_billed += sum(total for customer_id, total, lines in batch.invoices)
+        run.save(update_fields=["last_customer_id", "invoices_created", "lines_created", "amount_billed"])
+
+
+def run_billing(period_start, period_end=None, progress=None):
+    """
+    Create one consolidated invoice per business customer for the period
+    (default: the month of `period_start`).
+
+    Parcels and orders are streamed in customer order and grouped in a
+    single pass; invoices and their lines are bulk-created a batch of
+    customers at a time, each batch in its own transaction together with
+    the run's resume point. Calling it again for the same period after an
+    interruption carries on after the last committed customer. `progress`,
+    if given, is called with the run after every batch.
+    """
+    if period_end is None:
+        period_start, period_end = month_bounds(period_start)
+    if period_end <= period_start:
+        raise BillingRunError("The billing period must end after it starts.")
+
+    run, created = BillingRun.objects.get_or_create(period_start=period_start, period_end=period_end)
+    if run.status == "completed":
+        return run
+    run.status = "running"
+    run.finished_at = None
+    run.save(update_fields=["status", "finished_at"])
+
+    issue_date = timezone.now()
+    parcels = billable_parcels(period_start, period_end, run.last_customer_id).iterator(chunk_size=STREAM_CHUNK_SIZE)
+    orders = billable_orders(period_start, period_end, run.last_customer_id).iterator(chunk_size=STREAM_CHUNK_SIZE)
+    batch = _Batch()
+    try:
+        for customer_id, parcel_rows, order_rows in _customers(parcels, orders):
+            lines = [
+                (pk, None, f"Parcel {tracking_number}", delivery_fee + extra_charges)
+                for customer, pk, tracking_number, delivery_fee, extra_charges in parcel_rows
+            ]
+            lines.extend(
+                (None, pk, f"Order {order_number} charges", delivery_fee + extra_charges)
+                for customer, pk, order_number, delivery_fee, extra_charges in order_rows
+            )
+            batch.add(customer_id, lines)
+            if batch.due():
+                _flush(run, batch, issue_date)
+                batch = _Batch()
+                if progress:
+                    progress(run)
+        _flush(run, batch, issue_date)
+    except BaseException:
+        run.status = "failed"
+        run.save(update_fields=["status"])
+        raise
+
+    run.status = "completed"
+    run.finished_at = timezone.now()
+    run.save(update_fields=["status", "finished_at"])
+    if progress:
+        progress(run)
+    return run
@@ -0,0 +1,118 @@
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from locations.signals import LOCATION_MODELS
+from .ledger import LedgerChanges
+from .models import Invoice, Payment, Refund, Surcharge, Tariff
+from .pricing import tariff_table
+
+# Fields of each model that the customer ledger depends on
+LEDGER_FIELDS = {
+    Invoice: {"customer", "customer_id", "amount_due", "status"},
+    Payment: {"customer", "customer_id", "amount"},
+    Refund: {"customer", "customer_id", "payment", "payment_id", "amount"},
+}
+UNCHANGED = object()
+
+# The ledger receivers run in the transaction that saves or deletes the
+# row: LedgerEntry.save() opens one around the save and its signals, and
+# Django's delete collector already does for deletes.
+
+
+def price_list_changed(sender, instance, **kwargs):
+    transaction.on_commit(tariff_table.invalidate)
+
+
+# Locations matter too: their region decides the tariff zone
+for model in (Tariff, Surcharge, *LOCATION_MODELS):
+    post_save.connect(price_list_changed, sender=model)
+    post_delete.connect(price_list_changed, sender=model)
+
+
+def _refund_customer(customer_id, payment_id):
+    if customer_id is None and payment_id is not None:
+        customer_id = Payment.objects.filter(pk=payment_id).values_list("customer_id", flat=True).first()
+    return customer_id
+
+
+def _ledger_entry(instance):
+    """What a row contributes to its customer's ledger: (customer_id, amount[, status])"""
+    if isinstance(instance, Invoice):
+        return instance.customer_id, instance.amount_due, instance.status
+    if isinstance(instance, Payment):
+        return instance.customer_id, instance.amount
+    return _refund_customer(instance.customer_id, instance.payment_id), instance.amount
+
+
+def _stored_entry(sender, pk):
+    if sender is Invoice:
+        return Invoice.objects.filter(pk=pk).values_list("customer_id", "amount_due", "status").first()
+    if sender is Payment:
+        return Payment.objects.filter(pk=pk).values_list("customer_id", "amount").first()
+    row = Refund.objects.filter(pk=pk).values_list("customer_id", "payment_id", "amount").first()
+    return row and (_refund_customer(row[0], row[1]), row[2])
+
+
+def _add(changes, sender, entry, sign):
+    if sender is Invoice:
+        changes.invoice(*entry, sign=sign)
+    elif sender is Payment:
+        changes.payment(*entry, sign=sign)
+    else:
+        changes.refund(*entry, sign=sign)
+
+
+def remember_ledger_entry(sender, instance, raw, update_fields, **kwargs):
+    if raw:
+        return
+    if instance._state.adding:
+        instance._ledger_before = None
+    elif update_fields is not None and not LEDGER_FIELDS[sender] & set(update_fields):
+        instance._ledger_before = UNCHANGED
+    else:
+        instance._ledger_before = _stored_entry(sender, instance.pk)
+
+
+def update_ledger(sender, instance, created, raw, **kwargs):
+    """Bring the customer ledger in line with a saved invoice, payment or refund"""
+    if raw:
+        return
+    before = getattr(instance, "_ledger_before", None)
+    instance._ledger_before = UNCHANGED
+    if before is UNCHANGED:
+        return
+    changes = LedgerChanges()
+    if before is not None:
+        _add(changes, sender, before, -1)
+    if sender is Payment and created:
+        changes.payment_recorded(instance)
+    else:
+        _add(changes, sender, _ledger_entry(instance), 1)
+    if sender is Payment and before is not None:
+        changes.stale_last_payments.update(customer_id for customer_id in (before[0], instance.customer_id) if customer_id)
+        if before[0] != instance.customer_id:
+            # Refunds without a customer of their own follow their payment
+            refunded = Refund.objects.filter(payment=instance, customer__isnull=True).aggregate(total=Sum("amount"))["total"]
+            if refunded:
+                changes.refund(before[0], refunded, sign=-1)
+                changes.refund(instance.customer_id, refunded)
+    with transaction.atomic(savepoint=False):
+        changes.apply()
+
+
+def remove_from_ledger(sender, instance, **kwargs):
+    changes = LedgerChanges()
+    _add(changes, sender, _ledger_entry(instance), -1)
+    if sender is Payment and instance.customer_id:
+        changes.stale_last_payments.add(instance.customer_id)
+    with transaction.atomic(savepoint=False):
+        changes.apply()
+
+
+# Connected per sender: a receiver for every model would stop Django from
+# deleting any other model's rows with a plain DELETE
+for model in LEDGER_FIELDS:
+    pre_save.connect(remember_ledger_entry, sender=model)
+    post_save.connect(update_ledger, sender=model)
+    post_delete.connect(remove_from_ledger, sender=model)
@@ -1,3 +1,303 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import os
+import tempfile
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.db.transaction import TransactionManagementError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from customers.models import Customer
+from locations.models import Location
+from parcels.models import Parcel
+from .ledger import EMPTY_LEDGER, LEDGER_COLUMNS, LedgerChanges, fresh_ledgers, rebuild_ledgers
+from .models import BillingRun, CustomerLedger, Invoice, InvoiceLine, OverdueNotice, Payment, Refund, Tariff
+from .overdue import sweep_overdue
+from .pricing import QuoteError, get_quote, normalise_quote, tariff_table
+from .reconcile import StatementError, read_statement, reconcile_statement
+from .runs import run_billing
+
+
+def make_invoice(customer, number, amount="100.00", **fields):
+    fields.setdefault("due_date", timezone.now() + datetime.timedelta(days=30))
+    return Invoice.objects.create(invoice_number=number, customer=customer, amount_due=Decimal(amount), **fields)
+
+
+def stored_ledger(customer):
+    ledger = CustomerLedger.objects.filter(customer=customer).values_list(*LEDGER_COLUMNS).first()
+    return tuple(ledger) if ledger else EMPTY_LEDGER
+
+
+class QuoteInputTests(SimpleTestCase):
+    def quote(self, **params):
+        return normalise_quote({"origin": "nbo", "destination": "msa", **params})
+
+    def test_normalises_equivalent_requests(self):
+        self.assertEqual(
+            self.quote(weight="2.5", priority=" Express ", fragile="yes"),
+            ("NBO", "MSA", Decimal("2.50"), "express", True, False),
+        )
+
+    def test_rejects_weights_that_are_not_finite_numbers(self):
+        for weight in ("NaN", "sNaN", "inf", "-Infinity", "abc", ""):
+            with self.subTest(weight=weight), self.assertRaisesMessage(QuoteError, "weight must be a number"):
+                self.quote(weight=weight)
+
+    def test_rejects_weights_out_of_range(self):
+        for weight in ("0", "-1", "1000.01", "1e6", "1e999999"):
+            with self.subTest(weight=weight), self.assertRaises(QuoteError):
+                self.quote(weight=weight)
+
+    def test_rejects_unknown_priority(self):
+        with self.assertRaisesMessage(QuoteError, "priority must be one of"):
+            self.quote(weight="1", priority="rocket")
+
+
+class QuoteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Location.objects.bulk_create([
+            Location(name="Nairobi", location_tag="NBO", location_type="pickup_station", address="-", city="Nairobi"),
+            Location(name="Mombasa", location_tag="MSA", location_type="pickup_station", address="-", city="Mombasa"),
+            Location(name="Kisumu", location_tag="Ksm-2", location_type="pickup_station", address="-", city="Kisumu"),
+        ])
+        cls.tariff = Tariff.objects.create(base_fee=Decimal("200"), per_kg_fee=Decimal("10"))
+
+    def setUp(self):
+        tariff_table.invalidate()
+
+    def test_prices_a_covered_route(self):
+        quote = get_quote({"origin": "NBO", "destination": "MSA", "weight": "3"})
+        self.assertEqual(quote["delivery_fee"], "230.00")
+        self.assertEqual(quote["total"], "230.00")
+
+    def test_matches_location_tags_in_any_case(self):
+        for origin, destination in (("nbo", "Ksm-2"), ("NBO", "KSM-2"), ("Nbo", "ksm-2")):
+            with self.subTest(origin=origin, destination=destination):
+                quote = get_quote({"origin": origin, "destination": destination, "weight": "3"})
+                self.assertEqual((quote["origin"], quote["destination"], quote["total"]), ("NBO", "KSM-2", "230.00"))
+
+    def test_tariff_changes_reach_the_next_quote(self):
+        get_quote({"origin": "NBO", "destination": "MSA", "weight": "3"})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tariff.base_fee = Decimal("300")
+            self.tariff.save()
+        self.assertEqual(get_quote({"origin": "NBO", "destination": "MSA", "weight": "3"})["delivery_fee"], "330.00")
+
+    def test_view_answers_bad_input_with_400(self):
+        for weight in ("NaN", "1e999999"):
+            with self.subTest(weight=weight):
+                response = self.client.get(reverse("billing:quote"), {"origin": "NBO", "destination": "MSA", "weight": weight})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("error", response.json())
+
+    def test_view_answers_unknown_route_with_404(self):
+        response = self.client.get(reverse("billing:quote"), {"origin": "NBO", "destination": "XXX", "weight": "1"})
+        self.assertEqual(response.status_code, 404)
+
+
+class ReconcileTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(name="Duka Ltd", customer_type="business")
+        cls.first = make_invoice(cls.customer, "INV-000000001", "100.00")
+        cls.second = make_invoice(cls.customer, "INV-000000002", "250.00")
+
+    def reconcile(self, text):
+        exceptions = io.StringIO()
+        result = reconcile_statement(read_statement(io.StringIO(text)), exceptions=csv.writer(exceptions))
+        return result, list(csv.reader(io.StringIO(exceptions.getvalue())))[1:]
+
+    STATEMENT = (
+        "Receipt No.,Paid In,A/C No.,Details,Transaction Status\n"
+        "QA1,100.00,INV-000000001,,Completed\n"
+        "QA2,NaN,INV-000000002,,Completed\n"
+        "QA3,100000000,INV-000000002,,Completed\n"
+        "QA4,1e999999999,INV-000000002,,Completed\n"
+        "QA5,\"1,000.00\",,Payment for inv-000000002,Completed\n"
+        "QA6,50.00,INV-999999999,,Completed\n"
+        "QA7,-20.00,INV-000000002,,Completed\n"
+        "QA8,20.00,INV-000000002,,Failed\n"
+    )
+
+    def test_matches_lines_and_reports_the_rest(self):
+        result, exceptions = self.reconcile(self.STATEMENT)
+        self.assertEqual((result.lines, result.matched, result.skipped), (8, 2, 2))
+        self.assertEqual(result.amount, Decimal("1100.00"))
+        self.assertEqual(result.invoices_paid, 2)
+        self.assertEqual(result.overpaid, 1)
+        self.assertEqual([row[2] for row in exceptions], ["QA2", "QA3", "QA4", "QA6"])
+        self.assertTrue(all("not a number" in row[1] for row in exceptions[:3]))
+
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual((self.first.status, self.first.amount_paid), ("paid", Decimal("100.00")))
+        self.assertEqual((self.second.status, self.second.amount_paid), ("paid", Decimal("1000.00")))
+        self.assertEqual(stored_ledger(self.customer), fresh_ledgers()[self.customer.pk])
+
+    def test_rerunning_a_statement_records_nothing_twice(self):
+        self.reconcile(self.STATEMENT)
+        payments = Payment.objects.count()
+        result, exceptions = self.reconcile(self.STATEMENT)
+        self.assertEqual(result.matched, 0)
+        self.assertEqual(Payment.objects.count(), payments)
+        self.assertEqual(
+            [row[2] for row in exceptions if row[1] == "reference code already recorded"], ["QA1", "QA5"]
+        )
+
+    def test_command_names_the_file_and_line_it_cannot_read(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "statement.csv")
+        with open(path, "wb") as handle:
+            handle.write(b"Receipt No.,Paid In,A/C No.\nQA1,100.00,INV-000000001\nQA2,\xff,INV-000000002\n")
+        with self.assertRaisesMessage(CommandError, f"{path}: line 1 or later is not valid UTF-8"):
+            call_command("reconcile_statement", path, stdout=io.StringIO(), stderr=io.StringIO())
+
+        with open(path, "w") as handle:
+            handle.write(f"Receipt No.,Paid In,A/C No.\nQA1,100.00,INV-000000001\nQA2,{'9' * 200_000}\n")
+        with self.assertRaisesMessage(CommandError, f"{path}: line 3 is not valid CSV"):
+            call_command("reconcile_statement", path, stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual(rebuild_ledgers(), [])
+
+    def test_rejects_a_statement_without_amounts(self):
+        with self.assertRaisesMessage(StatementError, "amount"):
+            read_statement(io.StringIO("Receipt No.,Details\nQA1,x\n"))
+
+
+class BillingRunTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customers = Customer.objects.bulk_create([
+            Customer(name=f"Business {i}", customer_type="business") for i in range(3)
+        ])
+        Customer.objects.create(name="Walk-in", customer_type="individual")
+        cls.parcels = Parcel.objects.bulk_create([
+            Parcel(tracking_number=f"RUN-{i}", sender_customer=customer, weight=Decimal("1"),
+                   delivery_fee=Decimal("150.00"), extra_charges=Decimal("10.00"))
+            for i, customer in enumerate(cls.customers * 2)
+        ])
+
+    def test_resumes_after_the_last_committed_customer(self):
+        today = timezone.now().date()
+
+        def interrupt(run):
+            raise KeyboardInterrupt
+
+        with mock.patch("billing.runs.FLUSH_CUSTOMERS", 1), self.assertRaises(KeyboardInterrupt):
+            run_billing(today, progress=interrupt)
+        run = BillingRun.objects.get()
+        self.assertEqual((run.status, run.invoices_created), ("failed", 1))
+
+        with mock.patch("billing.runs.FLUSH_CUSTOMERS", 1):
+            run = run_billing(today)
+        self.assertEqual((run.status, run.invoices_created, run.lines_created), ("completed", 3, 6))
+        self.assertEqual(run.amount_billed, Decimal("960.00"))
+        self.assertEqual(
+            sorted(Invoice.objects.values_list("customer_id", flat=True)),
+            sorted(customer.pk for customer in self.customers),
+        )
+        self.assertEqual(InvoiceLine.objects.filter(parcel__in=self.parcels).count(), len(self.parcels))
+        self.assertEqual(rebuild_ledgers(), [])
+
+    def test_completed_run_is_not_repeated(self):
+        today = timezone.now().date()
+        run_billing(today)
+        run_billing(today)
+        self.assertEqual(Invoice.objects.count(), 3)
+
+
+class OverdueSweepTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = Customer.objects.create(name="Alice")
+        cls.bob = Customer.objects.create(name="Bob")
+
+    def test_overdue_sweep_leaves_ledgers_alone(self):
+        past = timezone.now() - datetime.timedelta(days=3)
+        make_invoice(self.alice, "INV-L4", "60.00", due_date=past)
+        make_invoice(self.alice, "INV-L5", "40.00", due_date=past)
+        make_invoice(self.bob, "INV-L6", "10.00")
+        result = sweep_overdue(chunk_size=1)
+        self.assertEqual((result.flipped, result.notices), (2, 1))
+        self.assertEqual(Invoice.objects.filter(status="overdue").count(), 2)
+        notice = OverdueNotice.objects.get()
+        self.assertEqual((notice.customer_id, notice.total_overdue), (self.alice.pk, Decimal("100.00")))
+        self.assertEqual(sweep_overdue().notices, 0)
+        self.assertEqual(rebuild_ledgers(), [])
+
+    def test_rejects_chunks_smaller_than_one(self):
+        for chunk_size in (0, -1):
+            with self.subTest(chunk_size=chunk_size):
+                with self.assertRaisesMessage(ValueError, "at least 1"):
+                    sweep_overdue(chunk_size=chunk_size)
+                with self.assertRaisesMessage(CommandError, "--chunk-size"):
+                    call_command("sweep_overdue_invoices", chunk_size=chunk_size, stdout=io.StringIO())
+
+
+class LedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = Customer.objects.create(name="Alice")
+        cls.bob = Customer.objects.create(name="Bob")
+
+    def test_signals_keep_ledgers_equal_to_a_fresh_aggregate(self):
+        invoice = make_invoice(self.alice, "INV-L1", "300.00")
+        other = make_invoice(self.alice, "INV-L2", "80.00")
+        payment = Payment.objects.create(invoice=invoice, customer=self.alice, amount=Decimal("120.00"), method="mpesa")
+        Refund.objects.create(payment=payment, amount=Decimal("20.00"))
+
+        invoice.amount_due = Decimal("350.00")
+        invoice.save()
+        other.status = "cancelled"
+        other.save(update_fields=["status"])
+        payment.customer = self.bob
+        payment.save()
+
+        self.assertEqual(rebuild_ledgers(), [])
+        alice = CustomerLedger.objects.get(customer=self.alice)
+        self.assertEqual((alice.total_invoiced, alice.open_invoices, alice.total_paid), (Decimal("350.00"), 1, 0))
+        bob = CustomerLedger.objects.get(customer=self.bob)
+        self.assertEqual((bob.total_paid, bob.total_refunded, bob.last_payment_amount), (Decimal("120.00"), Decimal("20.00"), Decimal("120.00")))
+
+        payment.delete()
+        self.assertEqual(rebuild_ledgers(), [])
+        self.assertIsNone(CustomerLedger.objects.get(customer=self.bob).last_payment_at)
+
+    def test_rebuild_repairs_drift(self):
+        make_invoice(self.alice, "INV-L3", "40.00")
+        CustomerLedger.objects.filter(customer=self.alice).update(total_invoiced=0)
+        mismatches = rebuild_ledgers(save=True)
+        self.assertEqual([customer_id for customer_id, before, after in mismatches], [self.alice.pk])
+        self.assertEqual(rebuild_ledgers(), [])
+
+
+class LedgerTransactionTests(TransactionTestCase):
+    def test_apply_requires_the_callers_transaction(self):
+        customer = Customer.objects.create(name="Carol")
+        changes = LedgerChanges()
+        changes.invoice(customer.pk, Decimal("10.00"), "unpaid")
+        with self.assertRaises(TransactionManagementError):
+            changes.apply()
+        with transaction.atomic():
+            changes.apply()
+        self.assertEqual(CustomerLedger.objects.get(customer=customer).open_invoices, 1)
+
+    def test_autocommit_saves_still_reach_the_ledger(self):
+        customer = Customer.objects.create(name="Dan")
+        make_invoice(customer, "INV-T1", "75.00")
+        self.assertEqual(stored_ledger(customer), fresh_ledgers()[customer.pk])
+
+    def test_autocommit_saves_commit_with_their_ledger_change(self):
+        customer = Customer.objects.create(name="Eve")
+        with mock.patch("billing.signals.LedgerChanges.apply", side_effect=RuntimeError("ledger write failed")):
+            with self.assertRaises(RuntimeError):
+                make_invoice(customer, "INV-T2", "75.00")
+        self.assertFalse(Invoice.objects.filter(invoice_number="INV-T2").exists())
+        self.assertEqual(stored_ledger(customer), EMPTY_LEDGER)
@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views
+
+app_name = "billing"
+
+urlpatterns = [
+    path('quote.json', views.quote_lookup, name='quote'),
+]
@@ -1,3 +1,24 @@
-from django.shortcuts import render
+from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_GET
 
-# Create your views here.
+from .pricing import QuoteError, get_quote
+
+QUOTE_MAX_AGE = 300  # seconds browsers and proxies may reuse a quote
+
+
+@require_GET
+def quote_lookup(request):
+    """
+    Public JSON quote:
+    GET ?origin=<tag>&destination=<tag>&weight=<kg>[&priority=][&fragile=1][&signature=1]
+    """
+    try:
+        quote = get_quote(request.GET)
+    except QuoteError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+    if quote is None:
+        return JsonResponse({"error": "We do not have a price for that route and weight yet."}, status=404)
+    response = JsonResponse(quote)
+    patch_cache_control(response, public=True, max_age=QUOTE_MAX_AGE)
+    return response
@@ -1,3 +1,28 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import RequestFactory, TestCase
+
+from billing.models import CustomerLedger
+from .models import Customer
+from .views import CustomerProfileView
+
+
+class CustomerProfileTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("wanjiru")
+        cls.customer = Customer.objects.create(name="Wanjiru", user_account=cls.user)
+        Customer.objects.create(name="Someone else", user_account=User.objects.create_user("other"))
+        CustomerLedger.objects.create(customer=cls.customer, total_invoiced=Decimal("500.00"), open_invoices=1)
+
+    def test_loads_the_users_own_profile_with_its_ledger(self):
+        request = RequestFactory().get("/customers/profile/")
+        request.user = self.user
+        view = CustomerProfileView()
+        view.setup(request)
+        with self.assertNumQueries(1):
+            customer = view.get_object()
+            self.assertEqual(customer.pk, self.customer.pk)
+            self.assertEqual(customer.ledger.total_invoiced, Decimal("500.00"))
+            self.assertEqual(customer.user_account.username, "wanjiru")
@@ -56,8 +56,8 @@ class CustomerProfileView(LoginRequiredMixin, UpdateView):
     success_url = reverse_lazy('customer_profile')
 
     def get_object(self, queryset=None):
-        # Ensure customers can only edit their own profile
-        return self.request.user.customer_profile
+        # Ensure customers can only edit their own profile; account and ledger come in the same query
+        return Customer.objects.select_related("ledger", "user_account").get(user_account=self.request.user)
 
     def form_valid(self, form):
         messages.success(self.request, "Your profile has been updated successfully.")
@@ -0,0 +1,319 @@
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+
+from .models import Location
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are not serialised across processes
+    fcntl = None
+
+EARTH_RADIUS_KM = 6371.0088
+# How often a process checks whether another process has rewritten the files
+RELOAD_INTERVAL = 1.0
+LOAD_ATTEMPTS = 5
+# Location saves are applied to the matrix in the background, this many seconds later
+UPDATE_DELAY = getattr(settings, "DISTANCE_MATRIX_UPDATE_DELAY", 2)
+
+MATRIX_FILE = "matrix.npy"  # float32 km, n x n
+COORDS_FILE = "coords.npy"  # float64 degrees, n x 2
+INDEX_FILE = "index.json"  # {"ids": [...], "tags": [...]}, in matrix order
+
+logger = logging.getLogger(__name__)
+
+
+def haversine_matrix(latitudes, longitudes, to_latitudes=None, to_longitudes=None):
+    """
+    Great-circle distances in km between points given in degrees: every
+    point against every other, or against the `to_` points if given.
+    """
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+    if to_latitudes is None:
+        to_lat, to_lon = lat, lon
+    else:
+        to_lat = np.radians(np.asarray(to_latitudes, dtype=np.float64))
+        to_lon = np.radians(np.asarray(to_longitudes, dtype=np.float64))
+    dlat = lat[:, None] - to_lat[None, :]
+    dlon = lon[:, None] - to_lon[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(to_lat)[None, :] * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def matrix_dir():
+    """Where the matrix files live: settings.DISTANCE_MATRIX_DIR, read on every call"""
+    return getattr(settings, "DISTANCE_MATRIX_DIR", settings.BASE_DIR / "var" / "distances")
+
+
+def _path(name):
+    return os.path.join(matrix_dir(), name)
+
+
+def routable_locations():
+    """(ids, tags, coords) of the active locations that have coordinates"""
+    rows = list(
+        Location.objects.filter(active=True, latitude__isnull=False, longitude__isnull=False)
+        .order_by("pk")
+        .values_list("pk", "location_tag", "latitude", "longitude")
+    )
+    ids = [row[0] for row in rows]
+    tags = [row[1] for row in rows]
+    coords = np.array([(float(row[2]), float(row[3])) for row in rows], dtype=np.float64).reshape(-1, 2)
+    return ids, tags, coords
+
+
+@contextmanager
+def _write_lock():
+    os.makedirs(matrix_dir(), exist_ok=True)
+    with open(_path(".lock"), "w") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def _replace(name, write):
+    """Write to a temporary file and rename it over `name`, so readers never see half a file"""
+    fd, temp_path = tempfile.mkstemp(dir=matrix_dir(), prefix=f".{name}.")
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            write(handle)
+        os.chmod(temp_path, 0o644)  # mkstemp creates 0600; workers may run as other users
+        os.replace(temp_path, _path(name))
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def _save(ids, tags, coords, matrix):
+    # The index is written last: readers reload when it changes
+    _replace(MATRIX_FILE, lambda handle: np.save(handle, matrix.astype(np.float32, copy=False)))
+    _replace(COORDS_FILE, lambda handle: np.save(handle, coords))
+    _replace(INDEX_FILE, lambda handle: handle.write(json.dumps({"ids": ids, "tags": tags}).encode()))
+
+
+def _load_for_update():
+    try:
+        with open(_path(INDEX_FILE), "rb") as handle:
+            index = json.load(handle)
+        return index["ids"], index["tags"], np.load(_path(COORDS_FILE)), np.load(_path(MATRIX_FILE))
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def rebuild_matrix():
+    """Recompute every pairwise distance from the database. Returns the location count."""
+    ids, tags, coords = routable_locations()
+    matrix = haversine_matrix(coords[:, 0], coords[:, 1])
+    with _write_lock():
+        _save(ids, tags, coords, matrix)
+    distance_matrix.reset()
+    return len(ids)
+
+
+def update_locations(location_ids):
+    """
+    Bring the stored matrix up to date for the given locations only: new or
+    moved ones get a fresh row and column (O(n) distances each), deactivated
+    or deleted ones are dropped. Falls back to a full rebuild if there is no
+    matrix on disk yet.
+    """
+    location_ids = set(location_ids)
+    current = {
+        pk: (tag, float(lat), float(lon))
+        for pk, tag, lat, lon in Location.objects.filter(
+            pk__in=location_ids, active=True, latitude__isnull=False, longitude__isnull=False
+        ).values_list("pk", "location_tag", "latitude", "longitude")
+    }
+    with _write_lock():
+        stored = _load_for_update()
+        if stored is None:
+            ids, tags, coords = routable_locations()
+            _save(ids, tags, coords, haversine_matrix(coords[:, 0], coords[:, 1]))
+            distance_matrix.reset()
+            return
+        ids, tags, coords, matrix = stored
+
+        keep = [i for i, pk in enumerate(ids) if pk not in location_ids or pk in current]
+        if len(keep) < len(ids):
+            ids = [ids[i] for i in keep]
+            tags = [tags[i] for i in keep]
+            coords = coords[keep]
+            matrix = matrix[np.ix_(keep, keep)]
+
+        position = {pk: i for i, pk in enumerate(ids)}
+        added = [pk for pk in current if pk not in position]
+        if added:
+            size = len(ids)
+            grown = np.zeros((size + len(added), size + len(added)), dtype=np.float32)
+            grown[:size, :size] = matrix
+            matrix = grown
+            coords = np.vstack([coords, np.zeros((len(added), 2))])
+            for pk in added:
+                position[pk] = len(ids)
+                ids.append(pk)
+                tags.append(None)
+
+        changed = []
+        for pk, (tag, lat, lon) in current.items():
+            i = position[pk]
+            tags[i] = tag
+            if pk in added or coords[i, 0] != lat or coords[i, 1] != lon:
+                coords[i] = (lat, lon)
+                changed.append(i)
+        if changed:
+            rows = haversine_matrix(coords[changed, 0], coords[changed, 1], coords[:, 0], coords[:, 1])
+            matrix[changed, :] = rows
+            matrix[:, changed] = rows.T
+        _save(ids, tags, coords, matrix)
+    distance_matrix.reset()
+
+
+class PendingUpdates:
+    """
+    Location ids waiting for update_locations(), so saves never touch the
+    matrix files inside the request. A timer applies them UPDATE_DELAY
+    seconds after the first one is queued, in one pass however many
+    locations changed meanwhile; whatever is left is applied on exit.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = set()
+        self._timer = None
+
+    def add(self, location_ids):
+        with self._lock:
+            self._ids.update(location_ids)
+            if self._ids and self._timer is None:
+                self._timer = threading.Timer(UPDATE_DELAY, self._apply_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def apply(self):
+        """
+        Bring the matrix up to date for the queued locations now. Returns
+        False if that failed; the error is logged and the locations stay
+        queued, so the next save (or exit) retries them.
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            location_ids, self._ids = self._ids, set()
+        if not location_ids:
+            return True
+        try:
+            update_locations(location_ids)
+        except Exception:
+            logger.exception("Could not update the distance matrix for locations %s", sorted(location_ids))
+            with self._lock:
+                self._ids.update(location_ids)
+            return False
+        return True
+
+    def _apply_from_timer(self):
+        try:
+            self.apply()
+        finally:
+            # The timer thread got its own connection; don't leave it open
+            connection.close()
+
+
+pending_updates = PendingUpdates()
+atexit.register(pending_updates.apply)
+
+
+class DistanceMatrix:
+    """
+    Read side: the matrix is memory-mapped, so every worker on the host
+    shares one copy in the page cache. Lookups are two dict hits and an
+    array index.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = (np.zeros((0, 0), dtype=np.float32), {})
+        self._stamp = None
+        self._checked = None
+
+    def reset(self):
+        with self._lock:
+            self._stamp = self._checked = None
+
+    def _index_stamp(self):
+        try:
+            stat = os.stat(_path(INDEX_FILE))
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _load(self):
+        # Retry if a writer replaced the files while we were reading them
+        for attempt in range(LOAD_ATTEMPTS):
+            stamp = self._index_stamp()
+            if stamp is None:
+                break
+            try:
+                with open(_path(INDEX_FILE), "rb") as handle:
+                    tags = json.load(handle)["tags"]
+                matrix = np.load(_path(MATRIX_FILE), mmap_mode="r")
+            except (OSError, ValueError):
+                matrix = None
+            if matrix is not None and len(matrix) == len(tags) and self._index_stamp() == stamp:
+                return stamp, (matrix, {tag: i for i, tag in enumerate(tags)})
+            time.sleep(0.01)
+        return None, (np.zeros((0, 0), dtype=np.float32), {})
+
+    def _current(self):
+        now = time.monotonic()
+        checked = self._checked
+        if checked is None or now - checked >= RELOAD_INTERVAL:
+            with self._lock:
+                stamp = self._index_stamp()
+                if self._checked is None or stamp != self._stamp:
+                    self._stamp, self._state = self._load()
+                self._checked = now
+        return self._state
+
+    def index(self, tag):
+        matrix, position = self._current()
+        return position.get(tag)
+
+    def __contains__(self, tag):
+        return self.index(tag) is not None
+
+    def distance(self, from_tag, to_tag):
+        """km between two locations by location_tag, or None if either is not in the matrix"""
+        matrix, position = self._current()
+        i = position.get(from_tag)
+        j = position.get(to_tag)
+        if i is None or j is None:
+            return None
+        return float(matrix[i, j])
+
+    def row(self, tag):
+        """Distances from `tag` to every location, in the order of tags()"""
+        matrix, position = self._current()
+        i = position.get(tag)
+        return None if i is None else matrix[i]
+
+    def tags(self):
+        matrix, position = self._current()
+        return list(position)
+
+
+distance_matrix = DistanceMatrix()
+
+
+def distance_between(from_tag, to_tag):
+    return distance_matrix.distance(from_tag, to_tag)
@@ -0,0 +1,116 @@
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import (
+    Count, DateTimeField, DurationField, ExpressionWrapper, F, FilteredRelation, Max, Min, Q, Value,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from parcels.models import Parcel
+from .models import Location, PickupStation
+
+STATION_INVENTORY_CACHE_KEY = "locations:station_inventory"
+STATION_INVENTORY_CACHE_TIMEOUT = getattr(settings, "STATION_INVENTORY_CACHE_TIMEOUT", 60)
+DEFAULT_MAX_STORAGE_DAYS = 7
+ONE_DAY = datetime.timedelta(days=1)
+
+# (label, min age in days, max age in days); ages are whole days since station_arrival_time
+AGING_BUCKETS = (
+    ("0-2", 0, 2),
+    ("3-5", 3, 5),
+    ("6-7", 6, 7),
+    (">7", 8, None),
+)
+
+
+def _storage_cutoff(now):
+    """Arrival time before which a parcel has outstayed its station's max_storage_days"""
+    max_days = Coalesce(F("pickupstation__max_storage_days"), Value(DEFAULT_MAX_STORAGE_DAYS))
+    return ExpressionWrapper(
+        Value(now) - ExpressionWrapper(max_days * Value(ONE_DAY), output_field=DurationField()),
+        output_field=DateTimeField(),
+    )
+
+
+def _bucket_filter(now, low, high):
+    condition = Q(waiting__station_arrival_time__lte=now - low * ONE_DAY)
+    if high is not None:
+        condition &= Q(waiting__station_arrival_time__gt=now - (high + 1) * ONE_DAY)
+    return condition
+
+
+def build_station_inventory(now=None):
+    """
+    Parcel counts per pickup station, split into aging buckets, in a single
+    grouped query. Stations with nothing waiting are included with zeros.
+    The status condition sits in the JOIN so only at_station parcels are
+    read, through the partial parcel_at_station_idx index.
+    """
+    now = now or timezone.now()
+    annotations = {
+        "waiting_count": Count("waiting"),
+        "overdue": Count("waiting", filter=Q(waiting__station_arrival_time__lt=_storage_cutoff(now))),
+        "oldest_arrival": Min("waiting__station_arrival_time"),
+        "newest_arrival": Max("waiting__station_arrival_time"),
+    }
+    for index, (label, low, high) in enumerate(AGING_BUCKETS):
+        annotations[f"bucket_{index}"] = Count("waiting", filter=_bucket_filter(now, low, high))
+
+    rows = (
+        Location.objects.filter(location_type="pickup_station", active=True)
+        .annotate(waiting=FilteredRelation("destination", condition=Q(destination__status="at_station")))
+        .values("pk", "name", "location_tag", "pickupstation__max_storage_days")
+        .annotate(**annotations)
+        .order_by("name", "pk")
+    )
+    stations = []
+    for row in rows:
+        stations.append({
+            "id": row["pk"],
+            "name": row["name"],
+            "location_tag": row["location_tag"],
+            "max_storage_days": row["pickupstation__max_storage_days"] or DEFAULT_MAX_STORAGE_DAYS,
+            "waiting": row["waiting_count"],
+            "overdue": row["overdue"],
+            "oldest_arrival": row["oldest_arrival"],
+            "newest_arrival": row["newest_arrival"],
+            "buckets": [
+                {"label": label, "count": row[f"bucket_{index}"]}
+                for index, (label, low, high) in enumerate(AGING_BUCKETS)
+            ],
+        })
+    return {"generated_at": now, "stations": stations}
+
+
+def get_station_inventory():
+    """Cached build_station_inventory(); stale by at most STATION_INVENTORY_CACHE_TIMEOUT seconds"""
+    inventory = cache.get(STATION_INVENTORY_CACHE_KEY)
+    if inventory is None:
+        inventory = build_station_inventory()
+        cache.set(STATION_INVENTORY_CACHE_KEY, inventory, STATION_INVENTORY_CACHE_TIMEOUT)
+    return inventory
+
+
+def overdue_parcels(station, now=None):
+    """
+    Parcels at `station` that have outstayed its max_storage_days, oldest
+    first, as (tracking_number, arrival time, recipient, phone) rows.
+    Iterates in chunks so the list can be streamed without loading it all.
+    """
+    now = now or timezone.now()
+    try:
+        max_days = station.pickupstation.max_storage_days
+    except PickupStation.DoesNotExist:
+        max_days = DEFAULT_MAX_STORAGE_DAYS
+    return (
+        Parcel.objects.filter(
+            status="at_station",
+            destination_station=station,
+            station_arrival_time__lt=now - max_days * ONE_DAY,
+        )
+        .order_by("station_arrival_time", "pk")
+        .values_list("tracking_number", "station_arrival_time", "recipient__name", "recipient__phone")
+        .iterator(chunk_size=2000)
+    )
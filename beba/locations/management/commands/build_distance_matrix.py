@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from locations.distances import matrix_dir, rebuild_matrix
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the haversine distance matrix between all active locations with coordinates. "
+        "Location saves keep it current afterwards, a few seconds later; run this after bulk imports or edits."
+    )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = rebuild_matrix()
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {count}x{count} distances to {matrix_dir()} in {time.perf_counter() - started:.2f}s"
+        ))
@@ -0,0 +1,20 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from .distances import pending_updates
+from .spatial import spatial_index
+from .models import Hub, Location, PickupStation, Warehouse
+
+# Signals are sent once per concrete class, so the subclasses are connected too
+LOCATION_MODELS = (Location, Warehouse, PickupStation, Hub)
+
+
+def location_changed(sender, instance, **kwargs):
+    location_id = instance.pk
+    transaction.on_commit(lambda: pending_updates.add([location_id]))
+    transaction.on_commit(spatial_index.invalidate)
+
+
+for model in LOCATION_MODELS:
+    post_save.connect(location_changed, sender=model)
+    post_delete.connect(location_changed, sender=model)
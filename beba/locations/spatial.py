@@ -0,0 +1,224 @@
+import heapq
+import math
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Location
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+CELL_DEGREES = getattr(settings, "SPATIAL_INDEX_CELL_DEGREES", 0.25)  # about 28 km at the equator
+# Version key bumped on every location change; with a shared cache backend
+# this tells every worker to rebuild, otherwise only the one that saved
+VERSION_CACHE_KEY = "locations:spatial_version"
+VERSION_CHECK_INTERVAL = 1.0
+MAX_AGE = 300  # rebuild at least this often (seconds) in case a change was missed
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+class Point:
+    __slots__ = ("id", "tag", "name", "location_type", "active", "has_lockers", "city", "latitude", "longitude")
+
+    def __init__(self, id, tag, name, location_type, active, has_lockers, city, latitude, longitude):
+        self.id = id
+        self.tag = tag
+        self.name = name
+        self.location_type = location_type
+        self.active = active
+        self.has_lockers = has_lockers
+        self.city = city
+        self.latitude = latitude
+        self.longitude = longitude
+
+    def matches(self, location_type, active, has_lockers):
+        return (
+            (location_type is None or self.location_type == location_type)
+            and (active is None or self.active == active)
+            and (has_lockers is None or self.has_lockers == has_lockers)
+        )
+
+    def as_dict(self, distance=None):
+        data = {
+            "id": self.id,
+            "location_tag": self.tag,
+            "name": self.name,
+            "location_type": self.location_type,
+            "city": self.city,
+            "latitude": self.latitude,
+            "longitude": self.longitude,
+            "has_lockers": self.has_lockers,
+        }
+        if distance is not None:
+            data["distance_km"] = round(distance, 3)
+        return data
+
+
+class GridIndex:
+    """
+    Locations bucketed into CELL_DEGREES squares. A query only looks at the
+    cells around the point, widening ring by ring until no unseen cell can
+    hold anything closer than what has been found.
+    """
+
+    def __init__(self, points, cell_degrees=CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self.cells = defaultdict(list)
+        self.size = 0
+        for point in points:
+            self.cells[self._cell(point.latitude, point.longitude)].append(point)
+            self.size += 1
+        if self.cells:
+            rows = [row for row, col in self.cells]
+            cols = [col for row, col in self.cells]
+            self.bounds = (min(rows), max(rows), min(cols), max(cols))
+        else:
+            self.bounds = None
+
+    def _cell(self, latitude, longitude):
+        return int(math.floor(latitude / self.cell_degrees)), int(math.floor(longitude / self.cell_degrees))
+
+    def _ring(self, row, col, radius):
+        """Cells of the ring `radius` around (row, col) that lie inside the populated bounds"""
+        low_row, high_row, low_col, high_col = self.bounds
+        if radius == 0:
+            if low_row <= row <= high_row and low_col <= col <= high_col:
+                yield row, col
+            return
+        first_col, last_col = max(col - radius, low_col), min(col + radius, high_col)
+        for r in (row - radius, row + radius):
+            if low_row <= r <= high_row:
+                for c in range(first_col, last_col + 1):
+                    yield r, c
+        first_row, last_row = max(row - radius + 1, low_row), min(row + radius - 1, high_row)
+        for c in (col - radius, col + radius):
+            if low_col <= c <= high_col:
+                for r in range(first_row, last_row + 1):
+                    yield r, c
+
+    def _ring_span(self, row, col):
+        """First and last ring around (row, col) that touch the populated bounds"""
+        low_row, high_row, low_col, high_col = self.bounds
+        first = max(low_row - row, row - high_row, low_col - col, col - high_col, 0)
+        last = max(abs(row - low_row), abs(row - high_row), abs(col - low_col), abs(col - high_col))
+        return first, last
+
+    def _ring_clearance_km(self, latitude, radius):
+        """Lower bound on the distance from the query to any cell in ring radius + 1"""
+        # Longitude degrees shrink towards the poles; use the narrowest latitude the ring can reach
+        edge = min(90.0, abs(latitude) + (radius + 1) * self.cell_degrees)
+        return radius * self.cell_degrees * KM_PER_DEGREE * max(math.cos(math.radians(edge)), 0.0)
+
+    def nearest(self, latitude, longitude, k=5, location_type=None, active=True, has_lockers=None, max_km=None):
+        """Up to `k` (point, km) pairs closest to the query, nearest first"""
+        if self.bounds is None or k <= 0:
+            return []
+        row, col = self._cell(latitude, longitude)
+        best = []  # max-heap on distance via negation
+        # Rings closer in than the bounds are empty; those past them hold nothing
+        first, last = self._ring_span(row, col)
+        for radius in range(first, last + 1):
+            for cell in self._ring(row, col, radius):
+                for point in self.cells.get(cell, ()):
+                    if not point.matches(location_type, active, has_lockers):
+                        continue
+                    distance = haversine_km(latitude, longitude, point.latitude, point.longitude)
+                    if max_km is not None and distance > max_km:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, point.id, point))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, point.id, point))
+            clearance = self._ring_clearance_km(latitude, radius)
+            if len(best) == k and clearance >= -best[0][0]:
+                break
+            if max_km is not None and clearance > max_km:
+                break
+        return [(point, -negated) for negated, point_id, point in sorted(best, reverse=True)]
+
+    def within(self, latitude, longitude, radius_km, location_type=None, active=True, has_lockers=None, limit=None):
+        """(point, km) pairs within `radius_km` of the query, nearest first"""
+        if self.bounds is None:
+            return []
+        lat_span = radius_km / KM_PER_DEGREE
+        edge = min(90.0, abs(latitude) + lat_span)
+        lon_span = min(180.0, lat_span / max(math.cos(math.radians(edge)), 1e-6))
+        low_row, low_col = self._cell(latitude - lat_span, longitude - lon_span)
+        high_row, high_col = self._cell(latitude + lat_span, longitude + lon_span)
+        min_row, max_row, min_col, max_col = self.bounds
+        found = []
+        for r in range(max(low_row, min_row), min(high_row, max_row) + 1):
+            for c in range(max(low_col, min_col), min(high_col, max_col) + 1):
+                for point in self.cells.get((r, c), ()):
+                    if not point.matches(location_type, active, has_lockers):
+                        continue
+                    distance = haversine_km(latitude, longitude, point.latitude, point.longitude)
+                    if distance <= radius_km:
+                        found.append((point, distance))
+        found.sort(key=lambda pair: (pair[1], pair[0].id))
+        return found[:limit] if limit else found
+
+
+def load_points():
+    rows = (
+        Location.objects.filter(latitude__isnull=False, longitude__isnull=False)
+        .values_list(
+            "pk", "location_tag", "name", "location_type", "active",
+            "pickupstation__has_lockers", "city", "latitude", "longitude",
+        )
+    )
+    return [
+        Point(pk, tag, name, location_type, active, bool(has_lockers), city, float(lat), float(lon))
+        for pk, tag, name, location_type, active, has_lockers, city, lat, lon in rows
+    ]
+
+
+class SpatialIndex:
+    """Process-wide GridIndex, rebuilt lazily after locations change"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._version = None
+        self._built = 0.0
+        self._checked = 0.0
+
+    def invalidate(self):
+        self._index = None
+        try:
+            cache.incr(VERSION_CACHE_KEY)
+        except ValueError:
+            cache.set(VERSION_CACHE_KEY, 1, None)
+
+    def get(self):
+        now = time.monotonic()
+        index = self._index
+        if index is not None and now - self._checked < VERSION_CHECK_INTERVAL:
+            return index
+        with self._lock:
+            version = cache.get(VERSION_CACHE_KEY)
+            if self._index is None or version != self._version or now - self._built > MAX_AGE:
+                self._index = GridIndex(load_points())
+                self._version = version
+                self._built = now
+            self._checked = now
+            return self._index
+
+
+spatial_index = SpatialIndex()
+
+
+def nearest_locations(latitude, longitude, k=5, **filters):
+    return spatial_index.get().nearest(latitude, longitude, k=k, **filters)
+
+
+def locations_within(latitude, longitude, radius_km, **filters):
+    return spatial_index.get().within(latitude, longitude, radius_km, **filters)
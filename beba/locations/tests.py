@@ -1,3 +1,144 @@
-from django.test import TestCase
+import random
+import tempfile
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from .distances import PendingUpdates, distance_matrix, haversine_matrix, rebuild_matrix, update_locations
+from .models import Location
+from .spatial import GridIndex, Point, haversine_km, spatial_index
+
+
+def make_locations(*rows):
+    """Locations from (tag, latitude, longitude) rows, without signals"""
+    return Location.objects.bulk_create([
+        Location(name=tag, location_tag=tag, location_type="pickup_station", address="-", city="Nairobi",
+                 latitude=Decimal(str(latitude)), longitude=Decimal(str(longitude)))
+        for tag, latitude, longitude in rows
+    ])
+
+
+class GridIndexTests(SimpleTestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        self.points = [
+            Point(i, f"L{i}", f"Location {i}", rng.choice(["pickup_station", "warehouse"]), rng.random() > 0.1,
+                  rng.random() > 0.5, "", rng.uniform(-4.5, 4.5), rng.uniform(34, 41.5))
+            for i in range(300)
+        ]
+        self.index = GridIndex(self.points)
+
+    def brute_force(self, latitude, longitude, location_type=None):
+        found = [
+            (haversine_km(latitude, longitude, point.latitude, point.longitude), point.id)
+            for point in self.points
+            if point.matches(location_type, True, None)
+        ]
+        return sorted(found)
+
+    def test_nearest_matches_a_brute_force_search(self):
+        for latitude, longitude in [(-1.28, 36.82), (0, 0), (-4.5, 41.5), (30, 100)]:
+            for location_type in (None, "warehouse"):
+                with self.subTest(latitude=latitude, longitude=longitude, location_type=location_type):
+                    found = self.index.nearest(latitude, longitude, k=7, location_type=location_type)
+                    expected = self.brute_force(latitude, longitude, location_type)[:7]
+                    self.assertEqual([point.id for point, distance in found], [pk for distance, pk in expected])
+
+    def test_within_matches_a_brute_force_search(self):
+        found = self.index.within(-1.28, 36.82, 120)
+        expected = [pk for distance, pk in self.brute_force(-1.28, 36.82) if distance <= 120]
+        self.assertEqual([point.id for point, distance in found], expected)
+        self.assertEqual(len(self.index.within(-1.28, 36.82, 120, limit=3)), min(3, len(expected)))
+
+    def test_empty_queries(self):
+        self.assertEqual(self.index.nearest(0, 37, k=0), [])
+        self.assertEqual(GridIndex([]).nearest(0, 37), [])
+        self.assertEqual(self.index.nearest(0, 37, max_km=0.001), [])
+
+
+class DistanceMatrixTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(DISTANCE_MATRIX_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        distance_matrix.reset()
+        self.addCleanup(distance_matrix.reset)
+
+    def test_haversine_matrix(self):
+        matrix = haversine_matrix([0, 0], [0, 1])
+        self.assertAlmostEqual(matrix[0, 1], 111.195, places=2)
+        self.assertEqual(matrix[0, 0], 0)
+
+    def test_incremental_updates_match_a_rebuild(self):
+        nairobi, mombasa, kisumu = make_locations(("NBO", -1.28, 36.82), ("MSA", -4.04, 39.67), ("KSM", -0.09, 34.77))
+        self.assertEqual(rebuild_matrix(), 3)
+        self.assertAlmostEqual(distance_matrix.distance("NBO", "MSA"), 440, delta=5)
+        self.assertIsNone(distance_matrix.distance("NBO", "XXX"))
+
+        eldoret, = make_locations(("ELD", 0.51, 35.27))
+        Location.objects.filter(pk=kisumu.pk).update(active=False)
+        Location.objects.filter(pk=mombasa.pk).update(latitude=Decimal("-3.22"), longitude=Decimal("40.12"))
+        update_locations([eldoret.pk, kisumu.pk, mombasa.pk])
+        tags = sorted(distance_matrix.tags())
+        self.assertEqual(tags, ["ELD", "MSA", "NBO"])
+        updated = [[distance_matrix.distance(a, b) for b in tags] for a in tags]
+
+        rebuild_matrix()
+        rebuilt = [[distance_matrix.distance(a, b) for b in tags] for a in tags]
+        np.testing.assert_allclose(updated, rebuilt, rtol=1e-5)
+
+    def test_saves_are_applied_together_outside_the_request(self):
+        make_locations(("NBO", -1.28, 36.82))
+        rebuild_matrix()
+        mombasa, kisumu = make_locations(("MSA", -4.04, 39.67), ("KSM", -0.09, 34.77))
+        pending = PendingUpdates()
+        with mock.patch("locations.distances.threading.Timer") as timer:
+            pending.add([mombasa.pk])
+            pending.add([kisumu.pk])
+        timer.assert_called_once()
+        self.assertIsNone(distance_matrix.distance("NBO", "MSA"))
+
+        with mock.patch("locations.distances.update_locations", side_effect=OSError("disk full")) as update:
+            with self.assertLogs("locations.distances", "ERROR"):
+                self.assertFalse(pending.apply())
+        update.assert_called_once_with({mombasa.pk, kisumu.pk})
+        self.assertTrue(pending.apply())
+        self.assertAlmostEqual(distance_matrix.distance("NBO", "MSA"), 440, delta=5)
+        self.assertIsNotNone(distance_matrix.distance("MSA", "KSM"))
+
+
+class NearestLocationsViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_locations(("NBO", -1.28, 36.82), ("THK", -1.03, 37.07), ("MSA", -4.04, 39.67))
+
+    def setUp(self):
+        spatial_index.invalidate()
+
+    def lookup(self, **params):
+        return self.client.get(reverse("locations:nearest_locations"), params)
+
+    def test_returns_the_nearest_first(self):
+        response = self.lookup(lat=-1.3, lon=36.8, k=2)
+        self.assertEqual([row["location_tag"] for row in response.json()["results"]], ["NBO", "THK"])
+        response = self.lookup(lat=-1.3, lon=36.8, radius_km=50)
+        self.assertEqual([row["location_tag"] for row in response.json()["results"]], ["NBO", "THK"])
+
+    def test_clamps_k_and_rejects_bad_input(self):
+        self.assertEqual(len(self.lookup(lat=-1.3, lon=36.8, k=0).json()["results"]), 1)
+        for params in ({"lat": 91, "lon": 0}, {"lat": "x", "lon": 0}, {"lat": 0, "lon": 0, "type": "castle"}):
+            with self.subTest(params=params):
+                self.assertEqual(self.lookup(**params).status_code, 400)
+
+    def test_saved_locations_reach_the_index(self):
+        self.assertEqual(len(self.lookup(lat=0.5, lon=35.3, k=1, radius_km=10).json()["results"]), 0)
+        with mock.patch("locations.signals.pending_updates"), self.captureOnCommitCallbacks(execute=True):
+            Location.objects.create(name="Eldoret", location_tag="ELD", location_type="pickup_station", address="-",
+                                    city="Eldoret", latitude=Decimal("0.51"), longitude=Decimal("35.27"))
+        results = self.lookup(lat=0.5, lon=35.3, k=1, radius_km=10).json()["results"]
+        self.assertEqual([row["location_tag"] for row in results], ["ELD"])
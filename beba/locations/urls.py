@@ -10,4 +10,7 @@ urlpatterns = [
     path('create/', views.LocationCreateView.as_view(), name='location_create'),
     path('<int:pk>/update/', views.LocationUpdateView.as_view(), name='location_update'),
     path('<int:pk>/assign-staff/', views.AssignStaffToLocationView.as_view(), name='assign_staff'),
+    path('stations/dashboard/', views.StationDashboardView.as_view(), name='station_dashboard'),
+    path('stations/<int:pk>/overdue.csv', views.StationOverdueView.as_view(), name='station_overdue'),
+    path('nearest.json', views.nearest_locations_lookup, name='nearest_locations'),
 ]
\ No newline at end of file
@@ -1,6 +1,10 @@
 # views.py
 
-from django.views.generic import ListView, CreateView, UpdateView
+import csv
+from itertools import chain
+
+from django.views.generic import ListView, CreateView, UpdateView, TemplateView, View
+from django.http import JsonResponse, StreamingHttpResponse
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.urls import reverse_lazy
 from django.contrib import messages
@@ -11,6 +15,9 @@ from .forms import (
     LocationForm, WarehouseForm, PickupStationForm, HubForm, StaffFormSet
 )
 from staff.models import Staff 
+from .inventory import get_station_inventory, overdue_parcels
+from .spatial import locations_within, nearest_locations
+from beba.pagination import KeysetPaginationMixin
 
 class LocationPermissionMixin(UserPassesTestMixin):
     """Reusable mixin for location management permissions"""
@@ -28,12 +35,12 @@ class LocationPermissionMixin(UserPassesTestMixin):
         return redirect('staff:staff_list')  # Or home page
 
 # 1. List All Locations
-class LocationListView(LoginRequiredMixin, LocationPermissionMixin, ListView):
+class LocationListView(LoginRequiredMixin, LocationPermissionMixin, KeysetPaginationMixin, ListView):
     model = Location
     template_name = 'locations/location_list.html'
     context_object_name = 'locations'
     paginate_by = 20
-    ordering = ['name']
+    ordering = ['name', 'pk']
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -151,4 +158,117 @@ class AssignStaffToLocationView(LoginRequiredMixin, LocationPermissionMixin, Upd
         if 'formset' not in context:
             context['formset'] = StaffFormSet(queryset=Staff.objects.filter(active=True), instance=self.object)
         context['location'] = self.object
-        return context
\ No newline at end of file
+        return context
+
+
+class StationDashboardPermissionMixin(LocationPermissionMixin):
+    """Managers see every station; station staff only the one they work at"""
+    def test_func(self):
+        if super().test_func():
+            return True
+        try:
+            staff = self.request.user.staff_profile
+        except AttributeError:
+            return False
+        return staff.role == "station" and staff.active and staff.location_id is not None
+
+    def visible_station_ids(self):
+        """None means all stations"""
+        user = self.request.user
+        if user.is_superuser or user.staff_profile.role in ("manager", "admin"):
+            return None
+        return {user.staff_profile.location_id}
+
+
+# 5. Station inventory and aging dashboard
+class StationDashboardView(LoginRequiredMixin, StationDashboardPermissionMixin, TemplateView):
+    template_name = 'locations/station_dashboard.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        inventory = get_station_inventory()
+        visible = self.visible_station_ids()
+        stations = [
+            station for station in inventory["stations"]
+            if visible is None or station["id"] in visible
+        ]
+        context['stations'] = stations
+        context['generated_at'] = inventory["generated_at"]
+        context['bucket_labels'] = [bucket["label"] for bucket in stations[0]["buckets"]] if stations else []
+        context['totals'] = {
+            'waiting': sum(station["waiting"] for station in stations),
+            'overdue': sum(station["overdue"] for station in stations),
+        }
+        return context
+
+
+class _Echo:
+    """File-like object whose write() hands the row straight back, for csv.writer"""
+    def write(self, value):
+        return value
+
+
+# 6. Overdue parcels at one station, streamed as CSV
+class StationOverdueView(LoginRequiredMixin, StationDashboardPermissionMixin, View):
+    def get(self, request, pk):
+        visible = self.visible_station_ids()
+        if visible is not None and pk not in visible:
+            return self.handle_no_permission()
+        station = get_object_or_404(Location, pk=pk, location_type="pickup_station")
+
+        writer = csv.writer(_Echo())
+        header = ("tracking_number", "station_arrival_time", "recipient", "recipient_phone")
+        rows = (
+            (number, arrived.isoformat() if arrived else "", name or "", phone or "")
+            for number, arrived, name, phone in overdue_parcels(station)
+        )
+        response = StreamingHttpResponse(
+            (writer.writerow(row) for row in chain([header], rows)),
+            content_type="text/csv",
+        )
+        response["Content-Disposition"] = f'attachment; filename="overdue-{station.location_tag}.csv"'
+        return response
+
+
+MAX_NEAREST = 50
+MAX_RADIUS_KM = 500
+
+
+def _query_float(request, name, low, high):
+    try:
+        value = float(request.GET[name])
+    except (KeyError, ValueError):
+        raise ValueError(f"'{name}' must be a number")
+    if not low <= value <= high:
+        raise ValueError(f"'{name}' must be between {low} and {high}")
+    return value
+
+
+# 7. Nearest locations to a point (public, used when choosing a pickup station)
+def nearest_locations_lookup(request):
+    """
+    GET ?lat=&lon=[&k=5][&radius_km=][&type=pickup_station|warehouse|...|any][&lockers=1|0]
+    Active locations only, nearest first.
+    """
+    try:
+        latitude = _query_float(request, "lat", -90, 90)
+        longitude = _query_float(request, "lon", -180, 180)
+        k = max(1, min(int(request.GET.get("k", 5)), MAX_NEAREST))
+        radius_km = _query_float(request, "radius_km", 0, MAX_RADIUS_KM) if "radius_km" in request.GET else None
+    except ValueError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+
+    location_type = request.GET.get("type", "pickup_station")
+    if location_type == "any":
+        location_type = None
+    elif location_type not in dict(Location.LOCATION_TYPES):
+        return JsonResponse({"error": f"Unknown location type '{location_type}'."}, status=400)
+    lockers = request.GET.get("lockers")
+    has_lockers = None if lockers in (None, "") else lockers.lower() in ("1", "true", "yes")
+
+    filters = {"location_type": location_type, "active": True, "has_lockers": has_lockers}
+    if radius_km is None:
+        results = nearest_locations(latitude, longitude, k=k, **filters)
+    else:
+        results = locations_within(latitude, longitude, radius_km, limit=k, **filters)
+    return JsonResponse({"results": [point.as_dict(distance) for point, distance in results]})
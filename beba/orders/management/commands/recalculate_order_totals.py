@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Exists, Max, Min, OuterRef
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from orders.models import Order
+from orders.utils import recalculate_totals
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute Order.total_amount from parcel fees in the database, one UPDATE per chunk of "
+        "order ids. Use --since after a tariff change to limit it to orders whose parcels changed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Order ids per UPDATE (default 5000)")
+        parser.add_argument("--since", help="Only orders with a parcel updated at or after this ISO 8601 time")
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be positive")
+        orders = Order.objects.all()
+        if options["since"]:
+            since = parse_datetime(options["since"])
+            if since is None:
+                raise CommandError("--since must be an ISO 8601 date and time")
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+            changed = Order.parcels.through.objects.filter(order_id=OuterRef("pk"), parcel__updated_at__gte=since)
+            orders = orders.filter(Exists(changed))
+
+        bounds = Order.objects.aggregate(low=Min("pk"), high=Max("pk"))
+        if bounds["low"] is None:
+            self.stdout.write("No orders.")
+            return
+
+        started = time.monotonic()
+        scanned = updated = 0
+        # Chunks are id ranges, so no list of ids is ever loaded
+        for low in range(bounds["low"], bounds["high"] + 1, chunk_size):
+            chunk = orders.filter(pk__gte=low, pk__lt=low + chunk_size)
+            with transaction.atomic():
+                updated += recalculate_totals(chunk)
+            scanned = min(low + chunk_size, bounds["high"] + 1) - bounds["low"]
+            if options["verbosity"] > 1:
+                elapsed = time.monotonic() - started
+                self.stdout.write(f"  up to id {low + chunk_size - 1}: {updated} updated, {scanned / elapsed:,.0f} ids/s")
+
+        elapsed = time.monotonic() - started
+        rate = updated / elapsed if elapsed else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated {updated} order totals in {elapsed:.2f}s ({rate:,.0f} rows/s, "
+            f"{scanned / elapsed if elapsed else 0.0:,.0f} ids/s scanned)"
+        ))
@@ -1,4 +1,8 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import Sum, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
 class Order(models.Model):
@@ -36,9 +40,11 @@ class Order(models.Model):
 
     def calculate_total(self):
         """Recalculate total amount including delivery fee and extra charges."""
-        parcel_fees = sum(parcel.delivery_fee for parcel in self.parcels.all())
+        parcel_fees = self.parcels.aggregate(
+            total=Coalesce(Sum("delivery_fee"), Value(Decimal("0.00")), output_field=models.DecimalField())
+        )["total"]
         self.total_amount = parcel_fees + self.delivery_fee + self.extra_charges
-        self.save()
+        self.save(update_fields=["total_amount", "updated_at"])
 
     def __str__(self):
         return f"Order {self.order_number} ({self.status})"
@@ -1,3 +1,41 @@
+import io
+from decimal import Decimal
+
+from django.core.management import CommandError, call_command
 from django.test import TestCase
 
-# Create your tests here.
+from parcels.models import Parcel
+from .models import Order
+from .utils import recalculate_totals
+
+
+class OrderTotalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.parcels = Parcel.objects.bulk_create([
+            Parcel(tracking_number=f"ORD-{i}", weight=Decimal("1"), delivery_fee=Decimal(fee))
+            for i, fee in enumerate(["150.00", "200.50"])
+        ])
+        cls.order = Order.objects.create(order_number="ORD-1", delivery_fee=Decimal("50.00"), extra_charges=Decimal("5.00"))
+        cls.order.parcels.set(cls.parcels)
+        cls.empty = Order.objects.create(order_number="ORD-2", delivery_fee=Decimal("20.00"))
+
+    def test_matches_calculate_total(self):
+        self.assertEqual(recalculate_totals(Order.objects.all()), 2)
+        self.order.refresh_from_db()
+        self.empty.refresh_from_db()
+        self.assertEqual((self.order.total_amount, self.empty.total_amount), (Decimal("405.50"), Decimal("20.00")))
+
+        self.order.calculate_total()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_amount, Decimal("405.50"))
+        self.assertEqual(recalculate_totals(Order.objects.all()), 0)
+
+    def test_command_recalculates_in_chunks(self):
+        call_command("recalculate_order_totals", chunk_size=1, stdout=io.StringIO())
+        self.assertEqual(
+            list(Order.objects.order_by("pk").values_list("total_amount", flat=True)),
+            [Decimal("405.50"), Decimal("20.00")],
+        )
+        with self.assertRaisesMessage(CommandError, "--since"):
+            call_command("recalculate_order_totals", since="yesterday", stdout=io.StringIO())
@@ -0,0 +1,35 @@
+from decimal import Decimal
+
+from django.db import models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Order
+
+
+def order_total_expression():
+    """
+    SQL for what Order.calculate_total() computes: the order's parcel
+    delivery fees plus its own delivery fee and extra charges
+    """
+    parcel_fees = (
+        Order.parcels.through.objects.filter(order_id=OuterRef("pk"))
+        .values("order_id")
+        .annotate(total=Sum("parcel__delivery_fee"))
+        .values("total")
+    )
+    money = models.DecimalField(max_digits=10, decimal_places=2)
+    return Coalesce(Subquery(parcel_fees, output_field=money), Value(Decimal("0.00")), output_field=money) + F(
+        "delivery_fee"
+    ) + F("extra_charges")
+
+
+def recalculate_totals(orders):
+    """
+    Recompute total_amount for a queryset of orders in one UPDATE with a
+    correlated subquery. Orders whose total is already right are not
+    rewritten. Returns the number of rows updated.
+    """
+    total = order_total_expression()
+    return orders.exclude(total_amount=total).update(total_amount=total, updated_at=timezone.now())
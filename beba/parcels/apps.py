@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ParcelsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'parcels'
+
+    def ready(self):
+        from . import pickup  # noqa: F401  registers the pickup code hooks
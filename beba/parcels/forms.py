@@ -0,0 +1,53 @@
+# forms.py
+
+from django import forms
+from orders.models import Item
+from customers.models import Customer
+from locations.models import Location
+from .models import Parcel
+from .intake import MANIFEST_FORMATS
+
+
+class ParcelForm(forms.ModelForm):
+    class Meta:
+        model = Parcel
+        fields = [
+            'tracking_number', 'sender_customer', 'sender_warehouse', 'recipient',
+            'origin', 'destination_station', 'home_delivery_location',
+            'weight', 'dimensions', 'fragile', 'requires_signature',
+            'expected_delivery_date', 'priority', 'special_instructions',
+            'payment_status', 'delivery_fee', 'extra_charges',
+        ]
+        widgets = {
+            'home_delivery_location': forms.Textarea(attrs={'rows': 3}),
+            'special_instructions': forms.Textarea(attrs={'rows': 3}),
+            'expected_delivery_date': forms.DateInput(attrs={'type': 'date'}),
+        }
+
+
+class ItemForm(forms.ModelForm):
+    class Meta:
+        model = Item
+        fields = ['name', 'description', 'category', 'quantity', 'weight', 'value', 'fragile', 'requires_signature']
+        widgets = {
+            'description': forms.Textarea(attrs={'rows': 2}),
+        }
+
+
+class ManifestUploadForm(forms.Form):
+    """Upload a merchant manifest (CSV or JSONL) for bulk intake"""
+    manifest = forms.FileField()
+    format = forms.ChoiceField(
+        choices=[("", "Detect from file name")] + [(f, f.upper()) for f in MANIFEST_FORMATS],
+        required=False,
+    )
+    sender_customer = forms.ModelChoiceField(queryset=Customer.objects.all(), required=False)
+    origin = forms.ModelChoiceField(queryset=Location.objects.filter(active=True), required=False)
+
+
+class PickupVerifyForm(forms.Form):
+    """Counter pickup: the code the collector presents, plus who collected it"""
+    code = forms.CharField(max_length=10)
+    customer = forms.ModelChoiceField(queryset=Customer.objects.all(), required=False)
+    guest_name = forms.CharField(max_length=100, required=False)
+    guest_id = forms.CharField(max_length=50, required=False)
@@ -0,0 +1,391 @@
+import csv
+import json
+import time
+import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import IntegrityError, transaction
+
+from billing.pricing import apply_tariffs
+from customers.models import Customer
+from locations.models import Location
+from orders.models import Item
+from transit.eta import fill_expected_delivery_dates
+from .models import Parcel, ParcelLog
+from .utils import generate_tracking_numbers
+
+MANIFEST_FORMATS = ("csv", "jsonl")
+DEFAULT_CHUNK_SIZE = 1000
+
+PRIORITIES = {value for value, label in Parcel._meta.get_field("priority").choices}
+PAYMENT_STATUSES = {value for value, label in Parcel.PAYMENT_CHOICES}
+ITEM_CATEGORIES = {value for value, label in Item.CATEGORY_CHOICES}
+TRUE_VALUES = {"1", "true", "yes", "y", "t"}
+CENT = Decimal("0.01")
+MAX_ID = 2 ** 63 - 1  # BigAutoField
+MAX_QUANTITY = 2 ** 31 - 1  # PositiveIntegerField
+
+# Flat CSV manifests describe a single item per parcel with these columns
+ITEM_COLUMNS = {
+    "item_name": "name",
+    "item_description": "description",
+    "item_category": "category",
+    "item_quantity": "quantity",
+    "item_weight": "weight",
+    "item_value": "value",
+}
+
+
+class ManifestRowError(ValueError):
+    """Raised for a manifest row that cannot be turned into a parcel"""
+
+
+class ManifestReadError(ValueError):
+    """Raised when the rest of a manifest cannot be read (bad encoding, broken CSV)"""
+
+    def __init__(self, line, message):
+        super().__init__(message)
+        self.line = line
+
+
+class IntakeResult:
+    """Running totals for a manifest import"""
+
+    def __init__(self):
+        self.created = 0
+        self.items = 0
+        self.errors = []  # (line number, message)
+        self.truncated = False  # the manifest could not be read to the end
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+
+    @property
+    def rate(self):
+        return self.created / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self, max_errors=None):
+        errors = self.errors if max_errors is None else self.errors[:max_errors]
+        return {
+            "created": self.created,
+            "items": self.items,
+            "failed": len(self.errors),
+            "errors": [{"line": line, "error": message} for line, message in errors],
+            "truncated": self.truncated,
+            "elapsed_seconds": round(self.elapsed, 3),
+            "parcels_per_second": round(self.rate, 1),
+        }
+
+
+def detect_format(filename):
+    """Guess the manifest format from a file name"""
+    name = (filename or "").lower()
+    if name.endswith((".jsonl", ".ndjson", ".json")):
+        return "jsonl"
+    return "csv"
+
+
+def read_manifest(stream, fmt="csv"):
+    """
+    Yield (line_number, row) pairs from a text stream without reading it whole.
+    CSV line numbers count the header as line 1. Raises ManifestReadError
+    when the stream cannot be decoded or parsed any further.
+    """
+    if fmt not in MANIFEST_FORMATS:
+        raise ValueError(f"Unsupported manifest format '{fmt}'")
+
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        try:
+            for row in reader:
+                yield reader.line_num, row
+        except UnicodeDecodeError as exc:
+            raise ManifestReadError(
+                reader.line_num + 1, f"Manifest is not valid UTF-8 after line {reader.line_num}: {exc}"
+            )
+        except csv.Error as exc:
+            raise ManifestReadError(reader.line_num + 1, f"Manifest is not valid CSV: {exc}")
+        return
+
+    lines = enumerate(stream, start=1)
+    line_number = 0
+    while True:
+        try:
+            line_number, line = next(lines)
+        except StopIteration:
+            return
+        except UnicodeDecodeError as exc:
+            raise ManifestReadError(
+                line_number + 1, f"Manifest is not valid UTF-8 after line {line_number}: {exc}"
+            )
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            row = ManifestRowError(f"Invalid JSON: {exc}")
+        if not isinstance(row, (dict, ManifestRowError)):
+            row = ManifestRowError("Each line must be a JSON object")
+        yield line_number, row
+
+
+def _text(row, key, default=""):
+    value = row.get(key)
+    if value is None:
+        return default
+    return str(value).strip()
+
+
+def _decimal(row, key, required=False, default=None, max_digits=8):
+    """A non-negative amount in cents that fits a DecimalField of `max_digits`"""
+    value = _text(row, key)
+    if not value:
+        if required:
+            raise ManifestRowError(f"'{key}' is required")
+        return default
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        raise ManifestRowError(f"'{key}' is not a number: {value!r}")
+    if not number.is_finite():
+        raise ManifestRowError(f"'{key}' is not a number: {value!r}")
+    if number < 0:
+        raise ManifestRowError(f"'{key}' cannot be negative")
+    # Checking the exponent first keeps quantize() from overflowing on huge values
+    if number.adjusted() >= max_digits - 2 or number.quantize(CENT).adjusted() >= max_digits - 2:
+        raise ManifestRowError(f"'{key}' is too large: {value!r}")
+    return number.quantize(CENT)
+
+
+def _bool(row, key):
+    value = row.get(key)
+    if isinstance(value, bool):
+        return value
+    return _text(row, key).lower() in TRUE_VALUES
+
+
+def _choice(row, key, choices, default):
+    value = _text(row, key, default) or default
+    if value not in choices:
+        raise ManifestRowError(f"'{key}' must be one of {', '.join(sorted(choices))}")
+    return value
+
+
+def _whole_number(value, key, maximum):
+    """A non-negative integer written in ASCII digits, no larger than `maximum`"""
+    # isdigit() alone accepts characters such as "²" that int() rejects
+    if not (value.isascii() and value.isdecimal()) or int(value) > maximum:
+        raise ManifestRowError(f"'{key}' must be a whole number up to {maximum}: {value!r}")
+    return int(value)
+
+
+def _location_id(row, key, locations):
+    tag = _text(row, key)
+    if not tag:
+        return None
+    if tag not in locations:
+        raise ManifestRowError(f"Unknown {key} location '{tag}'")
+    return locations[tag][0]
+
+
+def _parse_items(row):
+    if "items" in row and row["items"] not in (None, ""):
+        raw_items = row["items"]
+        if isinstance(raw_items, str):
+            try:
+                raw_items = json.loads(raw_items)
+            except ValueError:
+                raise ManifestRowError("'items' is not valid JSON")
+        if not isinstance(raw_items, list):
+            raise ManifestRowError("'items' must be a list")
+    elif _text(row, "item_name"):
+        raw_items = [{field: row.get(column) for column, field in ITEM_COLUMNS.items()}]
+    else:
+        return []
+
+    items = []
+    for raw in raw_items:
+        if not isinstance(raw, dict) or not _text(raw, "name"):
+            raise ManifestRowError("Every item needs a 'name'")
+        quantity = _whole_number(_text(raw, "quantity") or "1", "quantity", MAX_QUANTITY)
+        if quantity < 1:
+            raise ManifestRowError("Item quantity must be at least 1")
+        items.append(Item(
+            name=_text(raw, "name")[:100],
+            description=_text(raw, "description"),
+            category=_choice(raw, "category", ITEM_CATEGORIES, "other"),
+            quantity=quantity,
+            weight=_decimal(raw, "weight"),
+            value=_decimal(raw, "value", max_digits=10),
+            fragile=_bool(raw, "fragile"),
+            requires_signature=_bool(raw, "requires_signature"),
+        ))
+    return items
+
+
+def parse_row(row, locations, sender_customer_id=None, origin_tag=None):
+    """
+    Validate one manifest row and build an unsaved Parcel and its Items.
+    `locations` maps location_tag -> (id, name).
+    """
+    if isinstance(row, ManifestRowError):
+        raise row
+
+    origin_id = _location_id(row, "origin", locations) if _text(row, "origin") else None
+    if origin_id is None and origin_tag:
+        origin_id = locations[origin_tag][0]
+
+    expected = _text(row, "expected_delivery_date")
+    if expected:
+        try:
+            expected = datetime.date.fromisoformat(expected)
+        except ValueError:
+            raise ManifestRowError(f"'expected_delivery_date' must be YYYY-MM-DD: {expected!r}")
+    else:
+        expected = None
+
+    recipient = _text(row, "recipient")
+    recipient_id = _whole_number(recipient, "recipient", MAX_ID) if recipient else None
+
+    weight = _decimal(row, "weight", required=True)
+    if weight == 0:
+        raise ManifestRowError("'weight' must be greater than zero")
+
+    parcel = Parcel(
+        tracking_number=_text(row, "tracking_number")[:20],
+        sender_customer_id=sender_customer_id,
+        sender_warehouse_id=origin_id,
+        recipient_id=recipient_id,
+        origin_id=origin_id,
+        destination_station_id=_location_id(row, "destination_station", locations),
+        home_delivery_location=_text(row, "home_delivery_location") or None,
+        weight=weight,
+        dimensions=_text(row, "dimensions")[:100],
+        fragile=_bool(row, "fragile"),
+        requires_signature=_bool(row, "requires_signature"),
+        expected_delivery_date=expected,
+        priority=_choice(row, "priority", PRIORITIES, "standard"),
+        special_instructions=_text(row, "special_instructions"),
+        payment_status=_choice(row, "payment_status", PAYMENT_STATUSES, "none"),
+        # Left empty to be priced from the tariffs when the chunk is saved
+        delivery_fee=_decimal(row, "delivery_fee"),
+        extra_charges=_decimal(row, "extra_charges"),
+        status="packed",
+    )
+    return parcel, _parse_items(row)
+
+
+def _save_chunk(chunk, locations_by_id, result, staff=None, note=""):
+    """Check a chunk against the database, then write it in one transaction"""
+    recipient_ids = {parcel.recipient_id for line, parcel, items in chunk if parcel.recipient_id}
+    known_recipients = set(
+        Customer.objects.filter(pk__in=recipient_ids).values_list("pk", flat=True)
+    ) if recipient_ids else set()
+
+    rows = []
+    for line, parcel, items in chunk:
+        if parcel.recipient_id and parcel.recipient_id not in known_recipients:
+            result.errors.append((line, f"Unknown recipient customer {parcel.recipient_id}"))
+        else:
+            parcel.current_location = locations_by_id.get(parcel.origin_id, "")
+            rows.append((line, parcel, items))
+    if not rows:
+        return
+
+    # Allocated numbers are unique by construction, only supplied ones need checking
+    supplied = [parcel.tracking_number for line, parcel, items in rows if parcel.tracking_number]
+    taken = set(
+        Parcel.objects.filter(tracking_number__in=supplied).values_list("tracking_number", flat=True)
+    ) if supplied else set()
+    if taken:
+        for line, parcel, items in rows:
+            if parcel.tracking_number in taken:
+                result.errors.append((line, f"Tracking number {parcel.tracking_number} already exists"))
+        rows = [row for row in rows if row[1].tracking_number not in taken]
+
+    generated = [parcel for line, parcel, items in rows if not parcel.tracking_number]
+    if generated:
+        for parcel, number in zip(generated, generate_tracking_numbers(len(generated))):
+            parcel.tracking_number = number
+
+    parcels = [parcel for line, parcel, items in rows]
+    fill_expected_delivery_dates(parcels)
+    apply_tariffs(parcels)
+    try:
+        with transaction.atomic():
+            Parcel.objects.bulk_create(parcels)
+            items = []
+            logs = []
+            for line, parcel, parcel_items in rows:
+                for item in parcel_items:
+                    item.parcel = parcel
+                    items.append(item)
+                logs.append(ParcelLog(
+                    parcel=parcel,
+                    status=parcel.status,
+                    location=parcel.current_location,
+                    staff=staff,
+                    note=note,
+                ))
+            Item.objects.bulk_create(items)
+            ParcelLog.objects.bulk_create(logs)
+    except IntegrityError as exc:
+        for parcel in parcels:
+            parcel.pk = None
+        result.errors.extend((line, f"Chunk rejected by the database: {exc}") for line, parcel, items in rows)
+        return
+
+    result.created += len(parcels)
+    result.items += len(items)
+
+
+def import_manifest(rows, sender_customer=None, origin=None, staff=None,
+                    chunk_size=DEFAULT_CHUNK_SIZE, note="Created from manifest"):
+    """
+    Create parcels, their items and the first ParcelLog from manifest rows.
+
+    `rows` yields (line_number, row dict) pairs, e.g. from read_manifest().
+    Rows are written in chunks of `chunk_size`, one transaction per chunk;
+    invalid rows are reported in the result and never abort the batch. A
+    manifest that cannot be read to the end stops the import at that point
+    and sets `result.truncated`.
+    """
+    result = IntakeResult()
+    locations = {
+        tag: (pk, name)
+        for pk, tag, name in Location.objects.values_list("pk", "location_tag", "name")
+    }
+    locations_by_id = {pk: name for pk, name in locations.values()}
+    origin_tag = origin.location_tag if origin else None
+    sender_customer_id = sender_customer.pk if sender_customer else None
+
+    seen = set()
+    chunk = []
+    try:
+        for line, row in rows:
+            try:
+                parcel, items = parse_row(row, locations, sender_customer_id, origin_tag)
+            except ManifestRowError as exc:
+                result.errors.append((line, str(exc)))
+                continue
+
+            if parcel.tracking_number:
+                if parcel.tracking_number in seen:
+                    result.errors.append((line, f"Duplicate tracking number {parcel.tracking_number} in manifest"))
+                    continue
+                seen.add(parcel.tracking_number)
+
+            chunk.append((line, parcel, items))
+            if len(chunk) >= chunk_size:
+                _save_chunk(chunk, locations_by_id, result, staff, note)
+                chunk = []
+    except ManifestReadError as exc:
+        # Rows read before the damage are still imported; the rest is reported as unread
+        result.errors.append((exc.line, str(exc)))
+        result.truncated = True
+
+    if chunk:
+        _save_chunk(chunk, locations_by_id, result, staff, note)
+
+    result.elapsed = time.monotonic() - result.started
+    return result
@@ -0,0 +1,188 @@
+import datetime
+import random
+import time
+from decimal import Decimal
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from billing.ledger import LedgerChanges
+from billing.models import Invoice
+from customers.models import Customer
+from locations.models import Location
+from parcels.models import Parcel, ParcelHandover, ParcelLog
+from parcels.utils import generate_tracking_numbers
+from staff.models import Staff
+from transit.models import DeliveryAssignment
+
+BATCH_SIZE = 5000
+STATUSES = [status for status, label in Parcel.STATUS_CHOICES]
+DELIVERY_STATUSES = ["assigned", "out_for_delivery", "delivered", "failed", "returned"]
+INVOICE_STATUSES = ["unpaid", "paid", "overdue", "cancelled"]
+INDEXED_MODELS = [Parcel, ParcelLog, ParcelHandover, DeliveryAssignment, Invoice]
+# Database names containing one of these are taken to be scratch copies
+SCRATCH_MARKERS = ("bench", "test")
+
+
+class Command(BaseCommand):
+    help = (
+        "Optionally seed benchmark rows, then print EXPLAIN QUERY PLAN output and timings for "
+        "the hot queries with and without the Meta.indexes. Drops and recreates indexes in the "
+        "configured database, so it refuses to run unless the database name contains "
+        f"{' or '.join(repr(marker) for marker in SCRATCH_MARKERS)} or --yes-i-mean-this-db is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=0, metavar="N",
+                            help="Parcels to seed first (logs x2, handovers x1); by default nothing is seeded")
+        parser.add_argument("--repeat", type=int, default=50, help="Runs per query when timing")
+        parser.add_argument("--yes-i-mean-this-db", action="store_true",
+                            help="Run even though the database name does not mark it as a scratch copy")
+
+    def handle(self, *args, **options):
+        name = Path(str(connection.settings_dict["NAME"])).name
+        if not options["yes_i_mean_this_db"] and not any(marker in name.lower() for marker in SCRATCH_MARKERS):
+            raise CommandError(
+                f"{name!r} does not look like a benchmark or test database. This command writes rows and "
+                "drops indexes; point it at a scratch copy or pass --yes-i-mean-this-db."
+            )
+        if options["seed"] < 0:
+            raise CommandError("--seed must not be negative")
+        if options["seed"]:
+            self.seed(options["seed"])
+
+        fixtures = self.pick_fixtures()
+        queries = self.hot_queries(**fixtures)
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Without indexes"))
+        self.set_indexes(present=False)
+        try:
+            before = self.run_queries(queries, options["repeat"])
+        finally:
+            self.set_indexes(present=True)
+        self.stdout.write(self.style.MIGRATE_HEADING("With indexes"))
+        after = self.run_queries(queries, options["repeat"])
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Summary (ms per query)"))
+        for name in queries:
+            speedup = before[name] / after[name] if after[name] else float("inf")
+            self.stdout.write(f"  {name:<32} {before[name]:>9.3f} -> {after[name]:>9.3f}  ({speedup:.1f}x)")
+
+    # --- Seeding ---
+    def seed(self, count):
+        started = time.monotonic()
+        tag = f"BENCH{int(time.time())}"
+        stations = Location.objects.bulk_create([
+            Location(name=f"Bench station {i}", location_tag=f"{tag}-{i}", location_type="pickup_station",
+                     address="Benchmark", city="Nairobi")
+            for i in range(50)
+        ])
+        customers = Customer.objects.bulk_create([
+            Customer(name=f"Bench customer {i}", registered=False) for i in range(200)
+        ])
+        users = User.objects.bulk_create([User(username=f"{tag}-courier-{i}") for i in range(100)])
+        couriers = Staff.objects.bulk_create([
+            Staff(user=user, role="courier", employee_id=user.username) for user in users
+        ])
+
+        now = timezone.now()
+        created = 0
+        while created < count:
+            size = min(BATCH_SIZE, count - created)
+            with transaction.atomic():
+                parcels = Parcel.objects.bulk_create([
+                    Parcel(
+                        tracking_number=number,
+                        sender_customer=random.choice(customers),
+                        destination_station=random.choice(stations),
+                        weight=Decimal(random.randint(1, 300)) / 10,
+                        status=random.choice(STATUSES),
+                        station_arrival_time=now - datetime.timedelta(hours=random.randint(0, 400)),
+                    )
+                    for number in generate_tracking_numbers(size)
+                ])
+                ParcelLog.objects.bulk_create([
+                    ParcelLog(parcel=parcel, status=status)
+                    for parcel in parcels for status in ("packed", parcel.status)
+                ])
+                ParcelHandover.objects.bulk_create([
+                    ParcelHandover(parcel=parcel, handover_type="warehouse_to_driver") for parcel in parcels
+                ])
+                DeliveryAssignment.objects.bulk_create([
+                    DeliveryAssignment(parcel=parcel, courier=random.choice(couriers), destination_address="Benchmark",
+                                       departure_time=now, status=random.choice(DELIVERY_STATUSES))
+                    for parcel in parcels[::3]
+                ])
+                invoices = Invoice.objects.bulk_create([
+                    Invoice(invoice_number=f"{parcel.tracking_number[-11:]}B", parcel=parcel,
+                            customer_id=parcel.sender_customer_id, amount_due=Decimal("250.00"),
+                            status=random.choice(INVOICE_STATUSES),
+                            due_date=now + datetime.timedelta(days=random.randint(-60, 30)))
+                    for parcel in parcels
+                ])
+                # bulk_create skips the ledger signals
+                ledger = LedgerChanges()
+                for invoice in invoices:
+                    ledger.invoice(invoice.customer_id, invoice.amount_due, invoice.status)
+                ledger.apply()
+            created += size
+            self.stdout.write(f"  seeded {created}/{count} parcels", ending="\r")
+            self.stdout.flush()
+        self.stdout.write(f"\nSeeded {count} parcels and related rows in {time.monotonic() - started:.1f}s")
+
+    def pick_fixtures(self):
+        parcel_id = Parcel.objects.order_by("?").values_list("pk", flat=True).first()
+        return {
+            "parcel_id": parcel_id,
+            "station_id": Parcel.objects.filter(pk=parcel_id).values_list("destination_station_id", flat=True).first(),
+            "courier_id": DeliveryAssignment.objects.values_list("courier_id", flat=True).first(),
+            "now": timezone.now(),
+        }
+
+    # --- Benchmark ---
+    def hot_queries(self, parcel_id, station_id, courier_id, now):
+        return {
+            "parcel log timeline": lambda: ParcelLog.objects.filter(parcel_id=parcel_id).order_by("timestamp"),
+            "parcels at station": lambda: Parcel.objects.filter(status="at_station", destination_station_id=station_id),
+            "station aging": lambda: Parcel.objects.filter(
+                status="at_station", destination_station_id=station_id,
+                station_arrival_time__lt=now - datetime.timedelta(days=7)),
+            "handover history": lambda: ParcelHandover.objects.filter(parcel_id=parcel_id).order_by("timestamp"),
+            "courier open deliveries": lambda: DeliveryAssignment.objects.filter(courier_id=courier_id, status="assigned"),
+            "overdue invoices": lambda: Invoice.objects.filter(status="unpaid", due_date__lt=now).order_by("due_date")[:1000],
+        }
+
+    def run_queries(self, queries, repeat):
+        timings = {}
+        for name, build in queries.items():
+            self.stdout.write(f"  {name}")
+            for line in build().explain().splitlines():
+                self.stdout.write(f"    {line}")
+            # Time the SQL alone so model instantiation doesn't drown out the plan
+            sql, params = build().query.sql_with_params()
+            with connection.cursor() as cursor:
+                started = time.perf_counter()
+                for _ in range(repeat):
+                    cursor.execute(sql, params)
+                    cursor.fetchall()
+            timings[name] = (time.perf_counter() - started) * 1000 / repeat
+            self.stdout.write(f"    {timings[name]:.3f} ms")
+        return timings
+
+    def set_indexes(self, present):
+        with connection.schema_editor() as editor:
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    if present:
+                        editor.add_index(model, index)
+                    else:
+                        editor.remove_index(model, index)
+        self.analyze()
+
+    def analyze(self):
+        """Refresh planner statistics so plans reflect the current index set"""
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
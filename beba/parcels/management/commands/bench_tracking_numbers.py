@@ -0,0 +1,64 @@
+import multiprocessing
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from parcels.models import NumberSequence
+from parcels.sequences import TrackingNumberAllocator, is_valid_tracking_number
+
+BENCHMARK_SEQUENCE = "benchmark-tracking"
+
+
+def _generate(args):
+    count, block_size = args
+    connections.close_all()  # never share the parent's connection after fork
+    allocator = TrackingNumberAllocator(block_size=block_size, sequence=BENCHMARK_SEQUENCE)
+    numbers = [allocator.next() for _ in range(count)]
+    connections.close_all()
+    return numbers
+
+
+class Command(BaseCommand):
+    help = "Generate tracking numbers across several processes and check there are no collisions."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--total", type=int, default=1_000_000)
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--block-size", type=int, default=1000)
+        parser.add_argument(
+            "--start-method", choices=multiprocessing.get_all_start_methods(),
+            help="How to start the worker processes (default: the platform's)",
+        )
+
+    def handle(self, *args, **options):
+        total, workers = options["total"], options["workers"]
+        if total < 1 or workers < 1:
+            raise CommandError("--total and --workers must be positive")
+
+        shares = [total // workers + (1 if i < total % workers else 0) for i in range(workers)]
+        connections.close_all()
+
+        started = time.monotonic()
+        context = multiprocessing.get_context(options["start_method"])
+        # Spawned workers start from a fresh interpreter and load Django before unpickling _generate
+        with context.Pool(workers, initializer=django.setup) as pool:
+            batches = pool.map(_generate, [(share, options["block_size"]) for share in shares])
+        elapsed = time.monotonic() - started
+
+        unique = set()
+        invalid = 0
+        for batch in batches:
+            unique.update(batch)
+            invalid += sum(1 for number in batch if not is_valid_tracking_number(number))
+        collisions = total - len(unique)
+
+        self.stdout.write(
+            f"{total} numbers from {workers} processes in {elapsed:.2f}s "
+            f"({total / elapsed:,.0f}/sec, {-(-total // options['block_size'])}+ block reservations)"
+        )
+        NumberSequence.objects.filter(name=BENCHMARK_SEQUENCE).delete()
+        if collisions or invalid:
+            raise CommandError(f"{collisions} collisions, {invalid} numbers failed the check digit")
+        self.stdout.write(self.style.SUCCESS("0 collisions, all check digits valid"))
@@ -0,0 +1,67 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from customers.models import Customer
+from locations.models import Location
+from staff.models import Staff
+from parcels.intake import (
+    DEFAULT_CHUNK_SIZE, MANIFEST_FORMATS, detect_format, import_manifest, read_manifest
+)
+
+
+class Command(BaseCommand):
+    help = "Bulk-create parcels, items and their first log entry from a CSV or JSONL merchant manifest."
+
+    def add_arguments(self, parser):
+        parser.add_argument("manifest", help="Path to the manifest file")
+        parser.add_argument("--format", choices=MANIFEST_FORMATS, help="Manifest format (default: from file extension)")
+        parser.add_argument("--merchant", type=int, help="Customer id of the sending merchant")
+        parser.add_argument("--origin", help="location_tag of the origin warehouse, for rows that do not name one")
+        parser.add_argument("--staff", help="employee_id of the staff member recorded on the intake logs")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument("--errors", help="Write rejected rows to this CSV file")
+
+    def handle(self, *args, **options):
+        merchant = origin = staff = None
+        try:
+            if options["merchant"]:
+                merchant = Customer.objects.get(pk=options["merchant"])
+            if options["origin"]:
+                origin = Location.objects.get(location_tag=options["origin"])
+            if options["staff"]:
+                staff = Staff.objects.get(employee_id=options["staff"])
+        except (Customer.DoesNotExist, Location.DoesNotExist, Staff.DoesNotExist) as exc:
+            raise CommandError(str(exc))
+
+        fmt = options["format"] or detect_format(options["manifest"])
+        try:
+            with open(options["manifest"], newline="", encoding="utf-8") as stream:
+                result = import_manifest(
+                    read_manifest(stream, fmt),
+                    sender_customer=merchant,
+                    origin=origin,
+                    staff=staff,
+                    chunk_size=options["chunk_size"],
+                )
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        if options["errors"] and result.errors:
+            with open(options["errors"], "w", newline="", encoding="utf-8") as report:
+                writer = csv.writer(report)
+                writer.writerow(["line", "error"])
+                writer.writerows(result.errors)
+        else:
+            for line, message in result.errors[:20]:
+                self.stderr.write(f"line {line}: {message}")
+            if len(result.errors) > 20:
+                self.stderr.write(f"... and {len(result.errors) - 20} more (use --errors to save them all)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result.created} parcels ({result.items} items), {len(result.errors)} rows rejected "
+            f"in {result.elapsed:.2f}s ({result.rate:.0f} parcels/sec)"
+        ))
+        if result.truncated:
+            line, message = result.errors[-1]
+            raise CommandError(f"{options['manifest']}, line {line}: {message}")
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.7 on 2026-10-17 22:52
+
+from django.db import migrations, models
+
+
+def blank_codes_to_null(apps, schema_editor):
+    Parcel = apps.get_model('parcels', 'Parcel')
+    Parcel.objects.filter(pickup_code='').update(pickup_code=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parcels', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='parcel',
+            name='pickup_code',
+            field=models.CharField(blank=True, max_length=10, null=True, unique=True),
+        ),
+        migrations.RunPython(blank_codes_to_null, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.7 on 2026-10-17 22:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0001_initial'),
+        ('locations', '0003_location_location_tag'),
+        ('parcels', '0004_numbersequence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='parcel',
+            index=models.Index(fields=['status', 'destination_station'], name='parcel_status_dest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parcel',
+            index=models.Index(condition=models.Q(('status', 'at_station')), fields=['destination_station', 'station_arrival_time'], name='parcel_at_station_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parcelhandover',
+            index=models.Index(fields=['parcel', 'timestamp'], name='handover_parcel_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parcellog',
+            index=models.Index(fields=['parcel', 'timestamp'], name='parcellog_parcel_time_idx'),
+        ),
+    ]
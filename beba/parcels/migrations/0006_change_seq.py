@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parcels', '0005_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parcel',
+            name='change_seq',
+            field=models.BigIntegerField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0001_initial'),
+        ('locations', '0003_location_location_tag'),
+        ('parcels', '0006_change_seq'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='parcel',
+            index=models.Index(fields=['sender_customer', 'created_at'], name='parcel_sender_created_idx'),
+        ),
+    ]
@@ -1,6 +1,7 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.utils import timezone
-import secrets
+
+from .states import can_transition
 
 
 class Parcel(models.Model):
@@ -47,12 +48,40 @@ class Parcel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     station_arrival_time = models.DateTimeField(null=True, blank=True)
-    pickup_code = models.CharField(max_length=10, unique=True, blank=True)
+    change_seq = models.BigIntegerField(null=True, blank=True, db_index=True)  # set by transit.sync on every change
+    pickup_code = models.CharField(max_length=10, unique=True, blank=True, null=True)  # NULL until issued, so unissued parcels don't collide
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "destination_station"], name="parcel_status_dest_idx"),
+            # Billing runs walk a month's parcels customer by customer
+            models.Index(fields=["sender_customer", "created_at"], name="parcel_sender_created_idx"),
+            # Station inventory/aging only ever looks at parcels sitting at a station
+            models.Index(
+                fields=["destination_station", "station_arrival_time"],
+                condition=models.Q(status="at_station"),
+                name="parcel_at_station_idx",
+            ),
+        ]
 
     def generate_pickup_code(self):
-        self.pickup_code = secrets.token_hex(4).upper()  # e.g. "A1B2C3D4"
-        self.save()
-        return self.pickup_code
+        """Issue a single code; bulk arrivals go through parcels.pickup.issue_pickup_codes"""
+        from .pickup import MAX_ATTEMPTS, new_pickup_code
+
+        for attempt in range(MAX_ATTEMPTS):
+            self.pickup_code = new_pickup_code()  # e.g. "K7QM2XHP"
+            try:
+                with transaction.atomic():
+                    self.save(update_fields=["pickup_code"])
+            except IntegrityError:
+                if attempt == MAX_ATTEMPTS - 1:
+                    raise
+                continue
+            return self.pickup_code
+
+    def can_transition_to(self, status):
+        """Whether the state machine in parcels.states allows moving to `status`"""
+        return can_transition(self.status, status)
 
     def __str__(self):
         return f"Parcel {self.tracking_number} ({self.get_status_display()})"
@@ -114,6 +143,11 @@ class ParcelHandover(models.Model):
 
     note = models.TextField(blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["parcel", "timestamp"], name="handover_parcel_time_idx"),
+        ]
+
     def __str__(self):
         return f"Handover {self.parcel.tracking_number} ({self.handover_type}) at {self.location}"
     
@@ -138,6 +172,11 @@ class ParcelLog(models.Model):
     staff = models.ForeignKey("staff.Staff", on_delete=models.SET_NULL, null=True, blank=True)
     note = models.TextField(blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["parcel", "timestamp"], name="parcellog_parcel_time_idx"),
+        ]
+
     def __str__(self):
         return f"{self.parcel.tracking_number} - {self.status} at {self.timestamp}"
 
@@ -165,3 +204,11 @@ class ParcelPickup(models.Model):
         elif self.guest_name:
             return f"Pickup for {self.parcel.tracking_number} by guest {self.guest_name}"
         return f"Pickup for {self.parcel.tracking_number}"
+
+class NumberSequence(models.Model):
+    """Named counter that worker processes draw numbers from in blocks (see parcels.sequences)"""
+    name = models.CharField(max_length=50, unique=True)
+    last_value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} at {self.last_value}"
@@ -0,0 +1,188 @@
+import os
+import threading
+from itertools import islice
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, transaction
+from django.db.transaction import TransactionManagementError
+from django.db.models import F
+
+from .models import NumberSequence
+
+DEFAULT_BLOCK_SIZE = getattr(settings, "SEQUENCE_BLOCK_SIZE", 1000)
+
+
+def single_writer_transaction(using=DEFAULT_DB_ALIAS):
+    """
+    True inside atomic() on SQLite. SQLite has one writer at a time, so a
+    private connection would wait on the caller's own write transaction
+    until it failed with "database is locked".
+    """
+    connection = connections[using]
+    return connection.vendor == "sqlite" and connection.in_atomic_block
+
+
+def allocate_block(name, size, using=DEFAULT_DB_ALIAS):
+    """
+    Reserve `size` consecutive values of the named sequence and return them as a range.
+
+    The reservation runs on a private connection and commits immediately, so a
+    rollback in the caller's transaction can never hand the same block out twice.
+    That needs a backend with concurrent writers: on SQLite it must be called
+    outside atomic(), and raises TransactionManagementError otherwise.
+    """
+    if size < 1:
+        raise ValueError("Block size must be at least 1")
+    if single_writer_transaction(using):
+        raise TransactionManagementError(
+            "allocate_block() cannot run inside atomic() on SQLite; use reserve_in_transaction()"
+        )
+
+    table = connections[using].ops.quote_name(NumberSequence._meta.db_table)
+    while True:
+        connection = connections.create_connection(using)
+        try:
+            connection.set_autocommit(False)
+            with connection.cursor() as cursor:
+                # Write first so the row (or SQLite's database) lock is taken before we read
+                cursor.execute(
+                    f"UPDATE {table} SET last_value = last_value + %s WHERE name = %s", [size, name]
+                )
+                if cursor.rowcount == 0:
+                    cursor.execute(
+                        f"INSERT INTO {table} (name, last_value) VALUES (%s, %s)", [name, size]
+                    )
+                cursor.execute(f"SELECT last_value FROM {table} WHERE name = %s", [name])
+                last_value = cursor.fetchone()[0]
+            connection.commit()
+        except IntegrityError:
+            # Another process created the row first; take a block from it instead
+            connection.rollback()
+            continue
+        finally:
+            connection.close()
+        return range(last_value - size + 1, last_value + 1)
+
+
+def reserve_in_transaction(name, size=1, using=DEFAULT_DB_ALIAS):
+    """
+    Reserve `size` values of the named sequence inside the caller's
+    transaction and return them as a range.
+
+    Unlike allocate_block(), the counter row stays locked until the caller
+    commits, so writers are serialised on it and values become visible in
+    the order they were handed out. Keep the call close to the end of the
+    transaction to hold the lock briefly.
+    """
+    if size < 1:
+        raise ValueError("Block size must be at least 1")
+
+    with transaction.atomic(using=using):
+        sequences = NumberSequence.objects.using(using)
+        while not sequences.filter(name=name).update(last_value=F("last_value") + size):
+            try:
+                with transaction.atomic(using=using):
+                    sequences.create(name=name, last_value=size)
+                break
+            except IntegrityError:
+                continue  # created concurrently; the UPDATE will find it now
+        last_value = sequences.filter(name=name).values_list("last_value", flat=True).get()
+    return range(last_value - size + 1, last_value + 1)
+
+
+class BlockAllocator:
+    """
+    Hands out values of a sequence from a locally held block, going to the
+    database only once per `block_size` values. Safe across threads, and a
+    forked child never reuses its parent's block.
+
+    Inside atomic() on SQLite (see single_writer_transaction()) a block
+    cannot be reserved, so only the values needed are reserved, in the
+    caller's transaction; if it rolls back, nothing is left over to reuse.
+    """
+
+    def __init__(self, name, block_size=DEFAULT_BLOCK_SIZE):
+        self.name = name
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._block = iter(())
+
+    def _reserve(self, count):
+        """`count` values from the database, keeping the rest of a block when one can be taken"""
+        if single_writer_transaction():
+            return list(reserve_in_transaction(self.name, count))
+        block = allocate_block(self.name, max(count, self.block_size))
+        self._block = iter(block[count:])
+        return list(block[:count])
+
+    def next(self):
+        return self.take(1)[0]
+
+    def take(self, count):
+        """Return `count` values, topping up with a single reservation if needed"""
+        if count < 1:
+            return []
+        with self._lock:
+            if self._pid != os.getpid():
+                self._block, self._pid = iter(()), os.getpid()
+            values = list(islice(self._block, count))
+            if len(values) < count:
+                values.extend(self._reserve(count - len(values)))
+            return values
+
+
+def luhn_check_digit(number):
+    """Luhn (mod 10) check digit for a non-negative integer or its digit string"""
+    total = 0
+    for position, digit in enumerate(reversed(str(number))):
+        value = int(digit)
+        if position % 2 == 0:
+            value *= 2
+            if value > 9:
+                value -= 9
+        total += value
+    return (10 - total % 10) % 10
+
+
+def format_tracking_number(value, prefix="PRC"):
+    """
+    Encode a sequence value as a tracking number.
+    Format: PRC-NNNNNNNNNNC (10-digit sequence value + Luhn check digit)
+    """
+    digits = f"{value:010d}"
+    return f"{prefix}-{digits}{luhn_check_digit(digits)}"
+
+
+def is_valid_tracking_number(tracking_number, prefix="PRC"):
+    """Check the shape and check digit of a tracking number without touching the database"""
+    head, sep, digits = (tracking_number or "").partition("-")
+    if head != prefix or not sep or len(digits) < 2 or not digits.isdigit():
+        return False
+    return luhn_check_digit(digits[:-1]) == int(digits[-1])
+
+
+class TrackingNumberAllocator:
+    """Collision-free tracking numbers drawn from a block of the '<prefix>-tracking' sequence"""
+
+    def __init__(self, prefix="PRC", block_size=DEFAULT_BLOCK_SIZE, sequence=None):
+        self.prefix = prefix
+        self.sequence = BlockAllocator(sequence or f"{prefix.lower()}-tracking", block_size)
+
+    def next(self):
+        return format_tracking_number(self.sequence.next(), self.prefix)
+
+    def take(self, count):
+        return [format_tracking_number(value, self.prefix) for value in self.sequence.take(count)]
+
+
+_tracking_allocators = {}
+_tracking_allocators_lock = threading.Lock()
+
+
+def tracking_allocator(prefix="PRC"):
+    """Process-wide allocator for a tracking number prefix"""
+    with _tracking_allocators_lock:
+        if prefix not in _tracking_allocators:
+            _tracking_allocators[prefix] = TrackingNumberAllocator(prefix)
+        return _tracking_allocators[prefix]
@@ -0,0 +1,76 @@
+from types import MappingProxyType
+
+# Where a parcel may go from each status. Edit this table, everything below is derived from it.
+TRANSITIONS = {
+    "packed": ("in_transit", "cancelled"),
+    "in_transit": ("at_station", "returned_station", "returned_warehouse"),
+    "at_station": ("out_for_delivery", "delivered", "in_transit", "returned_warehouse", "cancelled"),
+    "out_for_delivery": ("delivered", "returned_station"),
+    "delivered": (),
+    "returned_station": ("out_for_delivery", "delivered", "in_transit", "returned_warehouse"),
+    "returned_warehouse": ("packed", "in_transit", "cancelled"),
+    "cancelled": (),
+}
+
+INITIAL_STATUS = "packed"
+
+# Precomputed, read-only lookup tables
+ALLOWED_TARGETS = MappingProxyType({
+    source: frozenset(targets) for source, targets in TRANSITIONS.items()
+})
+ALLOWED_SOURCES = MappingProxyType({
+    target: frozenset(source for source, targets in TRANSITIONS.items() if target in targets)
+    for target in TRANSITIONS
+})
+VALID_TRANSITIONS = frozenset(
+    (source, target) for source, targets in TRANSITIONS.items() for target in targets
+)
+
+_hooks = {status: [] for status in TRANSITIONS}
+
+
+class InvalidTransition(ValueError):
+    """Raised when a parcel cannot move from one status to another"""
+
+
+def allowed_sources(target):
+    """Statuses a parcel may be in to move to `target`, e.g. for status__in= filters"""
+    try:
+        return ALLOWED_SOURCES[target]
+    except KeyError:
+        raise InvalidTransition(f"Unknown parcel status '{target}'")
+
+
+def can_transition(source, target):
+    return (source, target) in VALID_TRANSITIONS
+
+
+def check_transition(source, target):
+    """Raise InvalidTransition unless `source` -> `target` is allowed"""
+    allowed_sources(target)
+    if not can_transition(source, target):
+        raise InvalidTransition(f"A parcel cannot go from '{source}' to '{target}'")
+
+
+def on_transition(target):
+    """
+    Register a side effect for parcels entering `target`:
+
+        @on_transition("at_station")
+        def notify_recipients(parcel_ids, staff=None, location=None, timestamp=None):
+            ...
+
+    Hooks receive the ids of the parcels that actually changed and run inside
+    the transaction that changed them, after the status update and logs.
+    """
+    allowed_sources(target)
+
+    def register(hook):
+        _hooks[target].append(hook)
+        return hook
+    return register
+
+
+def run_hooks(target, parcel_ids, staff=None, location=None, timestamp=None):
+    for hook in _hooks[target]:
+        hook(parcel_ids, staff=staff, location=location, timestamp=timestamp)
@@ -1,3 +1,242 @@
-from django.test import TestCase
+import io
+from decimal import Decimal
+from unittest import skipIf
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.transaction import TransactionManagementError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.urls import reverse
+
+from locations.models import Location
+from orders.models import Item
+from staff.models import Staff
+from . import states
+from .intake import import_manifest, read_manifest
+from .models import NumberSequence, Parcel, ParcelLog
+from .sequences import (
+    BlockAllocator, allocate_block, format_tracking_number, is_valid_tracking_number, reserve_in_transaction,
+)
+from .states import InvalidTransition, allowed_sources, can_transition, check_transition, on_transition
+from .utils import bulk_update_status, update_parcel_status
+
+
+class StateMachineTests(SimpleTestCase):
+    def test_sources_are_derived_from_the_transition_table(self):
+        self.assertEqual(allowed_sources("out_for_delivery"), {"at_station", "returned_station"})
+        self.assertEqual(allowed_sources("packed"), {"returned_warehouse"})
+
+    def test_rejects_moves_the_table_does_not_allow(self):
+        self.assertTrue(can_transition("packed", "in_transit"))
+        self.assertFalse(can_transition("delivered", "in_transit"))
+        with self.assertRaisesMessage(InvalidTransition, "cannot go from 'delivered'"):
+            check_transition("delivered", "in_transit")
+        with self.assertRaisesMessage(InvalidTransition, "Unknown parcel status"):
+            check_transition("packed", "lost")
+
+
+class StatusUpdateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.parcels = Parcel.objects.bulk_create([
+            Parcel(tracking_number=f"ST-{status}", weight=Decimal("1"), status=status)
+            for status in ("packed", "in_transit", "delivered")
+        ])
+
+    def test_bulk_update_moves_only_eligible_parcels(self):
+        entered = []
+        hook = on_transition("at_station")(lambda parcel_ids, **context: entered.extend(parcel_ids))
+        self.addCleanup(states._hooks["at_station"].remove, hook)
+
+        location = Location.objects.create(name="Westlands", location_tag="WL", location_type="pickup_station",
+                                           address="-", city="Nairobi")
+        changed = bulk_update_status(self.parcels, "at_station", location=location)
+        self.assertEqual(changed, 1)
+        moved = Parcel.objects.get(status="at_station")
+        self.assertEqual((moved.tracking_number, moved.current_location), ("ST-in_transit", "Westlands"))
+        self.assertIsNotNone(moved.station_arrival_time)
+        self.assertEqual(list(ParcelLog.objects.values_list("parcel_id", "status")), [(moved.pk, "at_station")])
+        self.assertEqual(entered, [moved.pk])
+        self.assertIsNotNone(moved.change_seq)
+
+    def test_single_update_checks_the_transition(self):
+        delivered = self.parcels[2]
+        with self.assertRaises(InvalidTransition):
+            update_parcel_status(delivered, "in_transit")
+        packed = Parcel.objects.get(pk=self.parcels[0].pk)
+        update_parcel_status(packed, "in_transit", note="Loaded")
+        self.assertEqual(packed.logs.get().note, "Loaded")
+
+
+class TrackingNumberTests(SimpleTestCase):
+    def test_check_digit_catches_typos(self):
+        number = format_tracking_number(1234)
+        self.assertEqual(number, "PRC-00000012344")
+        self.assertTrue(is_valid_tracking_number(number))
+        self.assertFalse(is_valid_tracking_number("PRC-00000012345"))
+        self.assertFalse(is_valid_tracking_number("PRC-00000021344"))
+        self.assertFalse(is_valid_tracking_number("XYZ-00000012344"))
+
+
+class SequenceTests(TransactionTestCase):
+    def test_blocks_never_overlap(self):
+        first = allocate_block("test-blocks", 10)
+        second = allocate_block("test-blocks", 5)
+        self.assertEqual((first, second), (range(1, 11), range(11, 16)))
+
+    @skipIf(connection.vendor == "sqlite", "SQLite has a single writer; blocks are reserved outside atomic() there")
+    def test_block_reservations_survive_a_rollback(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            allocate_block("test-rollback", 3)
+            raise RuntimeError
+        self.assertEqual(allocate_block("test-rollback", 1), range(4, 5))
+
+    @skipIf(connection.vendor != "sqlite", "Only SQLite refuses a second writer")
+    def test_blocks_are_refused_inside_a_sqlite_transaction(self):
+        with transaction.atomic(), self.assertRaises(TransactionManagementError):
+            allocate_block("test-rollback", 3)
+
+    def test_allocator_hands_out_each_value_once(self):
+        allocator = BlockAllocator("test-allocator", block_size=4)
+        values = [allocator.next() for _ in range(3)] + allocator.take(6) + [allocator.next()]
+        self.assertEqual(values, list(range(1, 11)))
+
+    def test_allocator_works_inside_a_write_transaction(self):
+        allocator = BlockAllocator("test-allocator", block_size=4)
+        self.assertEqual(allocator.next(), 1)
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Parcel.objects.create(tracking_number="SEQ-1", weight=Decimal("1"))
+            values = allocator.take(5)
+            raise RuntimeError
+        self.assertEqual(values, [2, 3, 4, 5, 6])
+        # Nothing reserved in the rolled-back transaction is kept for later
+        expected = [5, 6, 7] if connection.vendor == "sqlite" else [7, 8, 9]
+        self.assertEqual(allocator.take(3), expected)
+
+    def test_in_transaction_reservations_roll_back_with_the_caller(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.assertEqual(reserve_in_transaction("test-gapless", 2), range(1, 3))
+            raise RuntimeError
+        self.assertEqual(reserve_in_transaction("test-gapless", 2), range(1, 3))
+        self.assertEqual(NumberSequence.objects.get(name="test-gapless").last_value, 2)
+
+
+class ManifestIntakeTests(TransactionTestCase):
+    def setUp(self):
+        # bulk_create: no signals, so nothing rebuilds the distance matrix on disk
+        Location.objects.bulk_create([
+            Location(name="Main warehouse", location_tag="WH1", location_type="warehouse", address="-", city="Nairobi"),
+            Location(name="Kisumu station", location_tag="KSM", location_type="pickup_station", address="-", city="Kisumu"),
+        ])
+
+    def import_csv(self, text, **kwargs):
+        return import_manifest(read_manifest(io.StringIO(text), "csv"), **kwargs)
+
+    def test_creates_parcels_items_and_first_logs(self):
+        result = self.import_csv(
+            "destination_station,weight,fragile,item_name,item_quantity,item_value\n"
+            "KSM,2.5,yes,Phone,2,15000\n"
+            "KSM,1,,,,\n",
+            origin=Location.objects.get(location_tag="WH1"),
+        )
+        self.assertEqual((result.created, result.items, result.errors), (2, 1, []))
+        parcels = Parcel.objects.order_by("pk")
+        self.assertTrue(all(is_valid_tracking_number(parcel.tracking_number) for parcel in parcels))
+        self.assertEqual([parcel.status for parcel in parcels], ["packed", "packed"])
+        self.assertEqual(parcels[0].current_location, "Main warehouse")
+        self.assertTrue(parcels[0].fragile)
+        self.assertEqual(Item.objects.get().quantity, 2)
+        self.assertEqual(ParcelLog.objects.count(), 2)
+
+    def test_reports_bad_rows_without_aborting(self):
+        result = self.import_csv(
+            "tracking_number,destination_station,weight,item_name,item_value\n"
+            "TN-1,KSM,1,,\n"
+            "TN-2,KSM,NaN,,\n"
+            "TN-3,KSM,1e30,,\n"
+            "TN-4,KSM,999999.995,,\n"
+            "TN-5,KSM,0.001,,\n"
+            "TN-6,XXX,1,,\n"
+            "TN-1,KSM,1,,\n"
+            "TN-7,KSM,1,Gold,sNaN\n"
+            "TN-8,KSM,1,Laptop,99999999.99\n"
+        )
+        self.assertEqual(result.created, 2)
+        self.assertEqual(
+            [(line, message.split(":")[0]) for line, message in result.errors],
+            [
+                (3, "'weight' is not a number"),
+                (4, "'weight' is too large"),
+                (5, "'weight' is too large"),
+                (6, "'weight' must be greater than zero"),
+                (7, "Unknown destination_station location 'XXX'"),
+                (8, "Duplicate tracking number TN-1 in manifest"),
+                (9, "'value' is not a number"),
+            ],
+        )
+        self.assertEqual(sorted(Parcel.objects.values_list("tracking_number", flat=True)), ["TN-1", "TN-8"])
+
+    def test_existing_tracking_numbers_are_reported(self):
+        self.import_csv("tracking_number,weight\nTN-9,1\n")
+        result = self.import_csv("tracking_number,weight\nTN-9,1\nTN-10,1\n")
+        self.assertEqual(result.created, 1)
+        self.assertEqual(result.errors, [(2, "Tracking number TN-9 already exists")])
+
+    def test_rejects_ids_and_quantities_int_cannot_store(self):
+        result = self.import_csv(
+            "recipient,weight,item_name,item_quantity\n"
+            "\u00b2,1,,\n"
+            f"{2 ** 63},1,,\n"
+            ",1,Phone,\u00b2\n"
+            f",1,Phone,{2 ** 31}\n"
+            ",1,Phone,0\n"
+        )
+        self.assertEqual(result.created, 0)
+        self.assertEqual(
+            [(line, message.split(":")[0]) for line, message in result.errors],
+            [
+                (2, "'recipient' must be a whole number up to 9223372036854775807"),
+                (3, "'recipient' must be a whole number up to 9223372036854775807"),
+                (4, "'quantity' must be a whole number up to 2147483647"),
+                (5, "'quantity' must be a whole number up to 2147483647"),
+                (6, "Item quantity must be at least 1"),
+            ],
+        )
+
+    def test_stops_at_an_unreadable_manifest(self):
+        body = b"tracking_number,weight\nTN-1,1\nTN-2,\xff\n"
+        stream = io.TextIOWrapper(io.BytesIO(body), encoding="utf-8", newline="")
+        result = import_manifest(read_manifest(stream, "csv"))
+        self.assertTrue(result.truncated)
+        self.assertEqual(result.created, 0)
+        self.assertIn("not valid UTF-8", result.errors[0][1])
+
+        # Fields over csv.field_size_limit() make the reader give up
+        result = self.import_csv(f"tracking_number,weight\nTN-3,1\nTN-4,{'9' * 200_000}\n")
+        self.assertEqual((result.created, result.truncated), (1, True))
+        self.assertEqual(result.errors[0][0], 3)
+        self.assertIn("not valid CSV", result.errors[0][1])
+
+    def test_reads_json_lines(self):
+        stream = io.StringIO('{"weight": 3, "items": [{"name": "Shoes"}]}\nnot json\n[1]\n')
+        result = import_manifest(read_manifest(stream, "jsonl"))
+        self.assertEqual(result.created, 1)
+        self.assertEqual([line for line, message in result.errors], [2, 3])
+
+
+class ParcelTimelineViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user("clerk")
+        Staff.objects.create(user=user, role="warehouse", employee_id="clerk")
+        cls.user = user
+        cls.parcel = Parcel.objects.create(tracking_number="TL-1", weight=Decimal("1"))
+
+    def test_looks_parcels_up_by_id_and_rejects_other_ids(self):
+        self.client.force_login(self.user)
+        url = reverse("parcels:parcel_timelines")
+        response = self.client.get(url, {"id": self.parcel.pk})
+        self.assertEqual([row["tracking_number"] for row in response.json()["parcels"]], ["TL-1"])
+        for value in ("\u00b2", "abc", str(2 ** 63)):
+            with self.subTest(id=value):
+                self.assertEqual(self.client.get(url, {"id": value}).status_code, 400)
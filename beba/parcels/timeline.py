@@ -0,0 +1,140 @@
+from collections import defaultdict
+
+from django.db.models import F
+
+from transit.models import DeliveryLog, TransitLog
+from .models import ParcelExcange, ParcelHandover, ParcelLog, ParcelPickup, ReturnRequest
+
+MAX_BATCH_SIZE = 500
+
+HANDOVER_LABELS = dict(ParcelHandover.HANDOVER_TYPES)
+RETURN_REASONS = dict(ReturnRequest.RETURN_REASONS)
+
+
+def _event(kind, timestamp, summary, location="", staff="", note=""):
+    return {
+        "kind": kind,
+        "timestamp": timestamp,
+        "summary": summary,
+        "location": location or "",
+        "staff": staff or "",
+        "note": note or "",
+    }
+
+
+def _status_events(parcel_ids):
+    rows = ParcelLog.objects.filter(parcel_id__in=parcel_ids).values_list(
+        "parcel_id", "timestamp", "status", "location", "staff__user__username", "note"
+    )
+    for parcel_id, timestamp, status, location, staff, note in rows:
+        yield parcel_id, _event("status", timestamp, status, location, staff, note)
+
+
+def _handover_events(parcel_ids):
+    rows = ParcelHandover.objects.filter(parcel_id__in=parcel_ids).values_list(
+        "parcel_id", "timestamp", "handover_type", "location__name",
+        "from_staff__user__username", "to_staff__user__username", "to_customer__name", "note",
+    )
+    for parcel_id, timestamp, handover_type, location, from_staff, to_staff, to_customer, note in rows:
+        receiver = to_staff or to_customer
+        summary = HANDOVER_LABELS.get(handover_type, handover_type)
+        if receiver:
+            summary = f"{summary} ({receiver})"
+        yield parcel_id, _event("handover", timestamp, summary, location, from_staff, note)
+
+
+def _exchange_events(parcel_ids):
+    rows = ParcelExcange.objects.filter(parcel_id__in=parcel_ids).values_list(
+        "parcel_id", "timestamp", "from_station__name", "to_station__name",
+        "from_recipient__name", "to_recipient__name", "switched_by__user__username", "note",
+    )
+    for parcel_id, timestamp, from_station, to_station, from_recipient, to_recipient, staff, note in rows:
+        changes = []
+        if from_station != to_station:
+            changes.append(f"station {from_station or '—'} → {to_station or '—'}")
+        if from_recipient != to_recipient:
+            changes.append(f"recipient {from_recipient or '—'} → {to_recipient or '—'}")
+        summary = "Switched " + ", ".join(changes) if changes else "Switched"
+        yield parcel_id, _event("exchange", timestamp, summary, to_station, staff, note)
+
+
+def _return_events(parcel_ids):
+    rows = ReturnRequest.objects.filter(parcel_id__in=parcel_ids).values_list(
+        "parcel_id", "initiated_at", "completed_at", "reason",
+        "return_to_station__name", "initiated_by__user__username", "description",
+    )
+    for parcel_id, initiated_at, completed_at, reason, station, staff, description in rows:
+        reason = RETURN_REASONS.get(reason, reason)
+        yield parcel_id, _event("return", initiated_at, f"Return requested: {reason}", station, staff, description)
+        if completed_at:
+            yield parcel_id, _event("return", completed_at, "Return completed", station)
+
+
+def _transit_events(parcel_ids):
+    # One join through the TransitAssignment.parcels table yields a row per (log, parcel).
+    # GPS pings (recorded_at set) are position history, not events.
+    rows = (
+        TransitLog.objects.filter(assignment__parcels__in=parcel_ids, recorded_at__isnull=True)
+        .annotate(parcel_id=F("assignment__parcels"))
+        .values_list(
+            "parcel_id", "timestamp", "location__name",
+            "assignment__vehicle__plate_number", "assignment__driver__user__username", "note",
+        )
+    )
+    for parcel_id, timestamp, location, plate_number, driver, note in rows:
+        yield parcel_id, _event("transit", timestamp, f"In transit on {plate_number}", location, driver, note)
+
+
+def _delivery_events(parcel_ids):
+    # GPS pings (recorded_at set) are position history, not events
+    rows = DeliveryLog.objects.filter(assignment__parcel_id__in=parcel_ids, recorded_at__isnull=True).values_list(
+        "assignment__parcel_id", "timestamp", "status", "location", "staff__user__username", "note",
+    )
+    for parcel_id, timestamp, status, location, staff, note in rows:
+        yield parcel_id, _event("delivery", timestamp, status, location, staff, note)
+
+
+def _pickup_events(parcel_ids):
+    rows = ParcelPickup.objects.filter(parcel_id__in=parcel_ids).values_list(
+        "parcel_id", "timestamp", "customer__name", "guest_name", "staff__user__username",
+    )
+    for parcel_id, timestamp, customer, guest_name, staff in rows:
+        collector = customer or guest_name
+        summary = f"Picked up by {collector}" if collector else "Picked up"
+        yield parcel_id, _event("pickup", timestamp, summary, staff=staff)
+
+
+EVENT_SOURCES = (
+    _status_events,
+    _handover_events,
+    _exchange_events,
+    _return_events,
+    _transit_events,
+    _delivery_events,
+    _pickup_events,
+)
+
+
+def build_timelines(parcel_ids):
+    """
+    Merge every recorded event for the given parcels into time-ordered lists.
+    Runs one query per event source (len(EVENT_SOURCES)) however long the
+    histories are. Returns {parcel_id: [event, ...]}.
+    """
+    parcel_ids = list(parcel_ids)
+    if len(parcel_ids) > MAX_BATCH_SIZE:
+        raise ValueError(f"At most {MAX_BATCH_SIZE} parcels per batch")
+
+    timelines = defaultdict(list)
+    for source in EVENT_SOURCES:
+        for parcel_id, event in source(parcel_ids):
+            timelines[parcel_id].append(event)
+    for events in timelines.values():
+        events.sort(key=lambda event: event["timestamp"])
+    return {parcel_id: timelines.get(parcel_id, []) for parcel_id in parcel_ids}
+
+
+def build_timeline(parcel):
+    """Unified event history for a single parcel (or parcel id)"""
+    parcel_id = getattr(parcel, "pk", parcel)
+    return build_timelines([parcel_id])[parcel_id]
@@ -0,0 +1,12 @@
+# urls.py
+
+from django.urls import path
+from . import views
+
+app_name = "parcels"
+
+urlpatterns = [
+    path('manifests/', views.ManifestUploadView.as_view(), name='manifest_upload'),
+    path('timelines/', views.ParcelTimelineView.as_view(), name='parcel_timelines'),
+    path('pickups/verify/', views.PickupVerifyView.as_view(), name='pickup_verify'),
+]
@@ -1,31 +1,90 @@
-import uuid
-import datetime
-from .models import ParcelHandover
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from .models import Parcel, ParcelHandover, ParcelLog
+from .sequences import tracking_allocator
+from .states import allowed_sources, check_transition, run_hooks
 
 def generate_tracking_number(prefix="PRC"):
     """
     Generate a unique tracking number for a parcel.
-    Format: PRC-YYYYMMDD-XXXX
+    Format: PRC-NNNNNNNNNNC (sequence value + check digit, see parcels.sequences)
+    """
+    return tracking_allocator(prefix).next()
+
+def generate_tracking_numbers(count, prefix="PRC"):
     """
-    date_str = datetime.datetime.now().strftime("%Y%m%d")
-    random_str = uuid.uuid4().hex[:6].upper()
-    return f"{prefix}-{date_str}-{random_str}"
+    Generate `count` unique tracking numbers at once, for bulk creation.
+    """
+    return tracking_allocator(prefix).take(count)
 
 def update_parcel_status(parcel, new_status, staff=None, note=""):
     """
     Update the status of a parcel and log the change.
+    Raises InvalidTransition if the parcel cannot move to `new_status`.
     """
-    parcel.status = new_status
-    parcel.save()
+    check_transition(parcel.status, new_status)
+    with transaction.atomic():
+        parcel.status = new_status
+        parcel.save(update_fields=["status", "updated_at"])
 
-    # Log the change
-    parcel.logs.create(
-        status=new_status,
-        staff=staff,
-        note=note
-    )
+        # Log the change
+        log = parcel.logs.create(
+            status=new_status,
+            staff=staff,
+            note=note
+        )
+        run_hooks(new_status, [parcel.pk], staff=staff, timestamp=log.timestamp)
     return parcel
 
+def bulk_update_status(parcels, new_status, staff=None, location=None, note=""):
+    """
+    Move many parcels to a new status in one transaction: one UPDATE for the
+    parcels and one bulk insert of their ParcelLog rows.
+    - parcels: a Parcel queryset, or an iterable of parcel ids / Parcel instances
+    - location: optional Location; recorded on the logs and as current_location
+    Only parcels whose current status may move to `new_status` (see
+    parcels.states) are changed; the rest are filtered out in SQL and left
+    alone. Transition hooks run for the changed parcels inside the same
+    transaction. Returns the number changed.
+    """
+    sources = allowed_sources(new_status)
+    if isinstance(parcels, QuerySet):
+        queryset = parcels
+    else:
+        ids = [getattr(parcel, "pk", parcel) for parcel in parcels]
+        queryset = Parcel.objects.filter(pk__in=ids)
+
+    with transaction.atomic():
+        ids = list(
+            queryset.filter(status__in=sources)
+            .select_for_update()
+            .values_list("pk", flat=True)
+        )
+        if not ids:
+            return 0
+
+        now = timezone.now()
+        changes = {"status": new_status, "updated_at": now}
+        if location is not None:
+            changes["current_location"] = location.name
+        if new_status == "at_station":
+            changes["station_arrival_time"] = now
+        Parcel.objects.filter(pk__in=ids).update(**changes)
+
+        ParcelLog.objects.bulk_create([
+            ParcelLog(
+                parcel_id=parcel_id,
+                status=new_status,
+                location=location.name if location is not None else "",
+                staff=staff,
+                note=note,
+            )
+            for parcel_id in ids
+        ])
+        run_hooks(new_status, ids, staff=staff, location=location, timestamp=now)
+    return len(ids)
 
 
 def assign_parcel_handover(parcel, from_staff, to_staff, location, handover_type, note=""):
@@ -42,8 +101,6 @@ def assign_parcel_handover(parcel, from_staff, to_staff, location, handover_type
     )
     return handover
 
-from .models import Parcel
-from parcels.utils import generate_tracking_number
 
 def create_parcel(customer, origin, destination, weight=0.0, value=0.0, items=None):
     """
@@ -1,10 +1,38 @@
+import io
+
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import HttpResponseForbidden
+from django.http import HttpResponseForbidden, JsonResponse
 from django.views import View
+from django.db.models import Q
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from orders.models import Item
 from django.views.generic import ListView, DetailView
 from .models import Parcel, ParcelHandover
-from .forms import ParcelForm, ItemForm
+from .forms import ParcelForm, ItemForm, ManifestUploadForm, PickupVerifyForm
+from .intake import detect_format, import_manifest, read_manifest
+from .pickup import PickupError, redeem_pickup_code
+from .timeline import MAX_BATCH_SIZE, build_timelines
+from transit.eta import fill_expected_delivery_dates
+
+MAX_PARCEL_ID = 2 ** 63 - 1  # BigAutoField
+
+
+class ParcelPermissionMixin(UserPassesTestMixin):
+    """Parcel operations are open to warehouse staff, managers and admins"""
+    allowed_roles = ("warehouse", "manager", "admin")
+
+    def test_func(self):
+        user = self.request.user
+        if user.is_superuser:
+            return True
+        try:
+            return user.staff_profile.role in self.allowed_roles and user.staff_profile.active
+        except AttributeError:
+            return False
+
+    def handle_no_permission(self):
+        return JsonResponse({"error": "You do not have permission to manage parcels."}, status=403)
+
 
 class ParcelCreateView(View):
     def get(self, request):
@@ -16,6 +44,7 @@ class ParcelCreateView(View):
         if form.is_valid():
             parcel = form.save(commit=False)
             parcel.created_by = request.user  # track who created
+            fill_expected_delivery_dates([parcel])
             parcel.save()
             return redirect("parcel_detail", pk=parcel.pk)
         return render(request, "parcels/parcel_form.html", {"form": form})
@@ -60,4 +89,84 @@ def record_handover(request, parcel_id):
         )
         return redirect("parcel_detail", pk=parcel.pk)
 
-    return render(request, "parcels/handover_form.html", {"parcel": parcel})
\ No newline at end of file
+    return render(request, "parcels/handover_form.html", {"parcel": parcel})
+
+
+class ManifestUploadView(LoginRequiredMixin, ParcelPermissionMixin, View):
+    """Bulk intake: POST a CSV/JSONL manifest, get back a JSON summary"""
+    http_method_names = ["post"]
+    max_reported_errors = 1000
+
+    def post(self, request):
+        form = ManifestUploadForm(request.POST, request.FILES)
+        if not form.is_valid():
+            return JsonResponse({"errors": form.errors}, status=400)
+
+        upload = form.cleaned_data["manifest"]
+        fmt = form.cleaned_data["format"] or detect_format(upload.name)
+        stream = io.TextIOWrapper(upload.file, encoding="utf-8", newline="")
+        result = import_manifest(
+            read_manifest(stream, fmt),
+            sender_customer=form.cleaned_data["sender_customer"],
+            origin=form.cleaned_data["origin"],
+            staff=getattr(request.user, "staff_profile", None),
+        )
+        return JsonResponse(result.as_dict(max_errors=self.max_reported_errors))
+
+
+
+class ParcelTimelineView(LoginRequiredMixin, ParcelPermissionMixin, View):
+    """
+    Ops console: unified timelines for up to 500 parcels per request.
+    GET ?tracking_number=...&tracking_number=... (or ?id=...)
+    """
+    allowed_roles = ("warehouse", "station", "manager", "admin")
+
+    def get(self, request):
+        tracking_numbers = request.GET.getlist("tracking_number")
+        ids = request.GET.getlist("id")
+        # isdigit() would let through characters such as "²" that the query cannot use
+        if not all(value.isascii() and value.isdecimal() and int(value) <= MAX_PARCEL_ID for value in ids):
+            return JsonResponse({"error": "id must be a parcel id."}, status=400)
+        if len(tracking_numbers) + len(ids) > MAX_BATCH_SIZE:
+            return JsonResponse({"error": f"At most {MAX_BATCH_SIZE} parcels per request."}, status=400)
+
+        parcels = dict(
+            Parcel.objects.filter(Q(tracking_number__in=tracking_numbers) | Q(pk__in=ids))
+            .values_list("pk", "tracking_number")
+        )
+        timelines = build_timelines(parcels)
+        return JsonResponse({
+            "parcels": [
+                {"tracking_number": parcels[parcel_id], "events": events}
+                for parcel_id, events in timelines.items()
+            ]
+        })
+
+
+class PickupVerifyView(LoginRequiredMixin, ParcelPermissionMixin, View):
+    """Station counter: POST a pickup code to release the parcel to its collector"""
+    http_method_names = ["post"]
+    allowed_roles = ("station", "manager", "admin")
+
+    def post(self, request):
+        form = PickupVerifyForm(request.POST)
+        if not form.is_valid():
+            return JsonResponse({"errors": form.errors}, status=400)
+
+        try:
+            pickup = redeem_pickup_code(
+                form.cleaned_data["code"],
+                staff=getattr(request.user, "staff_profile", None),
+                customer=form.cleaned_data["customer"],
+                guest_name=form.cleaned_data["guest_name"],
+                guest_id=form.cleaned_data["guest_id"],
+            )
+        except PickupError as exc:
+            return JsonResponse({"error": str(exc)}, status=404)
+        return JsonResponse({
+            "tracking_number": pickup.parcel.tracking_number,
+            "status": "delivered",
+            "picked_up_at": pickup.timestamp,
+            "requires_signature": pickup.parcel.requires_signature,
+        })
@@ -1,3 +1,63 @@
-from django.test import TestCase
+import base64
+import json
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.exceptions import BadRequest
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+
+from .models import Staff
+from .views import StaffListView
+
+
+class StaffListPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("root", password="secret")
+        users = User.objects.bulk_create([User(username=f"staff{i:02}") for i in range(45)])
+        Staff.objects.bulk_create([
+            Staff(user=user, role="courier", employee_id=user.username, created_by=cls.admin) for user in users
+        ])
+        # Shared timestamps: only the primary-key tiebreaker keeps pages apart
+        Staff.objects.update(date_joined=timezone.now())
+
+    def page(self, querystring=""):
+        # The list template extends a layout that is not part of this app, so the view is paginated directly
+        request = RequestFactory().get(f"/staff/?{querystring}")
+        request.user = self.admin
+        view = StaffListView()
+        view.setup(request)
+        paginator, page, rows, is_paginated = view.paginate_queryset(view.get_queryset(), view.paginate_by)
+        return [member.pk for member in rows], page
+
+    def test_walks_every_member_once_in_both_directions(self):
+        seen, pages = [], []
+        querystring = ""
+        while querystring is not None:
+            ids, page = self.page(querystring)
+            seen.extend(ids)
+            pages.append(ids)
+            querystring = page.next_querystring
+        self.assertEqual(seen, list(Staff.objects.order_by("-pk").values_list("pk", flat=True)))
+        self.assertEqual([len(ids) for ids in pages], [20, 20, 5])
+
+        second = self.page(self.page()[1].next_querystring)[1]
+        third = self.page(second.next_querystring)[1]
+        self.assertEqual(self.page(third.previous_querystring)[0], pages[1])
+        self.assertEqual(self.page(self.page(third.previous_querystring)[1].previous_querystring)[0], pages[0])
+
+    def test_rejects_a_forged_cursor(self):
+        forged = [
+            {"v": [None, None], "d": "next"},
+            {"v": [[1], 2], "d": "next"},
+            {"v": ["2024-01-01T00:00:00", 2 ** 64], "d": "next"},
+            {"v": ["2024-01-01T00:00:00", "x"], "d": "next"},
+            {"v": ["2024-01-01T00:00:00"], "d": "next"},
+        ]
+        cursors = ["not-a-cursor"] + [base64.urlsafe_b64encode(json.dumps(data).encode()).decode() for data in forged]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor), self.assertRaises(BadRequest):
+                self.page(f"cursor={cursor}")
+
+    def test_records_who_added_a_member(self):
+        self.assertEqual(Staff.objects.filter(created_by=self.admin).count(), 45)
@@ -5,6 +5,7 @@ from django.urls import reverse_lazy
 from django.db.models import Q
 from .form import StaffCreationForm,StaffEditForm
 from .models import Staff
+from beba.pagination import KeysetPaginationMixin
 
 class EditStaffView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
     model = Staff
@@ -78,12 +79,12 @@ class AddStaffView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
         return super().form_invalid(form)
 
 
-class StaffListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
+class StaffListView(LoginRequiredMixin, UserPassesTestMixin, KeysetPaginationMixin, ListView):
     model = Staff
     template_name = "staff/list_staff.html"  
     context_object_name = "staff_members"    
     paginate_by = 20                         
-    ordering = ['-date_joined']              
+    ordering = ['-date_joined', '-pk']              
 
     def test_func(self):
         """Only managers, admins, or superusers can view the staff list"""
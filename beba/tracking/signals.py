@@ -0,0 +1,40 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from parcels.models import Parcel, ParcelHandover, ParcelLog
+from parcels.states import TRANSITIONS, on_transition
+from transit.models import DeliveryLog
+from .utils import invalidate_parcels, invalidate_tracking
+
+
+@receiver([post_save, post_delete], sender=Parcel)
+def parcel_changed(sender, instance, **kwargs):
+    invalidate_tracking([instance.tracking_number])
+
+
+@receiver([post_save, post_delete], sender=ParcelLog)
+@receiver([post_save, post_delete], sender=ParcelHandover)
+def parcel_event_written(sender, instance, **kwargs):
+    if sender.parcel.is_cached(instance):
+        invalidate_tracking([instance.parcel.tracking_number])
+    else:
+        invalidate_parcels([instance.parcel_id])
+
+
+@receiver([post_save, post_delete], sender=DeliveryLog)
+def delivery_log_written(sender, instance, **kwargs):
+    if instance.recorded_at is not None:
+        return  # GPS ping, not shown in tracking
+    invalidate_tracking(
+        Parcel.objects.filter(delivery_assignments=instance.assignment_id)
+        .values_list("tracking_number", flat=True)
+    )
+
+
+def status_changed(parcel_ids, **context):
+    # Batch status changes bypass model signals, so they invalidate through the state machine
+    invalidate_parcels(parcel_ids)
+
+
+for status in TRANSITIONS:
+    on_transition(status)(status_changed)
@@ -1,3 +1,50 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+
+from parcels.models import Parcel, ParcelLog
+from parcels.utils import bulk_update_status
+from .utils import get_tracking_info, tracking_cache_key
+
+
+class TrackingCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.parcel = Parcel.objects.create(tracking_number="PRC-00000012344", weight=Decimal("1"))
+
+    def setUp(self):
+        cache.clear()
+
+    def lookup(self, tracking_number):
+        return self.client.get(reverse("tracking:tracking_lookup", args=[tracking_number]))
+
+    def test_lookup_is_cached_and_normalised(self):
+        response = self.lookup(" prc-00000012344")
+        self.assertEqual(response.json()["status"], "packed")
+        self.assertIsNotNone(cache.get(tracking_cache_key(self.parcel.tracking_number)))
+        with mock.patch("tracking.utils.build_tracking_info") as build:
+            get_tracking_info(self.parcel.tracking_number)
+        build.assert_not_called()
+        self.assertEqual(self.lookup("PRC-0").status_code, 404)
+
+    def test_changes_invalidate_after_commit(self):
+        get_tracking_info(self.parcel.tracking_number)
+        with self.captureOnCommitCallbacks(execute=True):
+            ParcelLog.objects.create(parcel=self.parcel, status="packed", location="Main warehouse")
+        self.assertEqual(len(get_tracking_info(self.parcel.tracking_number)["timeline"]), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_update_status([self.parcel], "in_transit")
+        info = get_tracking_info(self.parcel.tracking_number)
+        self.assertEqual((info["status"], len(info["timeline"])), ("in_transit", 2))
 
-# Create your tests here.
+    def test_nothing_is_invalidated_before_commit(self):
+        get_tracking_info(self.parcel.tracking_number)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.parcel.current_location = "Nakuru"
+            self.parcel.save()
+            self.assertEqual(get_tracking_info(self.parcel.tracking_number)["current_location"], "")
+        self.assertTrue(callbacks)
@@ -0,0 +1,11 @@
+# urls.py
+
+from django.urls import path
+from . import views
+
+app_name = "tracking"
+
+urlpatterns = [
+    path('', views.TrackParcelView.as_view(), name='track'),
+    path('<str:tracking_number>.json', views.tracking_lookup, name='tracking_lookup'),
+]
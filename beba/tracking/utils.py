@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from parcels.models import Parcel, ParcelLog
+
+TRACKING_CACHE_TIMEOUT = getattr(settings, "TRACKING_CACHE_TIMEOUT", 60 * 60)
+STATUS_LABELS = dict(Parcel.STATUS_CHOICES)
+
+
+def tracking_cache_key(tracking_number):
+    return f"tracking:{tracking_number}"
+
+
+def build_tracking_info(tracking_number):
+    """
+    Load the public tracking payload for a parcel straight from the database.
+    Returns None if there is no such parcel.
+    """
+    parcel = (
+        Parcel.objects.filter(tracking_number=tracking_number)
+        .values(
+            "pk", "tracking_number", "status", "current_location",
+            "destination_station__name", "expected_delivery_date", "updated_at",
+        )
+        .first()
+    )
+    if parcel is None:
+        return None
+
+    logs = (
+        ParcelLog.objects.filter(parcel_id=parcel["pk"])
+        .order_by("timestamp", "pk")
+        .values_list("status", "location", "timestamp")
+    )
+    expected = parcel["expected_delivery_date"]
+    return {
+        "tracking_number": parcel["tracking_number"],
+        "status": parcel["status"],
+        "status_display": STATUS_LABELS.get(parcel["status"], parcel["status"]),
+        "current_location": parcel["current_location"],
+        "destination": parcel["destination_station__name"],
+        "expected_delivery_date": expected.isoformat() if expected else None,
+        "updated_at": parcel["updated_at"].isoformat(),
+        "timeline": [
+            {
+                "status": status,
+                "status_display": STATUS_LABELS.get(status, status),
+                "location": location,
+                "timestamp": timestamp.isoformat(),
+            }
+            for status, location, timestamp in logs
+        ],
+    }
+
+
+def get_tracking_info(tracking_number):
+    """Read-through cached version of build_tracking_info()"""
+    key = tracking_cache_key(tracking_number)
+    info = cache.get(key)
+    if info is None:
+        info = build_tracking_info(tracking_number)
+        if info is not None:
+            cache.set(key, info, TRACKING_CACHE_TIMEOUT)
+    return info
+
+
+def invalidate_tracking(tracking_numbers):
+    """Drop cached tracking info once the current transaction commits"""
+    keys = [tracking_cache_key(number) for number in tracking_numbers if number]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_parcels(parcel_ids):
+    """Same as invalidate_tracking(), for parcels known only by id"""
+    invalidate_tracking(
+        Parcel.objects.filter(pk__in=parcel_ids).values_list("tracking_number", flat=True)
+    )
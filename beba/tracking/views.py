@@ -1,3 +1,25 @@
+from django.http import JsonResponse
 from django.shortcuts import render
+from django.views import View
 
-# Create your views here.
+from .utils import get_tracking_info
+
+
+def tracking_lookup(request, tracking_number):
+    """Public JSON tracking endpoint"""
+    info = get_tracking_info(tracking_number.strip().upper())
+    if info is None:
+        return JsonResponse({"error": "No parcel with that tracking number."}, status=404)
+    return JsonResponse(info)
+
+
+class TrackParcelView(View):
+    template_name = "tracking/track.html"
+
+    def get(self, request):
+        tracking_number = request.GET.get("tracking_number", "").strip().upper()
+        context = {"tracking_number": tracking_number}
+        if tracking_number:
+            context["parcel"] = get_tracking_info(tracking_number)
+            context["not_found"] = context["parcel"] is None
+        return render(request, self.template_name, context)
@@ -0,0 +1,272 @@
+import heapq
+import math
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Q, Sum
+
+from parcels.models import Parcel
+from parcels.states import allowed_sources
+from staff.models import Staff
+from .models import DeliveryAssignment
+from .planning import FALLBACK_DENSITY, FRAGILE_EXCLUDED_TYPES, parse_volume
+from .sync import next_change_seq
+
+OPEN_DELIVERY_STATUSES = ("assigned", "out_for_delivery")
+# A courier is never given more open deliveries than this
+MAX_PARCELS_PER_COURIER = getattr(settings, "DISPATCH_MAX_PARCELS_PER_COURIER", 60)
+# What a courier without an assigned vehicle can carry
+ON_FOOT_MAX_WEIGHT = getattr(settings, "DISPATCH_ON_FOOT_MAX_WEIGHT", 30.0)  # kg
+ON_FOOT_MAX_VOLUME = getattr(settings, "DISPATCH_ON_FOOT_MAX_VOLUME", 0.15)  # m³
+
+
+class DispatchError(Exception):
+    """Raised when a dispatch plan cannot be saved"""
+
+
+def delivery_area(city, address):
+    """Grouping key for a destination: the recipient's city, else the last part of the address"""
+    area = (city or "").strip() or (address or "").rsplit(",", 1)[-1].strip()
+    return area.casefold()
+
+
+class _Run:
+    """A courier's round being filled during dispatch"""
+    __slots__ = ("courier_id", "vehicle_id", "station_id", "count", "weight", "volume",
+                 "max_weight", "max_volume", "takes_fragile", "parcel_ids", "open_count")
+
+    def __init__(self, courier_id, station_id, vehicle, open_count, open_weight):
+        self.courier_id = courier_id
+        self.station_id = station_id
+        self.vehicle_id = vehicle.pk if vehicle else None
+        if vehicle is not None:
+            self.max_weight = float(vehicle.capacity_weight)
+            self.max_volume = float(vehicle.capacity_volume)
+            self.takes_fragile = vehicle.type not in FRAGILE_EXCLUDED_TYPES
+        else:
+            self.max_weight = ON_FOOT_MAX_WEIGHT
+            self.max_volume = ON_FOOT_MAX_VOLUME
+            self.takes_fragile = True
+        self.open_count = open_count
+        self.count = open_count
+        self.weight = float(open_weight or 0)
+        self.volume = self.weight / FALLBACK_DENSITY  # parcels already out are only known by weight here
+        self.parcel_ids = []
+
+    @property
+    def full(self):
+        return self.count >= MAX_PARCELS_PER_COURIER
+
+    def fits(self, weight, volume, fragile):
+        if self.full or (fragile and not self.takes_fragile):
+            return False
+        return self.weight + weight <= self.max_weight and self.volume + volume <= self.max_volume
+
+    def add(self, parcel_id, weight, volume):
+        self.parcel_ids.append(parcel_id)
+        self.count += 1
+        self.weight += weight
+        self.volume += volume
+
+    def as_dict(self):
+        return {
+            "courier": self.courier_id,
+            "station": self.station_id,
+            "vehicle": self.vehicle_id,
+            "already_open": self.open_count,
+            "assigned": len(self.parcel_ids),
+            "weight": round(self.weight, 2),
+            "weight_used": round(self.weight / self.max_weight, 3) if self.max_weight else None,
+        }
+
+
+class DispatchPlan:
+    """Outcome of plan_dispatch(): each courier's new parcels plus those left over"""
+
+    def __init__(self, runs, parcels, unassigned, elapsed):
+        self.runs = [run for run in runs if run.parcel_ids]
+        self.parcels = parcels  # parcel_id -> (station_id, address, area, requires_signature)
+        self.unassigned = unassigned  # [(parcel_id, reason)]
+        self.elapsed = elapsed
+        self.assignments = []
+
+    @property
+    def planned(self):
+        return sum(len(run.parcel_ids) for run in self.runs)
+
+    @transaction.atomic
+    def save(self, departure_time):
+        """
+        Create the DeliveryAssignments in bulk. Parcels that were assigned
+        or moved on since planning are skipped; returns the assignments made.
+        Home addresses are free text, so destination coordinates stay empty
+        until something geocodes them; the route optimizer reports such
+        stops as unlocated.
+        """
+        if self.assignments:
+            raise DispatchError("This plan has already been saved.")
+        planned = [pk for run in self.runs for pk in run.parcel_ids]
+        still_eligible = set(
+            dispatchable_parcels().filter(pk__in=planned).select_for_update().values_list("pk", flat=True)
+        )
+        change_seq = next_change_seq()  # bulk_create skips the pre_save stamp
+        assignments = []
+        for run in self.runs:
+            for parcel_id in run.parcel_ids:
+                if parcel_id not in still_eligible:
+                    continue
+                station_id, address, area, requires_signature = self.parcels[parcel_id]
+                assignments.append(DeliveryAssignment(
+                    parcel_id=parcel_id,
+                    courier_id=run.courier_id,
+                    vehicle_id=run.vehicle_id,
+                    origin_id=station_id,
+                    destination_address=address,
+                    destination_city=area[:100],
+                    departure_time=departure_time,
+                    requires_signature=requires_signature,
+                    change_seq=change_seq,
+                ))
+        self.assignments = DeliveryAssignment.objects.bulk_create(assignments, batch_size=1000)
+        return self.assignments
+
+    def as_dict(self):
+        return {
+            "planned": self.planned,
+            "couriers": len(self.runs),
+            "unassigned": len(self.unassigned),
+            "elapsed": round(self.elapsed, 3),
+            "runs": [run.as_dict() for run in self.runs],
+        }
+
+
+def dispatchable_parcels(stations=None):
+    """Home-delivery parcels waiting at a station with no open delivery assignment"""
+    open_assignment = DeliveryAssignment.objects.filter(parcel=OuterRef("pk"), status__in=OPEN_DELIVERY_STATUSES)
+    parcels = (
+        Parcel.objects.filter(status__in=allowed_sources("out_for_delivery"), destination_station__isnull=False)
+        .exclude(Q(home_delivery_location__isnull=True) | Q(home_delivery_location=""))
+        .exclude(Exists(open_assignment))
+    )
+    if stations is not None:
+        parcels = parcels.filter(destination_station__in=stations)
+    return parcels
+
+
+def available_couriers(stations=None):
+    """Active couriers based at a station, with their open delivery count and weight"""
+    couriers = (
+        Staff.objects.filter(role="courier", active=True, location__isnull=False)
+        .select_related("assigned_vehicle")
+        .annotate(
+            open_count=Count("deliveries", filter=Q(deliveries__status__in=OPEN_DELIVERY_STATUSES)),
+            open_weight=Sum("deliveries__parcel__weight", filter=Q(deliveries__status__in=OPEN_DELIVERY_STATUSES)),
+        )
+        .order_by("pk")
+    )
+    if stations is not None:
+        couriers = couriers.filter(location__in=stations)
+    return couriers
+
+
+def _fill(runs, clusters, unassigned):
+    """
+    Share one station's parcels among its couriers. Areas are handed out
+    largest first; an area's parcels stay with one courier until it reaches
+    the station's fair share (open plus new deliveries over couriers), then
+    the least-loaded courier, kept on top of a min-heap, carries on. Rounds
+    stay geographically tight while the counts stay level.
+    """
+    heap = [(run.count, index) for index, run in enumerate(runs) if not run.full]
+    heapq.heapify(heap)
+    if runs:
+        total = sum(run.count for run in runs) + sum(len(items) for items in clusters.values())
+        fair_share = math.ceil(total / len(runs))
+
+    def take(weight, volume, fragile):
+        """Pop the least-loaded run that can carry the parcel"""
+        skipped = []
+        found = None
+        while heap:
+            count, index = heapq.heappop(heap)
+            if runs[index].fits(weight, volume, fragile):
+                found = index
+                break
+            if not runs[index].full:
+                skipped.append((count, index))
+        for entry in skipped:
+            heapq.heappush(heap, entry)
+        return found
+
+    def give_back(index):
+        if not runs[index].full:
+            heapq.heappush(heap, (runs[index].count, index))
+
+    for area in sorted(clusters, key=lambda area: -len(clusters[area])):
+        current = None
+        for pk, weight, volume, fragile in sorted(clusters[area], key=lambda item: -item[1]):
+            if current is not None:
+                run = runs[current]
+                if run.count >= fair_share or not run.fits(weight, volume, fragile):
+                    give_back(current)
+                    current = None
+            if current is None:
+                current = take(weight, volume, fragile)
+            if current is None:
+                if not runs:
+                    reason = "no courier at the station"
+                elif fragile and not any(run.takes_fragile for run in runs):
+                    reason = "fragile, no courier able to carry it"
+                else:
+                    reason = "no courier with enough capacity"
+                unassigned.append((pk, reason))
+                continue
+            runs[current].add(pk, weight, volume)
+        if current is not None:
+            give_back(current)
+
+
+def plan_dispatch(stations=None, parcels=None, couriers=None):
+    """
+    Assign home-delivery parcels waiting at stations to the couriers based
+    there, balancing open deliveries and keeping each delivery area with as
+    few couriers as possible, within vehicle (or on-foot) capacity. Nothing
+    is written until DispatchPlan.save().
+
+    `parcels` and `couriers` (querysets) default to dispatchable_parcels()
+    and available_couriers(), optionally limited to `stations`.
+    """
+    started = time.perf_counter()
+    if parcels is None:
+        parcels = dispatchable_parcels(stations)
+    if couriers is None:
+        couriers = available_couriers(stations)
+
+    runs_by_station = defaultdict(list)
+    for courier in couriers:
+        runs_by_station[courier.location_id].append(
+            _Run(courier.pk, courier.location_id, courier.assigned_vehicle, courier.open_count, courier.open_weight)
+        )
+
+    details = {}
+    clusters = defaultdict(lambda: defaultdict(list))
+    for pk, station_id, address, city, weight, dimensions, fragile, requires_signature in parcels.values_list(
+        "pk", "destination_station_id", "home_delivery_location", "recipient__city",
+        "weight", "dimensions", "fragile", "requires_signature",
+    ):
+        weight = float(weight)
+        volume = parse_volume(dimensions)
+        if volume is None:
+            volume = weight / FALLBACK_DENSITY
+        area = delivery_area(city, address)
+        details[pk] = (station_id, address, (city or "").strip() or area, requires_signature)
+        clusters[station_id][area].append((pk, weight, volume, fragile))
+
+    unassigned = []
+    for station_id, station_clusters in clusters.items():
+        _fill(runs_by_station[station_id], station_clusters, unassigned)
+
+    runs = [run for station_runs in runs_by_station.values() for run in station_runs]
+    return DispatchPlan(runs, details, unassigned, time.perf_counter() - started)
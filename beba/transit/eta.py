@@ -0,0 +1,257 @@
+import datetime
+import math
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import DeliveryAssignment, RouteDurationStat, RouteStatRefresh, TransitAssignment
+from .sync import settled_change_seq
+
+ANY = "*"  # vehicle_type / priority of rolled-up rows
+NO_VEHICLE = "none"  # deliveries made without a vehicle
+STAGES = ("transit", "delivery")
+# Legs with fewer samples than this are ignored in favour of a broader row
+MIN_SAMPLES = getattr(settings, "ETA_MIN_SAMPLES", 5)
+MAX_LEG_SECONDS = 30 * 24 * 3600  # anything longer is a data-entry error, not a journey
+# Used when there is no usable history for a parcel's route
+DEFAULT_DAYS = getattr(settings, "ETA_DEFAULT_DAYS", {"standard": 3, "express": 2, "overnight": 1})
+DEFAULT_DELIVERY_SECONDS = getattr(settings, "ETA_DEFAULT_DELIVERY_SECONDS", 24 * 3600)
+VERSION_CACHE_KEY = "transit:eta_version"
+VERSION_CHECK_INTERVAL = 60.0
+MAX_AGE = 3600
+DELETE_BATCH = 500
+PRIORITY_BATCH = 500
+
+
+def _transit_samples(legs=None):
+    """(origin_id, destination_id, vehicle_type, seconds, {priorities}) per completed assignment"""
+    rows = TransitAssignment.objects.filter(
+        status="completed", origin__isnull=False, destination__isnull=False, arrival_time__isnull=False,
+    ).values_list("pk", "origin_id", "destination_id", "vehicle__type", "departure_time", "arrival_time")
+    if legs is not None:
+        rows = rows.filter(origin_id__in={origin for origin, destination in legs})
+    samples = {
+        pk: (origin_id, destination_id, vehicle_type, (arrived - departed).total_seconds(), set())
+        for pk, origin_id, destination_id, vehicle_type, departed, arrived in rows.iterator(chunk_size=5000)
+        if legs is None or (origin_id, destination_id) in legs
+    }
+    # Priorities are looked up separately: joining the parcels into the query
+    # above makes it scan the whole M2M table
+    Through = TransitAssignment.parcels.through
+    ids = list(samples)
+    for start in range(0, len(ids), PRIORITY_BATCH):
+        for pk, priority in Through.objects.filter(
+            transitassignment_id__in=ids[start:start + PRIORITY_BATCH]
+        ).values_list("transitassignment_id", "parcel__priority").distinct():
+            samples[pk][4].add(priority)
+    return samples.values()
+
+
+def _delivery_samples(legs=None):
+    rows = DeliveryAssignment.objects.filter(
+        status="delivered", origin__isnull=False, arrival_time__isnull=False,
+    ).values_list("origin_id", "vehicle__type", "departure_time", "arrival_time", "parcel__priority")
+    if legs is not None:
+        rows = rows.filter(origin_id__in={origin for origin, destination in legs})
+    for origin_id, vehicle_type, departed, arrived, priority in rows.iterator(chunk_size=5000):
+        yield origin_id, None, vehicle_type or NO_VEHICLE, (arrived - departed).total_seconds(), {priority}
+
+
+def compute_stats(samples):
+    """
+    RouteDurationStat rows (unsaved) from (origin, destination, vehicle_type,
+    seconds, priorities) samples, including the "*" roll-ups. A transit
+    assignment carrying parcels of several priorities counts once for each.
+    """
+    totals = defaultdict(lambda: [0, 0.0, 0.0])
+    for origin_id, destination_id, vehicle_type, seconds, priorities in samples:
+        if not 0 < seconds <= MAX_LEG_SECONDS:
+            continue
+        keys = {(vehicle_type, ANY), (ANY, ANY)}
+        for priority in priorities:
+            keys.update(((vehicle_type, priority), (ANY, priority)))
+        for vehicle, priority in keys:
+            total = totals[(origin_id, destination_id, vehicle, priority)]
+            total[0] += 1
+            total[1] += seconds
+            total[2] += seconds * seconds
+
+    stats = []
+    for (origin_id, destination_id, vehicle_type, priority), (count, total, squares) in totals.items():
+        mean = total / count
+        stddev = math.sqrt(max(squares / count - mean * mean, 0.0))
+        stats.append(RouteDurationStat(
+            origin_id=origin_id,
+            destination_id=destination_id,
+            vehicle_type=vehicle_type,
+            priority=priority,
+            samples=count,
+            mean_seconds=mean,
+            stddev_seconds=stddev,
+            estimate_seconds=mean + stddev,
+        ))
+    return stats
+
+
+def refresh_stage(stage, full=False):
+    """
+    Recompute the statistics of one stage. Only legs with an assignment
+    changed since the last refresh (by change_seq) are recomputed, each from
+    its whole history, so re-saved assignments are never counted twice.
+    The first run, or `full`, rebuilds everything. Returns (legs, rows).
+    """
+    model = TransitAssignment if stage == "transit" else DeliveryAssignment
+    gather = _transit_samples if stage == "transit" else _delivery_samples
+    state, created = RouteStatRefresh.objects.get_or_create(stage=stage)
+    # Stop short of writes that may still be committing; they are picked up next time
+    top = min(model.objects.aggregate(seq=Max("change_seq"))["seq"] or 0, settled_change_seq())
+
+    if full or not state.last_change_seq:
+        legs = None
+    else:
+        changed = model.objects.filter(change_seq__gt=state.last_change_seq, change_seq__lte=top, origin__isnull=False)
+        if stage == "transit":
+            legs = set(changed.filter(destination__isnull=False).values_list("origin_id", "destination_id"))
+        else:
+            legs = {(origin_id, None) for origin_id in changed.values_list("origin_id", flat=True)}
+
+    stats = compute_stats(gather(legs)) if legs is None or legs else []
+    for stat in stats:
+        stat.stage = stage
+
+    with transaction.atomic():
+        existing = RouteDurationStat.objects.filter(stage=stage)
+        if legs is not None:
+            existing = [
+                pk for pk, origin_id, destination_id in existing.filter(
+                    origin_id__in={origin for origin, destination in legs}
+                ).values_list("pk", "origin_id", "destination_id")
+                if (origin_id, destination_id) in legs
+            ]
+            for start in range(0, len(existing), DELETE_BATCH):
+                RouteDurationStat.objects.filter(pk__in=existing[start:start + DELETE_BATCH]).delete()
+        else:
+            existing.delete()
+        RouteDurationStat.objects.bulk_create(stats, batch_size=1000)
+        state.last_change_seq = top
+        state.save()
+        transaction.on_commit(eta_table.invalidate)
+
+    refreshed = len({(stat.origin_id, stat.destination_id) for stat in stats}) if legs is None else len(legs)
+    return refreshed, len(stats)
+
+
+class EtaTable:
+    """
+    Process-wide {(stage, origin, destination, vehicle_type, priority): seconds}
+    lookup, loaded lazily and reloaded after a refresh. Only rows with at
+    least MIN_SAMPLES samples are kept.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._table = None
+        self._version = None
+        self._built = 0.0
+        self._checked = 0.0
+
+    def invalidate(self):
+        self._table = None
+        try:
+            cache.incr(VERSION_CACHE_KEY)
+        except ValueError:
+            cache.set(VERSION_CACHE_KEY, 1, None)
+
+    def _load(self):
+        return {
+            (stage, origin_id, destination_id, vehicle_type, priority): seconds
+            for stage, origin_id, destination_id, vehicle_type, priority, seconds in RouteDurationStat.objects.filter(
+                samples__gte=MIN_SAMPLES
+            ).values_list("stage", "origin_id", "destination_id", "vehicle_type", "priority", "estimate_seconds")
+        }
+
+    def get(self):
+        now = time.monotonic()
+        table = self._table
+        if table is not None and now - self._checked < VERSION_CHECK_INTERVAL:
+            return table
+        with self._lock:
+            version = cache.get(VERSION_CACHE_KEY)
+            if self._table is None or version != self._version or now - self._built > MAX_AGE:
+                self._table = self._load()
+                self._version = version
+                self._built = now
+            self._checked = now
+            return self._table
+
+
+eta_table = EtaTable()
+
+
+def _lookup(table, stage, origin_id, destination_id, priority, vehicle_type):
+    """The most specific usable estimate for a leg, or None"""
+    # dict.fromkeys drops the repeats when vehicle_type or priority is already ANY
+    for key in dict.fromkeys((
+        (stage, origin_id, destination_id, vehicle_type, priority),
+        (stage, origin_id, destination_id, ANY, priority),
+        (stage, origin_id, destination_id, ANY, ANY),
+    )):
+        seconds = table.get(key)
+        if seconds is not None:
+            return seconds
+    return None
+
+
+def estimate_seconds(origin_id, destination_id, priority="standard", home_delivery=False, vehicle_type=ANY, table=None):
+    """
+    Expected seconds from intake to delivery, or None when the route has no
+    usable history. Parcels delivered to a home add the last-mile leg from
+    the destination station.
+    """
+    if table is None:
+        table = eta_table.get()
+    if origin_id is None or destination_id is None:
+        return None
+    seconds = 0.0
+    if origin_id != destination_id:
+        seconds = _lookup(table, "transit", origin_id, destination_id, priority, vehicle_type)
+        if seconds is None:
+            return None
+    if home_delivery:
+        last_mile = _lookup(table, "delivery", destination_id, None, priority, ANY)
+        seconds += DEFAULT_DELIVERY_SECONDS if last_mile is None else last_mile
+    return seconds
+
+
+def expected_delivery_date(origin_id, destination_id, priority="standard", home_delivery=False, start=None, table=None):
+    start = start or timezone.now()
+    seconds = estimate_seconds(origin_id, destination_id, priority, home_delivery, table=table)
+    if seconds is None:
+        return timezone.localdate(start) + datetime.timedelta(days=DEFAULT_DAYS.get(priority, max(DEFAULT_DAYS.values())))
+    return timezone.localtime(start + datetime.timedelta(seconds=seconds)).date()
+
+
+def fill_expected_delivery_dates(parcels, start=None):
+    """
+    Set expected_delivery_date on (unsaved) parcels that have none, with a
+    dictionary lookup per parcel. Returns how many were filled.
+    """
+    table = eta_table.get()
+    start = start or timezone.now()
+    dates = {}  # parcels of one batch share a handful of routes
+    filled = 0
+    for parcel in parcels:
+        if parcel.expected_delivery_date is not None:
+            continue
+        key = (parcel.origin_id, parcel.destination_station_id, parcel.priority, bool(parcel.home_delivery_location))
+        if key not in dates:
+            dates[key] = expected_delivery_date(*key, start=start, table=table)
+        parcel.expected_delivery_date = dates[key]
+        filled += 1
+    return filled
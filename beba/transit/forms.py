@@ -41,7 +41,7 @@ class DeliveryAssignmentForm(forms.ModelForm):
         model = DeliveryAssignment
         fields = [
             'parcel', 'courier', 'vehicle', 'origin', 'destination_address',
-            'destination_city', 'departure_time', 'arrival_time', 'status',
+            'destination_city', 'destination_latitude', 'destination_longitude', 'departure_time', 'arrival_time', 'status',
             'requires_signature'
         ]
         widgets = {
@@ -0,0 +1,121 @@
+import time
+
+from django.db import transaction
+
+from parcels.models import Parcel, ParcelHandover
+from parcels.states import allowed_sources
+from parcels.utils import bulk_update_status
+from .models import TransitAssignment
+from .sync import stamp_changes
+
+MAX_SCAN_BATCH = 5000
+LOADABLE_ASSIGNMENT_STATUSES = ("scheduled",)
+
+
+class LoadingError(Exception):
+    """Raised when parcels cannot be loaded onto an assignment at all"""
+
+
+class ScanResult:
+    """What happened to each tracking number in one scanned batch"""
+
+    def __init__(self):
+        self.loaded = []
+        self.already_loaded = []
+        self.unknown = []
+        self.rejected = []  # [(tracking_number, status)]
+        self.elapsed = 0.0
+
+    def as_dict(self):
+        return {
+            "loaded": len(self.loaded),
+            "already_loaded": len(self.already_loaded),
+            "unknown": self.unknown,
+            "rejected": [{"tracking_number": number, "status": status} for number, status in self.rejected],
+            "elapsed": round(self.elapsed, 3),
+        }
+
+
+def normalise_tracking_numbers(numbers):
+    """Strip, upper-case and de-duplicate scans, keeping their order"""
+    seen = {}
+    for number in numbers:
+        number = (number or "").strip().upper()
+        if number:
+            seen.setdefault(number, None)
+    return list(seen)
+
+
+def load_parcels(assignment, tracking_numbers, staff=None):
+    """
+    Put scanned parcels on a scheduled transit assignment. One IN query
+    resolves the batch; then, in a single transaction, the M2M rows are
+    bulk-inserted (duplicates ignored), a warehouse_to_driver handover is
+    written per newly loaded parcel and they all move to in_transit.
+    Re-scanning a parcel that is already on board is harmless.
+    """
+    started = time.perf_counter()
+    if assignment.status not in LOADABLE_ASSIGNMENT_STATUSES:
+        raise LoadingError(f"Assignment is {assignment.get_status_display().lower()}; only scheduled ones can be loaded.")
+    numbers = normalise_tracking_numbers(tracking_numbers)
+    if len(numbers) > MAX_SCAN_BATCH:
+        raise LoadingError(f"At most {MAX_SCAN_BATCH} tracking numbers per batch.")
+
+    result = ScanResult()
+    loadable = allowed_sources("in_transit")
+    Through = TransitAssignment.parcels.through
+
+    with transaction.atomic():
+        found = {
+            number: (pk, status)
+            for pk, number, status in Parcel.objects.filter(tracking_number__in=numbers)
+            .select_for_update()
+            .values_list("pk", "tracking_number", "status")
+        }
+        on_board = set(
+            Through.objects.filter(transitassignment_id=assignment.pk, parcel__tracking_number__in=numbers)
+            .values_list("parcel_id", flat=True)
+        )
+
+        to_load = []
+        for number in numbers:
+            if number not in found:
+                result.unknown.append(number)
+                continue
+            pk, status = found[number]
+            if pk in on_board:
+                result.already_loaded.append(number)
+            elif status in loadable:
+                to_load.append(pk)
+                result.loaded.append(number)
+            else:
+                result.rejected.append((number, status))
+
+        if to_load:
+            Through.objects.bulk_create(
+                [Through(transitassignment_id=assignment.pk, parcel_id=pk) for pk in to_load],
+                ignore_conflicts=True,
+            )
+            stamp_changes(TransitAssignment, [assignment.pk])
+            ParcelHandover.objects.bulk_create([
+                ParcelHandover(
+                    parcel_id=pk,
+                    from_staff=staff,
+                    to_staff_id=assignment.driver_id,
+                    handover_type="warehouse_to_driver",
+                    location_id=assignment.origin_id,
+                    from_ack=staff is not None,
+                    note=f"Scanned onto {assignment.vehicle.plate_number}",
+                )
+                for pk in to_load
+            ])
+            bulk_update_status(
+                to_load,
+                "in_transit",
+                staff=staff,
+                location=assignment.origin,
+                note=f"Loaded on {assignment.vehicle.plate_number}",
+            )
+
+    result.elapsed = time.perf_counter() - started
+    return result
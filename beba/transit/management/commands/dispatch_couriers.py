@@ -0,0 +1,69 @@
+import datetime
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from locations.models import Location
+from transit.dispatch import plan_dispatch
+
+
+class Command(BaseCommand):
+    help = (
+        "Assign home-delivery parcels waiting at stations to the couriers based there, balancing "
+        "their open deliveries and grouping them by area. Prints the plan; --save creates the "
+        "delivery assignments."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--station", action="append", help="location_tag of a station to dispatch (repeatable; default: all)")
+        parser.add_argument("--departure", help="Departure time, ISO 8601 (default: now)")
+        parser.add_argument("--save", action="store_true", help="Create the DeliveryAssignment rows")
+        parser.add_argument("--verbose-runs", action="store_true", help="Print every courier's run")
+
+    def handle(self, *args, **options):
+        stations = None
+        if options["station"]:
+            stations = list(Location.objects.filter(location_tag__in=options["station"]))
+            missing = set(options["station"]) - {station.location_tag for station in stations}
+            if missing:
+                raise CommandError(f"Unknown location(s): {', '.join(sorted(missing))}")
+
+        if options["departure"]:
+            departure = parse_datetime(options["departure"])
+            if departure is None:
+                raise CommandError("--departure must be an ISO 8601 date and time")
+            if timezone.is_naive(departure):
+                departure = timezone.make_aware(departure)
+        else:
+            departure = timezone.now()
+
+        plan = plan_dispatch(stations)
+        if options["verbose_runs"]:
+            for run in plan.runs:
+                summary = run.as_dict()
+                self.stdout.write(
+                    f"  courier {summary['courier']:<6} station {summary['station']:<6} "
+                    f"{summary['already_open']:>3} open + {summary['assigned']:>3} new  {summary['weight']:>8.2f} kg"
+                )
+        counts = [run.count for run in plan.runs]
+        if counts:
+            self.stdout.write(f"Deliveries per courier after dispatch: min {min(counts)}, max {max(counts)}")
+        for reason, count in Counter(reason for parcel_id, reason in plan.unassigned).most_common():
+            self.stderr.write(f"{count} parcels not assigned: {reason}")
+
+        if options["save"]:
+            plan.save(departure)
+            unlocated = sum(1 for assignment in plan.assignments if assignment.destination_latitude is None)
+            if unlocated:
+                self.stderr.write(f"{unlocated} assignments have no geocoded address and will not be routed")
+            self.stdout.write(self.style.SUCCESS(
+                f"Created {len(plan.assignments)} delivery assignments for {len(plan.runs)} couriers "
+                f"(planned in {plan.elapsed:.2f}s)"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Planned {plan.planned} parcels for {len(plan.runs)} couriers in {plan.elapsed:.2f}s "
+                f"(dry run, use --save to create the assignments)"
+            ))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from staff.models import Staff
+from transit.models import DeliveryAssignment
+from transit.routing import ROUTABLE_STATUSES, optimize_route
+
+
+class Command(BaseCommand):
+    help = "Order each courier's assigned deliveries for a day into a short route and store the stop sequence."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date", help="Departure date, YYYY-MM-DD (default: today)")
+        parser.add_argument("--courier", action="append", help="employee_id to route (repeatable; default: every courier with deliveries)")
+        parser.add_argument("--open", action="store_true", help="Do not plan the return to the depot")
+        parser.add_argument("--dry-run", action="store_true", help="Report the routes without saving them")
+
+    def handle(self, *args, **options):
+        day = timezone.localdate()
+        if options["date"]:
+            day = parse_date(options["date"])
+            if day is None:
+                raise CommandError("--date must be YYYY-MM-DD")
+
+        couriers = Staff.objects.filter(
+            pk__in=DeliveryAssignment.objects.filter(status__in=ROUTABLE_STATUSES, departure_time__date=day)
+            .values("courier_id")
+        ).select_related("location")
+        if options["courier"]:
+            couriers = couriers.filter(employee_id__in=options["courier"])
+
+        routed = stops = 0
+        saved_km = 0.0
+        for courier in couriers:
+            plan = optimize_route(courier, day, return_to_depot=not options["open"], save=not options["dry_run"])
+            summary = plan.as_dict()
+            self.stdout.write(
+                f"  {summary['courier']:<16} {summary['stops']:>4} stops  "
+                f"{summary['distance_before_km']:>8.1f} -> {summary['distance_after_km']:>8.1f} km  "
+                f"({summary['elapsed'] * 1000:.0f} ms)"
+                + (f"  {summary['unlocated']} without coordinates" if summary["unlocated"] else "")
+            )
+            routed += 1
+            stops += summary["stops"]
+            saved_km += plan.distance_before - plan.distance_after
+
+        verb = "Planned" if options["dry_run"] else "Routed"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {routed} couriers, {stops} stops for {day}; {saved_km:.1f} km shorter than creation order"
+        ))
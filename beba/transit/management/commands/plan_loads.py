@@ -0,0 +1,67 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from locations.models import Location
+from transit.planning import plan_loads
+
+
+def share(used):
+    """A capacity share as a percentage; vehicles without a capacity have none"""
+    return "-" if used is None else f"{used:.0%}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Pack the parcels waiting at an origin onto its available vehicles within their weight "
+        "and volume capacity. Prints the plan; --save creates the transit assignments."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("origin", help="location_tag of the origin warehouse or hub")
+        parser.add_argument("--departure", help="Departure time, ISO 8601 (default: one hour from now)")
+        parser.add_argument("--save", action="store_true", help="Create the TransitAssignment rows")
+
+    def handle(self, *args, **options):
+        try:
+            origin = Location.objects.get(location_tag=options["origin"])
+        except Location.DoesNotExist as exc:
+            raise CommandError(str(exc))
+
+        if options["departure"]:
+            departure = parse_datetime(options["departure"])
+            if departure is None:
+                raise CommandError("--departure must be an ISO 8601 date and time")
+            if timezone.is_naive(departure):
+                departure = timezone.make_aware(departure)
+        else:
+            departure = timezone.now() + datetime.timedelta(hours=1)
+
+        plan = plan_loads(origin)
+        for load in plan.loads:
+            summary = load.as_dict()
+            self.stdout.write(
+                f"  {summary['vehicle']:<12} {summary['parcels']:>6} parcels  "
+                f"{summary['weight']:>10.2f} kg ({share(summary['weight_used'])})  "
+                f"{summary['volume']:>8.3f} m³ ({share(summary['volume_used'])})"
+            )
+        if plan.estimated:
+            self.stdout.write(f"{plan.estimated} parcels had no readable dimensions; volume estimated from weight")
+        if plan.unplaced:
+            self.stderr.write(f"{len(plan.unplaced)} parcels did not fit on any vehicle")
+
+        if options["save"]:
+            plan.save(departure)
+            if plan.skipped:
+                self.stderr.write(f"{plan.skipped} planned parcels were no longer waiting and were left out")
+            self.stdout.write(self.style.SUCCESS(
+                f"Scheduled {len(plan.assignments)} assignments carrying {plan.planned - plan.skipped} parcels "
+                f"(planned in {plan.elapsed:.2f}s)"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Planned {plan.planned} parcels on {len(plan.loads)} vehicles in {plan.elapsed:.2f}s "
+                f"(dry run, use --save to create the assignments)"
+            ))
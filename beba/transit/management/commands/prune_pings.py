@@ -0,0 +1,87 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from transit.models import DeliveryLog, TransitLog
+
+CHUNK_SIZE = 5000
+# Assignments whose pings are thinned per pass; bounds the ids held in memory
+ASSIGNMENT_BATCH = 500
+
+
+class Command(BaseCommand):
+    help = (
+        "Thin out stored GPS pings: past --thin-after days keep one ping per assignment per "
+        "--interval seconds, and past --delete-after days drop them. Status logs are never touched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--thin-after", type=int, default=7, help="Age in days after which pings are thinned")
+        parser.add_argument("--interval", type=int, default=300, help="Seconds between the pings kept when thinning")
+        parser.add_argument("--delete-after", type=int, default=90, help="Age in days after which pings are deleted")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        thin_before = now - datetime.timedelta(days=options["thin_after"])
+        delete_before = now - datetime.timedelta(days=options["delete_after"])
+
+        for model in (TransitLog, DeliveryLog):
+            started = time.monotonic()
+            pings = model.objects.filter(recorded_at__isnull=False)
+            deleted = self.delete_expired(pings.filter(recorded_at__lt=delete_before), options["dry_run"])
+            thinned = self.thin(
+                pings.filter(recorded_at__gte=delete_before, recorded_at__lt=thin_before),
+                options["interval"],
+                options["dry_run"],
+            )
+            self.stdout.write(
+                f"  {model._meta.label}: {deleted} expired, {thinned} thinned "
+                f"in {time.monotonic() - started:.1f}s"
+            )
+        self.stdout.write(self.style.SUCCESS("Dry run, nothing deleted" if options["dry_run"] else "Done"))
+
+    def id_ranges(self, queryset, field, size):
+        """(low, high) bounds covering every `field` value in the queryset, `size` values apart"""
+        bounds = queryset.aggregate(low=Min(field), high=Max(field))
+        if bounds["low"] is None:
+            return
+        for low in range(bounds["low"], bounds["high"] + 1, size):
+            yield low, low + size
+
+    def delete_expired(self, pings, dry_run):
+        """Delete expired pings one primary-key range at a time"""
+        removed = 0
+        for low, high in self.id_ranges(pings, "pk", CHUNK_SIZE):
+            batch = pings.filter(pk__gte=low, pk__lt=high)
+            removed += batch.count() if dry_run else batch.delete()[0]
+        return removed
+
+    def thin(self, pings, interval, dry_run):
+        """
+        Walk pings in (assignment, time) order and drop those within
+        `interval` of the last kept one, a range of assignments at a time
+        """
+        removed = 0
+        for low, high in self.id_ranges(pings, "assignment_id", ASSIGNMENT_BATCH):
+            # Collect first: SQLite does not isolate a running cursor from deletes on the same table
+            doomed = []
+            last_assignment = last_kept = None
+            rows = (
+                pings.filter(assignment_id__gte=low, assignment_id__lt=high)
+                .order_by("assignment_id", "recorded_at", "pk").values_list("pk", "assignment_id", "recorded_at")
+            )
+            for pk, assignment_id, recorded_at in rows.iterator(chunk_size=CHUNK_SIZE):
+                if assignment_id == last_assignment and (recorded_at - last_kept).total_seconds() < interval:
+                    doomed.append(pk)
+                else:
+                    last_assignment, last_kept = assignment_id, recorded_at
+            if dry_run:
+                removed += len(doomed)
+                continue
+            for start in range(0, len(doomed), CHUNK_SIZE):
+                removed += pings.model.objects.filter(pk__in=doomed[start:start + CHUNK_SIZE]).delete()[0]
+        return removed
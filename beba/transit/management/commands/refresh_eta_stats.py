@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from transit.eta import STAGES, refresh_stage
+
+
+class Command(BaseCommand):
+    help = (
+        "Refresh the route duration statistics behind parcel ETAs. Only legs with assignments "
+        "changed since the last run are recomputed; run it nightly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Rebuild every leg from scratch")
+        parser.add_argument("--stage", choices=STAGES, help="Refresh only this stage")
+
+    def handle(self, *args, **options):
+        for stage in [options["stage"]] if options["stage"] else STAGES:
+            started = time.monotonic()
+            legs, rows = refresh_stage(stage, full=options["full"])
+            self.stdout.write(f"{stage}: {legs} legs refreshed, {rows} rows in {time.monotonic() - started:.2f}s")
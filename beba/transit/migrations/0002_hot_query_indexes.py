@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-17 22:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0003_location_location_tag'),
+        ('parcels', '0005_hot_query_indexes'),
+        ('transit', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='deliveryassignment',
+            index=models.Index(fields=['courier', 'status'], name='delivery_courier_status_idx'),
+        ),
+    ]
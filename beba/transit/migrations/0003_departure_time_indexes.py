@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0003_location_location_tag'),
+        ('parcels', '0005_hot_query_indexes'),
+        ('transit', '0002_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='deliveryassignment',
+            index=models.Index(fields=['departure_time', 'id'], name='delivery_departure_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transitassignment',
+            index=models.Index(fields=['departure_time', 'id'], name='transit_departure_idx'),
+        ),
+    ]
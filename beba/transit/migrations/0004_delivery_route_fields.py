@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transit', '0003_departure_time_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliveryassignment',
+            name='destination_latitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='deliveryassignment',
+            name='destination_longitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='deliveryassignment',
+            name='stop_sequence',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0003_location_location_tag'),
+        ('transit', '0004_delivery_route_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliverylog',
+            name='latitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='deliverylog',
+            name='longitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='deliverylog',
+            name='recorded_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='transitlog',
+            name='latitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='transitlog',
+            name='longitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='transitlog',
+            name='recorded_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='deliverylog',
+            index=models.Index(fields=['assignment', 'recorded_at'], name='deliverylog_ping_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transitlog',
+            index=models.Index(fields=['assignment', 'recorded_at'], name='transitlog_ping_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0003_location_location_tag'),
+        ('parcels', '0006_change_seq'),
+        ('transit', '0005_gps_pings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliveryassignment',
+            name='change_seq',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='transitassignment',
+            name='change_seq',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='deliveryassignment',
+            index=models.Index(fields=['courier', 'change_seq'], name='delivery_courier_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transitassignment',
+            index=models.Index(fields=['driver', 'change_seq'], name='transit_driver_sync_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0003_location_location_tag'),
+        ('transit', '0006_change_seq'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteStatRefresh',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stage', models.CharField(max_length=10, unique=True)),
+                ('last_change_seq', models.BigIntegerField(default=0)),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RouteDurationStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stage', models.CharField(choices=[('transit', 'Transit'), ('delivery', 'Delivery')], max_length=10)),
+                ('vehicle_type', models.CharField(max_length=20)),
+                ('priority', models.CharField(max_length=20)),
+                ('samples', models.PositiveIntegerField()),
+                ('mean_seconds', models.FloatField()),
+                ('stddev_seconds', models.FloatField()),
+                ('estimate_seconds', models.FloatField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('destination', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='locations.location')),
+                ('origin', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='locations.location')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['stage', 'origin', 'destination'], name='route_stat_leg_idx')],
+            },
+        ),
+    ]
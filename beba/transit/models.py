@@ -33,6 +33,14 @@ class TransitAssignment(models.Model):
         ("completed", "Completed"),
         ("cancelled", "Cancelled"),
     ], default="scheduled")
+    change_seq = models.BigIntegerField(null=True, blank=True)  # set by transit.sync on every change
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the transit list seeks on (departure_time, id)
+            models.Index(fields=["departure_time", "id"], name="transit_departure_idx"),
+            models.Index(fields=["driver", "change_seq"], name="transit_driver_sync_idx"),
+        ]
 
     def __str__(self):
         return f"{self.vehicle} assigned to {self.driver} ({self.status})"
@@ -45,6 +53,9 @@ class DeliveryAssignment(models.Model):
     origin = models.ForeignKey("locations.Location", on_delete=models.SET_NULL, null=True, blank=True, related_name="delivery_origin")
     destination_address = models.TextField()  # customer’s home address
     destination_city = models.CharField(max_length=100, blank=True)
+    destination_latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    destination_longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    stop_sequence = models.PositiveIntegerField(null=True, blank=True)  # position in the courier's run, set by transit.routing
 
     departure_time = models.DateTimeField()
     arrival_time = models.DateTimeField(null=True, blank=True)
@@ -59,6 +70,14 @@ class DeliveryAssignment(models.Model):
 
     requires_signature = models.BooleanField(default=False)
     signed_off = models.BooleanField(default=False)
+    change_seq = models.BigIntegerField(null=True, blank=True)  # set by transit.sync on every change
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["courier", "status"], name="delivery_courier_status_idx"),
+            models.Index(fields=["departure_time", "id"], name="delivery_departure_idx"),
+            models.Index(fields=["courier", "change_seq"], name="delivery_courier_sync_idx"),
+        ]
 
     def __str__(self):
         return f"Delivery {self.parcel.tracking_number} by {self.courier}"
@@ -70,6 +89,15 @@ class DeliveryLog(models.Model):
     note = models.TextField(blank=True)
     location = models.CharField(max_length=100, blank=True)  # optional GPS or hub/station reference
     staff = models.ForeignKey("staff.Staff", on_delete=models.SET_NULL, null=True, blank=True)
+    # GPS pings from the courier's device (see transit.pings); recorded_at is the device's clock
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    recorded_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["assignment", "recorded_at"], name="deliverylog_ping_idx"),
+        ]
 
     def __str__(self):
         return f"{self.assignment.parcel.tracking_number} - {self.status} at {self.timestamp}"
@@ -79,6 +107,57 @@ class TransitLog(models.Model):
     location = models.ForeignKey("locations.Location", on_delete=models.SET_NULL, null=True, blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
     note = models.TextField(blank=True)
+    # GPS pings from the driver's device (see transit.pings); recorded_at is the device's clock
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    recorded_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["assignment", "recorded_at"], name="transitlog_ping_idx"),
+        ]
 
     def __str__(self):
         return f"TransitLog for {self.assignment.vehicle} at {self.timestamp}"
+
+class RouteDurationStat(models.Model):
+    """
+    How long a leg usually takes, precomputed by transit.eta from completed
+    assignments. "transit" rows are origin -> destination hub legs,
+    "delivery" rows are last-mile runs from the origin station
+    (destination is empty). vehicle_type and priority may be "*" for rows
+    rolled up over all values.
+    """
+    STAGES = [
+        ("transit", "Transit"),
+        ("delivery", "Delivery"),
+    ]
+
+    stage = models.CharField(max_length=10, choices=STAGES)
+    origin = models.ForeignKey("locations.Location", on_delete=models.CASCADE, related_name="+")
+    destination = models.ForeignKey("locations.Location", on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    vehicle_type = models.CharField(max_length=20)
+    priority = models.CharField(max_length=20)
+
+    samples = models.PositiveIntegerField()
+    mean_seconds = models.FloatField()
+    stddev_seconds = models.FloatField()
+    estimate_seconds = models.FloatField()  # what ETAs use: mean plus one standard deviation
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["stage", "origin", "destination"], name="route_stat_leg_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.stage} {self.origin_id}->{self.destination_id} {self.vehicle_type}/{self.priority}: {self.estimate_seconds:.0f}s"
+
+class RouteStatRefresh(models.Model):
+    """Change-sequence watermark of the last ETA statistics refresh, one row per stage"""
+    stage = models.CharField(max_length=10, unique=True)
+    last_change_seq = models.BigIntegerField(default=0)
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.stage} statistics up to change {self.last_change_seq}"
@@ -0,0 +1,300 @@
+import atexit
+import datetime
+import logging
+import threading
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import DeliveryAssignment, DeliveryLog, TransitAssignment, TransitLog
+
+MAX_PINGS_PER_REQUEST = 1000
+# Store at most one ping per assignment per this many seconds; the live
+# position is still updated from every ping
+STORE_INTERVAL = getattr(settings, "GPS_PING_STORE_INTERVAL", 60)
+# Flush buffered pings to the database once this many are waiting or the oldest is this old
+BUFFER_SIZE = getattr(settings, "GPS_PING_BUFFER_SIZE", 200)
+BUFFER_SECONDS = getattr(settings, "GPS_PING_BUFFER_SECONDS", 10)
+POSITION_TIMEOUT = 60 * 60
+PING_STATUS = "ping"  # DeliveryLog.status for stored pings
+
+logger = logging.getLogger(__name__)
+
+
+class PingError(ValueError):
+    """Raised for a malformed ping; the message names the offending entry"""
+
+
+def vehicle_position_key(vehicle_id):
+    return f"transit:position:vehicle:{vehicle_id}"
+
+
+def courier_position_key(staff_id):
+    return f"transit:position:courier:{staff_id}"
+
+
+def last_stored_key(kind, assignment_id):
+    return f"transit:last-stored:{kind}:{assignment_id}"
+
+
+def parse_ping(index, data):
+    """(kind, assignment_id, latitude, longitude, recorded_at) from one ping dict"""
+    if not isinstance(data, dict):
+        raise PingError(f"ping {index}: expected an object")
+    if "transit_assignment" in data:
+        kind, assignment_id = "transit", data["transit_assignment"]
+    elif "delivery_assignment" in data:
+        kind, assignment_id = "delivery", data["delivery_assignment"]
+    else:
+        raise PingError(f"ping {index}: needs transit_assignment or delivery_assignment")
+    if isinstance(assignment_id, bool) or not isinstance(assignment_id, int):
+        raise PingError(f"ping {index}: assignment must be an id")
+    try:
+        latitude = Decimal(str(data["lat"])).quantize(Decimal("0.000001"))
+        longitude = Decimal(str(data["lon"])).quantize(Decimal("0.000001"))
+        in_range = -90 <= latitude <= 90 and -180 <= longitude <= 180
+    except (KeyError, InvalidOperation):
+        raise PingError(f"ping {index}: lat and lon must be numbers")
+    if not in_range:
+        raise PingError(f"ping {index}: coordinates out of range")
+    try:
+        recorded_at = parse_datetime(str(data["at"])) if data.get("at") else timezone.now()
+    except ValueError:
+        recorded_at = None
+    if recorded_at is None:
+        raise PingError(f"ping {index}: 'at' must be an ISO 8601 timestamp")
+    if timezone.is_naive(recorded_at):
+        recorded_at = timezone.make_aware(recorded_at, datetime.timezone.utc)
+    return kind, assignment_id, latitude, longitude, recorded_at
+
+
+def pings_to_store(pings, pending=None):
+    """
+    The pings worth storing: at most one per assignment per STORE_INTERVAL.
+    Pings already written are looked up in the cache (see mark_stored()),
+    so the interval holds across worker processes; `pending` maps
+    (kind, assignment_id) to the newest ping still waiting to be written.
+    """
+    pings = sorted(pings, key=lambda ping: ping[4])
+    keys = {(kind, assignment_id): last_stored_key(kind, assignment_id) for kind, assignment_id, *rest in pings}
+    stored = cache.get_many(list(keys.values()))
+    last = {assignment: stored[key] for assignment, key in keys.items() if key in stored}
+    for assignment, recorded_at in (pending or {}).items():
+        if assignment in keys:
+            last[assignment] = max(last.get(assignment, recorded_at), recorded_at)
+    keep = []
+    for ping in pings:
+        assignment, recorded_at = ping[:2], ping[4]
+        if assignment in last and abs((recorded_at - last[assignment]).total_seconds()) < STORE_INTERVAL:
+            continue
+        last[assignment] = recorded_at
+        keep.append(ping)
+    return keep
+
+
+def mark_stored(pings):
+    """Record in the cache when each assignment last had a ping written"""
+    latest = {}
+    for kind, assignment_id, latitude, longitude, recorded_at in pings:
+        key = last_stored_key(kind, assignment_id)
+        latest[key] = max(latest.get(key, recorded_at), recorded_at)
+    if latest:
+        cache.set_many(latest, POSITION_TIMEOUT)
+
+
+def ping_rows(pings):
+    """Unsaved TransitLog and DeliveryLog rows for a list of pings"""
+    transit, delivery = [], []
+    for kind, assignment_id, latitude, longitude, recorded_at in pings:
+        if kind == "transit":
+            transit.append(TransitLog(
+                assignment_id=assignment_id, latitude=latitude, longitude=longitude, recorded_at=recorded_at,
+            ))
+        else:
+            delivery.append(DeliveryLog(
+                assignment_id=assignment_id, status=PING_STATUS,
+                latitude=latitude, longitude=longitude, recorded_at=recorded_at,
+            ))
+    return transit, delivery
+
+
+class PingBuffer:
+    """
+    Pings waiting to be written, shared by the threads of one process.
+    The request whose pings fill the buffer writes it with bulk_create
+    before it returns; otherwise a timer writes it BUFFER_SECONDS after
+    the first ping arrived, and whatever is left is written on interpreter
+    exit, so a hard crash loses at most one buffer.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pings = []
+        self._timer = None
+
+    def add(self, pings):
+        """
+        Queue (kind, assignment_id, latitude, longitude, recorded_at) pings
+        for storage, writing the buffer if that fills it.
+        Returns how many rows were written.
+        """
+        with self._lock:
+            self._pings.extend(pings)
+            if len(self._pings) < BUFFER_SIZE:
+                if self._pings and self._timer is None:
+                    self._timer = threading.Timer(BUFFER_SECONDS, self._flush_from_timer)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return 0
+            pings = self._take()
+        return self._write(pings)
+
+    def pending(self):
+        return len(self._pings)
+
+    def pending_times(self):
+        """(kind, assignment_id) -> recorded_at of the newest buffered ping"""
+        with self._lock:
+            latest = {}
+            for ping in self._pings:
+                latest[ping[:2]] = max(latest.get(ping[:2], ping[4]), ping[4])
+        return latest
+
+    def flush(self):
+        """Write whatever is buffered"""
+        with self._lock:
+            pings = self._take()
+        return self._write(pings)
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        finally:
+            # The timer thread got its own connection; don't leave it open
+            connection.close()
+
+    def _take(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pings, self._pings = self._pings, []
+        return pings
+
+    def _write(self, pings):
+        """
+        Write the pings in one go; if the database rejects that (say an
+        assignment was deleted meanwhile), write them assignment by
+        assignment and drop only the ones that still fail.
+        """
+        if not pings:
+            return 0
+        try:
+            self._write_batch(pings)
+            written = pings
+        except DatabaseError:
+            by_assignment = defaultdict(list)
+            for ping in pings:
+                by_assignment[ping[:2]].append(ping)
+            written = []
+            for (kind, assignment_id), group in by_assignment.items():
+                try:
+                    self._write_batch(group)
+                except DatabaseError:
+                    logger.exception("Dropped %d pings for %s assignment %s", len(group), kind, assignment_id)
+                else:
+                    written.extend(group)
+        transaction.on_commit(lambda: mark_stored(written))
+        return len(written)
+
+    def _write_batch(self, pings):
+        transit, delivery = ping_rows(pings)
+        with transaction.atomic():
+            TransitLog.objects.bulk_create(transit, batch_size=500)
+            DeliveryLog.objects.bulk_create(delivery, batch_size=500)
+
+
+ping_buffer = PingBuffer()
+atexit.register(ping_buffer.flush)
+
+
+def update_positions(pings, vehicles, couriers):
+    """
+    Keep the newest position per vehicle (or per courier, for deliveries
+    without a vehicle) in the cache. `vehicles`/`couriers` map
+    (kind, assignment_id) to vehicle and staff ids.
+    """
+    latest = {}
+    for kind, assignment_id, latitude, longitude, recorded_at in pings:
+        vehicle_id = vehicles.get((kind, assignment_id))
+        key = vehicle_position_key(vehicle_id) if vehicle_id else courier_position_key(couriers[(kind, assignment_id)])
+        if key not in latest or recorded_at > latest[key]["recorded_at"]:
+            latest[key] = {
+                "lat": float(latitude),
+                "lon": float(longitude),
+                "recorded_at": recorded_at,
+                f"{kind}_assignment": assignment_id,
+            }
+    current = cache.get_many(list(latest))
+    newer = {
+        key: position for key, position in latest.items()
+        if key not in current or position["recorded_at"] > current[key]["recorded_at"]
+    }
+    cache.set_many(newer, POSITION_TIMEOUT)
+    return len(newer)
+
+
+def ingest_pings(raw_pings, staff=None):
+    """
+    Validate a batch of pings, update live positions and queue them for
+    storage. Unless `staff` is None (trusted callers) or a manager/admin,
+    pings may only be sent for the staff member's own assignments.
+    Returns {"accepted": n, "stored": n}.
+    """
+    if not isinstance(raw_pings, list):
+        raise PingError("pings must be a list")
+    if len(raw_pings) > MAX_PINGS_PER_REQUEST:
+        raise PingError(f"At most {MAX_PINGS_PER_REQUEST} pings per request")
+    pings = [parse_ping(index, data) for index, data in enumerate(raw_pings)]
+
+    vehicles, couriers = {}, {}
+    transit_ids = {assignment_id for kind, assignment_id, *rest in pings if kind == "transit"}
+    delivery_ids = {assignment_id for kind, assignment_id, *rest in pings if kind == "delivery"}
+    if transit_ids:
+        for pk, vehicle_id, driver_id in TransitAssignment.objects.filter(pk__in=transit_ids).values_list(
+            "pk", "vehicle_id", "driver_id"
+        ):
+            vehicles[("transit", pk)], couriers[("transit", pk)] = vehicle_id, driver_id
+    if delivery_ids:
+        for pk, vehicle_id, courier_id in DeliveryAssignment.objects.filter(pk__in=delivery_ids).values_list(
+            "pk", "vehicle_id", "courier_id"
+        ):
+            vehicles[("delivery", pk)], couriers[("delivery", pk)] = vehicle_id, courier_id
+
+    restricted = staff is not None and staff.role not in ("manager", "admin")
+    for index, (kind, assignment_id, *rest) in enumerate(pings):
+        if (kind, assignment_id) not in couriers:
+            raise PingError(f"ping {index}: no {kind} assignment {assignment_id}")
+        if restricted and couriers[(kind, assignment_id)] != staff.pk:
+            raise PingError(f"ping {index}: {kind} assignment {assignment_id} is not yours")
+
+    update_positions(pings, vehicles, couriers)
+    stored = pings_to_store(pings, ping_buffer.pending_times())
+    ping_buffer.add(stored)
+    return {"accepted": len(pings), "stored": len(stored)}
+
+
+def latest_positions(vehicle_ids=(), courier_ids=()):
+    """Live positions from the cache: {"vehicles": {id: position}, "couriers": {id: position}}"""
+    keys = {vehicle_position_key(pk): ("vehicles", pk) for pk in vehicle_ids}
+    keys.update({courier_position_key(pk): ("couriers", pk) for pk in courier_ids})
+    found = cache.get_many(list(keys))
+    positions = {"vehicles": {}, "couriers": {}}
+    for key, position in found.items():
+        group, pk = keys[key]
+        positions[group][pk] = position
+    return positions
@@ -0,0 +1,258 @@
+import re
+import time
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from parcels.models import Parcel
+from staff.models import Staff
+from .models import TransitAssignment, Vehicle
+from .sync import next_change_seq
+
+# Parcels still waiting for a vehicle at their origin
+PLANNABLE_STATUSES = ("packed", "returned_warehouse")
+OPEN_ASSIGNMENT_STATUSES = ("scheduled", "in_transit")
+
+# Used when dimensions are missing or unreadable: 5000 cm³ per kg, the
+# usual courier volumetric divisor, i.e. 200 kg per m³
+FALLBACK_DENSITY = 200.0
+
+# Fragile parcels never go on bikes, and may fill at most this share of a
+# vehicle's volume so there is always room to load them on top
+FRAGILE_VOLUME_SHARE = 0.5
+FRAGILE_EXCLUDED_TYPES = ("bike",)
+
+UNIT_TO_METRES = {"mm": 0.001, "cm": 0.01, "m": 1.0, "in": 0.0254}
+DEFAULT_UNIT = "cm"
+_NUMBER = r"(\d+(?:\.\d+)?)"
+DIMENSIONS_RE = re.compile(
+    rf"^\s*{_NUMBER}\s*(?:[x×*]\s*){_NUMBER}\s*(?:[x×*]\s*){_NUMBER}\s*(mm|cm|m|in)?\s*$",
+    re.IGNORECASE,
+)
+
+
+def parse_volume(dimensions):
+    """
+    Volume in m³ from a "L x W x H [unit]" string such as "40x30x20",
+    "40 x 30 x 20 cm" or "0.4*0.3*0.2m". Centimetres unless a unit is given.
+    Returns None if the string cannot be read.
+    """
+    match = DIMENSIONS_RE.match(dimensions or "")
+    if not match:
+        return None
+    length, width, height, unit = match.groups()
+    scale = UNIT_TO_METRES[(unit or DEFAULT_UNIT).lower()]
+    return float(length) * float(width) * float(height) * scale ** 3
+
+
+class PlanningError(Exception):
+    """Raised when a load plan cannot be built or saved"""
+
+
+class _Load:
+    """A vehicle being filled during planning"""
+    __slots__ = ("vehicle", "driver_id", "max_weight", "max_volume", "max_fragile_volume",
+                 "weight", "volume", "fragile_volume", "parcel_ids", "destinations", "takes_fragile")
+
+    def __init__(self, vehicle, driver_id):
+        self.vehicle = vehicle
+        self.driver_id = driver_id
+        self.max_weight = float(vehicle.capacity_weight)
+        self.max_volume = float(vehicle.capacity_volume)
+        self.max_fragile_volume = self.max_volume * FRAGILE_VOLUME_SHARE
+        self.takes_fragile = vehicle.type not in FRAGILE_EXCLUDED_TYPES
+        self.weight = self.volume = self.fragile_volume = 0.0
+        self.parcel_ids = []
+        self.destinations = set()
+
+    def fits(self, weight, volume, fragile):
+        if self.weight + weight > self.max_weight or self.volume + volume > self.max_volume:
+            return False
+        if fragile:
+            return self.takes_fragile and self.fragile_volume + volume <= self.max_fragile_volume
+        return True
+
+    def add(self, parcel_id, weight, volume, fragile, destination_id):
+        self.parcel_ids.append(parcel_id)
+        self.weight += weight
+        self.volume += volume
+        if fragile:
+            self.fragile_volume += volume
+        self.destinations.add(destination_id)
+
+    def as_dict(self):
+        return {
+            "vehicle": self.vehicle.plate_number,
+            "parcels": len(self.parcel_ids),
+            "weight": round(self.weight, 2),
+            "volume": round(self.volume, 4),
+            "weight_used": round(self.weight / self.max_weight, 3) if self.max_weight else None,
+            "volume_used": round(self.volume / self.max_volume, 3) if self.max_volume else None,
+        }
+
+
+class LoadPlan:
+    """Outcome of plan_loads(): filled vehicles plus the parcels that did not fit"""
+
+    def __init__(self, origin, loads, unplaced, estimated, elapsed):
+        self.origin = origin
+        self.loads = [load for load in loads if load.parcel_ids]
+        self.unplaced = unplaced  # [(parcel_id, reason)]
+        self.estimated = estimated  # parcels whose volume came from FALLBACK_DENSITY
+        self.elapsed = elapsed
+        self.assignments = []
+        self.skipped = 0  # planned parcels no longer waiting when the plan was saved
+
+    @property
+    def planned(self):
+        return sum(len(load.parcel_ids) for load in self.loads)
+
+    @transaction.atomic
+    def save(self, departure_time):
+        """
+        Create a scheduled TransitAssignment per loaded vehicle, in bulk.
+        Parcels that were loaded or moved on since planning are skipped;
+        returns the assignments made.
+        """
+        if self.assignments:
+            raise PlanningError("This plan has already been saved.")
+        planned = [pk for load in self.loads for pk in load.parcel_ids]
+        # pk -> destination station of the parcels still waiting
+        still_waiting = dict(
+            waiting_parcels(self.origin).filter(pk__in=planned).select_for_update()
+            .values_list("pk", "destination_station_id")
+        )
+        loads = [
+            (load, [pk for pk in load.parcel_ids if pk in still_waiting])
+            for load in self.loads
+        ]
+        loads = [(load, parcel_ids) for load, parcel_ids in loads if parcel_ids]
+        self.skipped = len(planned) - len(still_waiting)
+        change_seq = next_change_seq()  # bulk_create skips the pre_save stamp
+        assignments = []
+        for load, parcel_ids in loads:
+            # Only the parcels actually loaded decide where the vehicle is going
+            destinations = {still_waiting[pk] for pk in parcel_ids}
+            assignments.append(TransitAssignment(
+                vehicle=load.vehicle,
+                driver_id=load.driver_id,
+                origin=self.origin,
+                destination_id=destinations.pop() if len(destinations) == 1 else None,
+                departure_time=departure_time,
+                change_seq=change_seq,
+            ))
+        self.assignments = TransitAssignment.objects.bulk_create(assignments)
+        Through = TransitAssignment.parcels.through
+        Through.objects.bulk_create(
+            [
+                Through(transitassignment_id=assignment.pk, parcel_id=parcel_id)
+                for assignment, (load, parcel_ids) in zip(self.assignments, loads)
+                for parcel_id in parcel_ids
+            ],
+            batch_size=5000,
+        )
+        return self.assignments
+
+    def as_dict(self):
+        return {
+            "origin": self.origin.location_tag,
+            "planned": self.planned,
+            "vehicles": len(self.loads),
+            "unplaced": len(self.unplaced),
+            "estimated_volume": self.estimated,
+            "elapsed": round(self.elapsed, 3),
+            "loads": [load.as_dict() for load in self.loads],
+        }
+
+
+def waiting_parcels(origin):
+    """Parcels at `origin` that are not yet on a scheduled or running transit"""
+    on_open_assignment = TransitAssignment.parcels.through.objects.filter(
+        parcel_id=OuterRef("pk"),
+        transitassignment__status__in=OPEN_ASSIGNMENT_STATUSES,
+    )
+    return Parcel.objects.filter(origin=origin, status__in=PLANNABLE_STATUSES).exclude(Exists(on_open_assignment))
+
+
+def available_vehicles(origin):
+    """
+    Active vehicles with an active driver based at `origin` and no open
+    assignment, as [(vehicle, driver_id)], largest first.
+    """
+    busy = TransitAssignment.objects.filter(vehicle=OuterRef("pk"), status__in=OPEN_ASSIGNMENT_STATUSES)
+    vehicles = {
+        vehicle.pk: vehicle
+        for vehicle in Vehicle.objects.filter(active=True).exclude(Exists(busy))
+        .filter(assigned_staff__role="driver", assigned_staff__active=True, assigned_staff__location=origin)
+        .distinct()
+    }
+    drivers = {}
+    rows = Staff.objects.filter(
+        assigned_vehicle__in=vehicles, role="driver", active=True, location=origin
+    ).order_by("pk").values_list("assigned_vehicle_id", "pk")
+    for vehicle_id, staff_id in rows:
+        drivers.setdefault(vehicle_id, staff_id)
+    ordered = sorted(vehicles.values(), key=lambda v: (v.capacity_volume, v.capacity_weight), reverse=True)
+    return [(vehicle, drivers[vehicle.pk]) for vehicle in ordered]
+
+
+def plan_loads(origin, parcels=None, vehicles=None):
+    """
+    Pack parcels waiting at `origin` onto its available vehicles.
+
+    First-fit decreasing on two dimensions: parcels are taken largest first
+    (by whichever of weight or volume is the bigger share of the fleet's
+    capacity) and put on the first vehicle with room for both. Vehicles
+    already carrying the parcel's destination are tried before the rest,
+    so loads stay grouped by destination where capacity allows. Nothing is
+    written until LoadPlan.save().
+
+    `parcels` (a queryset) and `vehicles` ([(vehicle, driver_id)]) default
+    to waiting_parcels() and available_vehicles().
+    """
+    started = time.perf_counter()
+    if parcels is None:
+        parcels = waiting_parcels(origin)
+    if vehicles is None:
+        vehicles = available_vehicles(origin)
+    loads = [_Load(vehicle, driver_id) for vehicle, driver_id in vehicles]
+
+    items = []
+    estimated = 0
+    for pk, weight, dimensions, fragile, destination_id in parcels.values_list(
+        "pk", "weight", "dimensions", "fragile", "destination_station_id"
+    ):
+        weight = float(weight)
+        volume = parse_volume(dimensions)
+        if volume is None:
+            volume = weight / FALLBACK_DENSITY
+            estimated += 1
+        items.append((pk, weight, volume, fragile, destination_id))
+
+    total_weight = sum(load.max_weight for load in loads) or 1.0
+    total_volume = sum(load.max_volume for load in loads) or 1.0
+    items.sort(key=lambda item: max(item[1] / total_weight, item[2] / total_volume), reverse=True)
+
+    by_destination = defaultdict(list)
+    unplaced = []
+    for pk, weight, volume, fragile, destination_id in items:
+        target = None
+        for load in by_destination[destination_id]:
+            if load.fits(weight, volume, fragile):
+                target = load
+                break
+        else:
+            for load in loads:
+                if load.fits(weight, volume, fragile):
+                    target = load
+                    break
+        if target is None:
+            reason = "fragile, no vehicle with fragile space" if fragile else "no vehicle with enough capacity"
+            unplaced.append((pk, reason))
+            continue
+        if destination_id not in target.destinations:
+            by_destination[destination_id].append(target)
+        target.add(pk, weight, volume, fragile, destination_id)
+
+    return LoadPlan(origin, loads, unplaced, estimated, time.perf_counter() - started)
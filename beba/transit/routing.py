@@ -0,0 +1,144 @@
+import time
+
+import numpy as np
+from django.db import transaction
+
+from locations.distances import haversine_matrix
+from .models import DeliveryAssignment
+from .sync import stamp_changes
+
+ROUTABLE_STATUSES = ("assigned",)
+
+
+def route_length(matrix, tour):
+    tour = np.asarray(tour)
+    return float(matrix[tour[:-1], tour[1:]].sum())
+
+
+def nearest_neighbour(matrix, start=0):
+    """Tour from `start` through every node, always moving to the closest unvisited one"""
+    size = len(matrix)
+    visited = np.zeros(size, dtype=bool)
+    visited[start] = True
+    tour = [start]
+    current = start
+    for _ in range(size - 1):
+        distances = np.where(visited, np.inf, matrix[current])
+        current = int(distances.argmin())
+        visited[current] = True
+        tour.append(current)
+    return tour
+
+
+def two_opt(matrix, tour, closed=True):
+    """
+    Improve `tour` (node indexes starting at the depot) by reversing
+    segments while that shortens it. A closed tour also ends at the depot;
+    an open one may end anywhere. Each step scores every segment end for a
+    given start at once, and the depot never moves.
+    """
+    tour = np.asarray(tour)
+    last = len(tour) - 1
+    end = last - 1 if closed else last  # furthest node a segment may end on
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, end):
+            a, b = tour[i - 1], tour[i]
+            c = tour[i + 1:end + 1]
+            d = tour[i + 2:end + 2]
+            delta = matrix[a, c] - matrix[a, b]
+            delta[:len(d)] += matrix[b, d] - matrix[c[:len(d)], d]
+            best = int(delta.argmin())
+            if delta[best] < -1e-9:
+                j = i + 1 + best
+                tour[i:j + 1] = tour[i:j + 1][::-1].copy()
+                improved = True
+    return tour.tolist()
+
+
+def solve_route(matrix, return_to_depot=True):
+    """Visiting order for nodes 1..n of `matrix`, node 0 being the depot"""
+    tour = nearest_neighbour(matrix)
+    if return_to_depot:
+        return two_opt(matrix, tour + [0])[1:-1]
+    return two_opt(matrix, tour, closed=False)[1:]
+
+
+class RoutePlan:
+    """Stop order for one courier's run, as returned by optimize_route()"""
+
+    def __init__(self, courier, stops, unlocated, distance_before, distance_after, elapsed):
+        self.courier = courier
+        self.stops = stops  # assignments in visiting order
+        self.unlocated = unlocated  # assignments without coordinates, left at the end
+        self.distance_before = distance_before
+        self.distance_after = distance_after
+        self.elapsed = elapsed
+
+    def as_dict(self):
+        return {
+            "courier": self.courier.employee_id,
+            "stops": len(self.stops),
+            "unlocated": len(self.unlocated),
+            "distance_before_km": round(self.distance_before, 2),
+            "distance_after_km": round(self.distance_after, 2),
+            "elapsed": round(self.elapsed, 3),
+        }
+
+
+def _depot(assignments, courier):
+    for assignment in assignments:
+        origin = assignment.origin
+        if origin is not None and origin.latitude is not None and origin.longitude is not None:
+            return float(origin.latitude), float(origin.longitude)
+    location = courier.location
+    if location is not None and location.latitude is not None and location.longitude is not None:
+        return float(location.latitude), float(location.longitude)
+    return None
+
+
+def optimize_route(courier, day, return_to_depot=True, save=True):
+    """
+    Order a courier's assigned deliveries departing on `day` (a date) by
+    nearest-neighbour construction followed by 2-opt, starting from the
+    assignments' origin (or the courier's base). Stops without coordinates
+    keep their creation order after the routed ones. With `save`, the order
+    is written to DeliveryAssignment.stop_sequence in one bulk update.
+    """
+    started = time.perf_counter()
+    assignments = list(
+        DeliveryAssignment.objects.filter(courier=courier, status__in=ROUTABLE_STATUSES, departure_time__date=day)
+        .select_related("origin")
+        .order_by("pk")
+    )
+    located = [a for a in assignments if a.destination_latitude is not None and a.destination_longitude is not None]
+    unlocated = [a for a in assignments if a.destination_latitude is None or a.destination_longitude is None]
+
+    depot = _depot(assignments, courier)
+    if depot is None and located:
+        # No base to start from: begin at the first stop instead
+        depot = (float(located[0].destination_latitude), float(located[0].destination_longitude))
+    stops, before, after = located, 0.0, 0.0
+    if located:
+        matrix = haversine_matrix(
+            [depot[0]] + [float(a.destination_latitude) for a in located],
+            [depot[1]] + [float(a.destination_longitude) for a in located],
+        )
+        order = solve_route(matrix, return_to_depot)
+        original = list(range(1, len(located) + 1))
+        if return_to_depot:
+            before = route_length(matrix, [0] + original + [0])
+            after = route_length(matrix, [0] + order + [0])
+        else:
+            before = route_length(matrix, [0] + original)
+            after = route_length(matrix, [0] + order)
+        stops = [located[node - 1] for node in order]
+
+    for sequence, assignment in enumerate(stops + unlocated, start=1):
+        assignment.stop_sequence = sequence
+    if save and assignments:
+        with transaction.atomic():
+            DeliveryAssignment.objects.bulk_update(stops + unlocated, ["stop_sequence"], batch_size=500)
+            stamp_changes(DeliveryAssignment, [assignment.pk for assignment in assignments])
+    return RoutePlan(courier, stops, unlocated, before, after, time.perf_counter() - started)
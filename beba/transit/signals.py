@@ -0,0 +1,45 @@
+from django.db.models.signals import m2m_changed, post_save, pre_save
+from django.dispatch import receiver
+
+from parcels.models import Parcel
+from parcels.states import TRANSITIONS, on_transition
+from .models import DeliveryAssignment, TransitAssignment
+from .sync import next_change_seq, stamp_changes
+
+SYNCED_MODELS = (Parcel, DeliveryAssignment, TransitAssignment)
+
+
+def stamp_save(sender, instance, raw=False, **kwargs):
+    # Written by the save's own INSERT or UPDATE
+    if not raw:
+        instance.change_seq = next_change_seq()
+
+
+def stamp_partial_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw and update_fields is not None and "change_seq" not in update_fields:
+        stamp_changes(sender, [instance.pk])
+
+
+for model in SYNCED_MODELS:
+    pre_save.connect(stamp_save, sender=model)
+    post_save.connect(stamp_partial_save, sender=model)
+
+
+@receiver(m2m_changed, sender=TransitAssignment.parcels.through)
+def transit_parcels_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if reverse:
+        # parcel.transit_assignments.add(...): the parcel is the instance
+        stamp_changes(TransitAssignment, pk_set or instance.transit_assignments.values_list("pk", flat=True))
+    else:
+        stamp_changes(TransitAssignment, [instance.pk])
+
+
+def status_changed(parcel_ids, **context):
+    # Batch status changes bypass post_save, so they are stamped through the state machine
+    stamp_changes(Parcel, parcel_ids)
+
+
+for status in TRANSITIONS:
+    on_transition(status)(status_changed)
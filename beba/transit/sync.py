@@ -0,0 +1,155 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Max, Q
+
+from parcels.models import Parcel
+from .models import DeliveryAssignment, TransitAssignment
+
+# change_seq values are microsecond clock readings taken without any shared
+# lock, so a slow transaction can commit rows older than ones already
+# visible. Feeds only hand out cursors this far behind the clock; rows in
+# that window are sent again, which devices treat as an upsert.
+CHANGE_SEQ_GRACE = getattr(settings, "SYNC_CHANGE_SEQ_GRACE_SECONDS", 60)
+OPEN_DELIVERY_STATUSES = ("assigned", "out_for_delivery")
+OPEN_TRANSIT_STATUSES = ("scheduled", "in_transit")
+
+# Row layouts sent to devices; the field lists go out once per response
+DELIVERY_FIELDS = (
+    "id", "parcel_id", "status", "destination_address", "destination_city",
+    "destination_latitude", "destination_longitude", "stop_sequence",
+    "departure_time", "requires_signature", "change_seq",
+)
+TRANSIT_FIELDS = (
+    "id", "vehicle__plate_number", "origin__name", "destination__name",
+    "departure_time", "arrival_time", "status", "change_seq",
+)
+PARCEL_FIELDS = (
+    "id", "tracking_number", "status", "recipient__name", "recipient__phone",
+    "home_delivery_location", "destination_station__name", "weight", "fragile",
+    "requires_signature", "special_instructions", "change_seq",
+)
+
+
+class _ChangeClock:
+    """Microseconds since the epoch, strictly increasing within the process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last = 0
+
+    def next(self):
+        with self._lock:
+            self._last = max(time.time_ns() // 1000, self._last + 1)
+            return self._last
+
+
+_clock = _ChangeClock()
+
+
+def next_change_seq():
+    """A change_seq value for rows written now; needs no database round-trip"""
+    return _clock.next()
+
+
+def settled_change_seq():
+    """A cursor no transaction still in flight can write at or below (see CHANGE_SEQ_GRACE)"""
+    return time.time_ns() // 1000 - int(CHANGE_SEQ_GRACE * 1_000_000)
+
+
+def stamp_changes(model, ids):
+    """
+    Mark rows as changed for the sync feed, for writes that bypass
+    Model.save() (queryset updates, m2m changes). Saves are stamped in
+    their own INSERT or UPDATE by transit.signals.
+    """
+    ids = list(ids)
+    if ids:
+        model.objects.filter(pk__in=ids).update(change_seq=next_change_seq())
+
+
+def _values(rows, fields):
+    return [[row[field] for field in fields] for row in rows]
+
+
+def _fingerprint(*parts):
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:16]
+
+
+class SyncState:
+    """
+    What a device's sync depends on: its open assignments and the newest
+    change touching them. Cheap enough to answer conditional requests
+    without loading any rows.
+    """
+
+    def __init__(self, staff):
+        self.staff = staff
+        self.deliveries = DeliveryAssignment.objects.filter(courier=staff)
+        self.transits = TransitAssignment.objects.filter(driver=staff)
+        self.open_deliveries = sorted(
+            self.deliveries.filter(status__in=OPEN_DELIVERY_STATUSES).values_list("pk", flat=True)
+        )
+        self.open_transits = sorted(
+            self.transits.filter(status__in=OPEN_TRANSIT_STATUSES).values_list("pk", flat=True)
+        )
+        parcels = Parcel.objects.filter(
+            Q(delivery_assignments__in=self.open_deliveries) | Q(transit_assignments__in=self.open_transits)
+        )
+        self.cursor = max(
+            self.deliveries.aggregate(seq=Max("change_seq"))["seq"] or 0,
+            self.transits.aggregate(seq=Max("change_seq"))["seq"] or 0,
+            parcels.aggregate(seq=Max("change_seq"))["seq"] or 0,
+        )
+
+    def etag(self, since):
+        return f'"{_fingerprint(self.staff.pk, since, self.cursor, self.open_deliveries, self.open_transits)}"'
+
+    def changes(self, since):
+        """
+        Rows changed after cursor `since` (0 for everything), as compact
+        field-list + row-array tables. Open assignment ids are always
+        included so the device can drop anything no longer on its list.
+        The cursor handed back stays CHANGE_SEQ_GRACE behind the clock.
+        """
+        if since:
+            deliveries = self.deliveries.filter(change_seq__gt=since)
+            transits = self.transits.filter(change_seq__gt=since)
+        else:
+            deliveries = self.deliveries.filter(pk__in=self.open_deliveries)
+            transits = self.transits.filter(pk__in=self.open_transits)
+        deliveries = list(deliveries.order_by("pk").values(*DELIVERY_FIELDS))
+        transits = list(transits.order_by("pk").values(*TRANSIT_FIELDS))
+
+        # Parcels of assignments sent now go out in full; the rest only if they changed
+        sent_deliveries = [row["id"] for row in deliveries]
+        sent_transits = [row["id"] for row in transits]
+        transit_parcels = {}
+        for assignment_id, parcel_id in TransitAssignment.parcels.through.objects.filter(
+            transitassignment_id__in=sent_transits
+        ).values_list("transitassignment_id", "parcel_id"):
+            transit_parcels.setdefault(assignment_id, []).append(parcel_id)
+        for row in transits:
+            row["parcel_ids"] = transit_parcels.get(row["id"], [])
+
+        parcels = Parcel.objects.filter(
+            Q(delivery_assignments__in=sent_deliveries)
+            | Q(transit_assignments__in=sent_transits)
+            | (
+                Q(change_seq__gt=since)
+                & (Q(delivery_assignments__in=self.open_deliveries) | Q(transit_assignments__in=self.open_transits))
+            )
+        ).distinct().order_by("pk").values(*PARCEL_FIELDS)
+
+        return {
+            "cursor": max(min(self.cursor, settled_change_seq()), since),
+            "open": {"deliveries": self.open_deliveries, "transits": self.open_transits},
+            "deliveries": {"fields": DELIVERY_FIELDS, "rows": _values(deliveries, DELIVERY_FIELDS)},
+            "transits": {
+                "fields": TRANSIT_FIELDS + ("parcel_ids",),
+                "rows": _values(transits, TRANSIT_FIELDS + ("parcel_ids",)),
+            },
+            "parcels": {"fields": PARCEL_FIELDS, "rows": _values(parcels, PARCEL_FIELDS)},
+        }
@@ -1,3 +1,372 @@
+import datetime
+import io
+from decimal import Decimal
+from unittest import mock
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from locations.models import Location
+from parcels.models import Parcel
+from parcels.utils import bulk_update_status
+from staff.models import Staff
+from .dispatch import plan_dispatch
+from .models import DeliveryAssignment, DeliveryLog, TransitAssignment, TransitLog, Vehicle
+from .pings import PingBuffer, PingError, ingest_pings, latest_positions, mark_stored, pings_to_store
+from .planning import parse_volume, plan_loads
+from .routing import optimize_route, solve_route
+from .sync import SyncState, settled_change_seq
+
+
+def make_staff(username, role, **fields):
+    user = User.objects.create_user(username)
+    return Staff.objects.create(user=user, role=role, employee_id=username, **fields)
+
+
+def make_delivery(parcel, courier, **fields):
+    fields.setdefault("departure_time", timezone.now())
+    return DeliveryAssignment.objects.create(parcel=parcel, courier=courier, destination_address="-", **fields)
+
+
+class ChangeSeqTests(TestCase):
+    def test_saves_are_stamped_in_their_own_write(self):
+        with CaptureQueriesContext(connection) as queries:
+            parcel = Parcel.objects.create(tracking_number="SEQ-1", weight=Decimal("1"))
+            created = parcel.change_seq
+            parcel.save()
+        self.assertIsNotNone(created)
+        saved = parcel.change_seq
+        self.assertGreater(saved, created)
+        parcel.refresh_from_db()
+        self.assertEqual(parcel.change_seq, saved)
+        self.assertEqual(len(queries), 2)
+        self.assertFalse([query for query in queries if "numbersequence" in query["sql"]])
+
+    def test_partial_saves_and_queryset_writes_are_stamped(self):
+        parcel = Parcel.objects.create(tracking_number="SEQ-2", weight=Decimal("1"))
+        created = parcel.change_seq
+        parcel.weight = Decimal("2")
+        parcel.save(update_fields=["weight"])
+        parcel.refresh_from_db()
+        partial = parcel.change_seq
+        self.assertGreater(partial, created)
+        bulk_update_status([parcel], "in_transit")
+        parcel.refresh_from_db()
+        self.assertGreater(parcel.change_seq, partial)
+
+
+class SyncFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.courier = make_staff("courier", "courier")
+        other = make_staff("other", "courier")
+        cls.parcel, delivered, foreign, cls.carried = [
+            Parcel.objects.create(tracking_number=f"SYNC-{i}", weight=Decimal("1")) for i in range(4)
+        ]
+        cls.open = make_delivery(cls.parcel, cls.courier)
+        make_delivery(delivered, cls.courier, status="delivered")
+        make_delivery(foreign, other)
+        cls.transit = TransitAssignment.objects.create(
+            vehicle=Vehicle.objects.create(plate_number="KDA 001A", type="van"),
+            driver=cls.courier,
+            departure_time=timezone.now(),
+        )
+        cls.transit.parcels.add(cls.carried)
+
+    def test_full_sync_sends_open_assignments_and_their_parcels(self):
+        state = SyncState(self.courier)
+        feed = state.changes(0)
+        self.assertEqual(feed["open"], {"deliveries": [self.open.pk], "transits": [self.transit.pk]})
+        self.assertEqual([row[0] for row in feed["deliveries"]["rows"]], [self.open.pk])
+        self.assertEqual(feed["transits"]["rows"][0][-1], [self.carried.pk])
+        self.assertEqual([row[0] for row in feed["parcels"]["rows"]], [self.parcel.pk, self.carried.pk])
+        # Just-written rows sit inside the grace window, so the cursor stays behind them
+        self.assertLess(feed["cursor"], state.cursor)
+        self.assertLessEqual(feed["cursor"], settled_change_seq())
+        resent = state.changes(feed["cursor"])
+        self.assertLessEqual({self.parcel.pk, self.carried.pk}, {row[0] for row in resent["parcels"]["rows"]})
+
+    def test_incremental_sync_sends_only_later_changes(self):
+        state = SyncState(self.courier)
+        feed = state.changes(state.cursor)
+        self.assertEqual((feed["deliveries"]["rows"], feed["transits"]["rows"], feed["parcels"]["rows"]), ([], [], []))
+        self.assertEqual(SyncState(self.courier).etag(state.cursor), state.etag(state.cursor))
+
+        self.parcel.special_instructions = "Call on arrival"
+        self.parcel.save()
+        changed = SyncState(self.courier)
+        self.assertGreater(changed.cursor, state.cursor)
+        self.assertNotEqual(changed.etag(state.cursor), state.etag(state.cursor))
+        feed = changed.changes(state.cursor)
+        self.assertEqual(feed["deliveries"]["rows"], [])
+        self.assertEqual([row[0] for row in feed["parcels"]["rows"]], [self.parcel.pk])
+
+    def test_assignment_changes_resend_their_parcels(self):
+        state = SyncState(self.courier)
+        self.transit.status = "in_transit"
+        self.transit.save()
+        feed = SyncState(self.courier).changes(state.cursor)
+        self.assertEqual([row[0] for row in feed["transits"]["rows"]], [self.transit.pk])
+        self.assertEqual([row[0] for row in feed["parcels"]["rows"]], [self.carried.pk])
+
+    def test_view_rejects_cursors_that_are_not_integers(self):
+        self.client.force_login(self.courier.user)
+        url = reverse("transit:device_sync")
+        self.assertEqual(self.client.get(url, {"cursor": "0"}).status_code, 200)
+        for cursor in ("\u00b2", "-1", "1.5", str(2 ** 63)):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(url, {"cursor": cursor}).status_code, 400)
+
+
+class PingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.courier = make_staff("rider", "courier")
+        cls.other = make_staff("rider2", "courier")
+        cls.manager = make_staff("boss", "manager")
+        parcel = Parcel.objects.create(tracking_number="PING-1", weight=Decimal("1"))
+        cls.delivery = make_delivery(parcel, cls.courier)
+        cls.start = timezone.now()
+
+    def setUp(self):
+        cache.clear()
+
+    def ping(self, seconds, assignment=None):
+        return {
+            "delivery_assignment": (assignment or self.delivery).pk,
+            "lat": -1.28,
+            "lon": 36.82,
+            "at": (self.start + datetime.timedelta(seconds=seconds)).isoformat(),
+        }
+
+    def parsed(self, seconds, assignment_id=None):
+        assignment_id = self.delivery.pk if assignment_id is None else assignment_id
+        return ("delivery", assignment_id, Decimal("-1.28"), Decimal("36.82"), self.start + datetime.timedelta(seconds=seconds))
+
+    def test_stores_one_ping_per_interval_across_calls(self):
+        kept = pings_to_store([self.parsed(70), self.parsed(0), self.parsed(30)])
+        self.assertEqual([ping[4] for ping in kept], [self.parsed(0)[4], self.parsed(70)[4]])
+        # Nothing counts as stored until it has been written
+        self.assertEqual(len(pings_to_store([self.parsed(100)])), 1)
+        mark_stored(kept)
+        self.assertEqual(pings_to_store([self.parsed(100)]), [])
+        self.assertEqual(len(pings_to_store([self.parsed(130)])), 1)
+        self.assertEqual(pings_to_store([self.parsed(130)], pending={self.parsed(0)[:2]: self.parsed(100)[4]}), [])
+
+    def test_buffer_writes_once_full(self):
+        buffer = PingBuffer()
+        with mock.patch("transit.pings.BUFFER_SIZE", 2), mock.patch("transit.pings.threading.Timer"):
+            self.assertEqual(buffer.add([self.parsed(0)]), 0)
+            self.assertEqual(DeliveryLog.objects.count(), 0)
+            self.assertEqual(buffer.add([self.parsed(60)]), 2)
+        self.assertEqual(buffer.pending(), 0)
+        self.assertEqual(DeliveryLog.objects.filter(status="ping").count(), 2)
+        self.assertEqual(buffer.flush(), 0)
+
+    def test_buffer_is_written_on_a_timer(self):
+        buffer = PingBuffer()
+        with mock.patch("transit.pings.threading.Timer") as timer:
+            self.assertEqual(buffer.add([self.parsed(0)]), 0)
+            buffer.add([self.parsed(60)])
+        timer.assert_called_once_with(10, buffer._flush_from_timer)
+        timer.return_value.start.assert_called_once_with()
+        self.assertEqual(buffer.flush(), 2)
+        timer.return_value.cancel.assert_called_once_with()
+
+    def test_a_rejected_assignment_only_drops_its_own_pings(self):
+        buffer = PingBuffer()
+        write_batch = buffer._write_batch
+
+        def write(pings):
+            if any(ping[1] == 0 for ping in pings):
+                raise IntegrityError("FOREIGN KEY constraint failed")
+            write_batch(pings)
+
+        with mock.patch.object(buffer, "_write_batch", side_effect=write), mock.patch("transit.pings.threading.Timer"):
+            with self.assertLogs("transit.pings", "ERROR"), self.captureOnCommitCallbacks() as callbacks:
+                self.assertEqual(buffer.add([self.parsed(0), self.parsed(0, assignment_id=0)]), 0)
+                self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(DeliveryLog.objects.filter(status="ping").count(), 1)
+        # Marked as stored once the write commits, and only for the rows that were written
+        self.assertEqual(pings_to_store([self.parsed(30)]), [self.parsed(30)])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(pings_to_store([self.parsed(30), self.parsed(30, assignment_id=0)]),
+                         [self.parsed(30, assignment_id=0)])
+
+    @mock.patch("transit.pings.BUFFER_SIZE", 1)
+    def test_ingest_updates_the_live_position(self):
+        result = ingest_pings([self.ping(0), self.ping(10)], staff=self.courier)
+        self.assertEqual(result, {"accepted": 2, "stored": 1})
+        position = latest_positions(courier_ids=[self.courier.pk])["couriers"][self.courier.pk]
+        self.assertEqual(position["delivery_assignment"], self.delivery.pk)
+        self.assertEqual(position["recorded_at"], self.start + datetime.timedelta(seconds=10))
+        self.assertEqual(DeliveryLog.objects.count(), 1)
+
+    @mock.patch("transit.pings.BUFFER_SIZE", 1)
+    def test_ingest_rejects_other_couriers_assignments(self):
+        with self.assertRaisesMessage(PingError, "is not yours"):
+            ingest_pings([self.ping(0)], staff=self.other)
+        with self.assertRaisesMessage(PingError, "no delivery assignment"):
+            ingest_pings([{**self.ping(0), "delivery_assignment": 0}])
+        with self.assertRaisesMessage(PingError, "assignment must be an id"):
+            ingest_pings([{**self.ping(0), "delivery_assignment": True}])
+        with self.assertRaisesMessage(PingError, "lat and lon must be numbers"):
+            ingest_pings([{**self.ping(0), "lat": "north"}])
+        self.assertEqual(ingest_pings([self.ping(0)], staff=self.manager)["accepted"], 1)
+
+    @mock.patch("transit.pings.BUFFER_SIZE", 1)
+    def test_positions_view_rejects_ids_that_are_not_numbers(self):
+        ingest_pings([self.ping(0)], staff=self.courier)
+        self.client.force_login(self.manager.user)
+        url = reverse("transit:live_positions")
+        response = self.client.get(url, {"courier": self.courier.pk})
+        self.assertEqual(list(response.json()["couriers"]), [str(self.courier.pk)])
+        for params in ({"vehicle": "\u00b2"}, {"courier": "abc"}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+
+
+class PlanningTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.origin, cls.destination = Location.objects.bulk_create([
+            Location(name="Main warehouse", location_tag="WH1", location_type="warehouse", address="-", city="Nairobi"),
+            Location(name="Nakuru station", location_tag="NKR", location_type="pickup_station", address="-", city="Nakuru"),
+        ])
+        cls.van = Vehicle.objects.create(plate_number="KDB 002B", type="van", capacity_weight=100, capacity_volume=1)
+        cls.bike = Vehicle.objects.create(plate_number="KMC 003C", type="bike", capacity_weight=20, capacity_volume=Decimal("0.2"))
+        for name, vehicle in (("driver1", cls.van), ("driver2", cls.bike)):
+            make_staff(name, "driver", location=cls.origin, assigned_vehicle=vehicle)
+
+    def make_parcels(self, *weights, **fields):
+        return Parcel.objects.bulk_create([
+            Parcel(tracking_number=f"LOAD-{Parcel.objects.count() + i}", origin=self.origin,
+                   destination_station=self.destination, weight=Decimal(weight), **fields)
+            for i, weight in enumerate(weights)
+        ])
+
+    def test_reads_dimensions(self):
+        self.assertAlmostEqual(parse_volume("40 x 30 x 20"), 0.024)
+        self.assertAlmostEqual(parse_volume("0.4*0.3*0.2m"), 0.024)
+        self.assertIsNone(parse_volume("large"))
+
+    def test_fills_vehicles_within_capacity(self):
+        self.make_parcels("60", "30", "15")
+        self.make_parcels("10", fragile=True)
+        self.make_parcels("200")
+        plan = plan_loads(self.origin)
+        loads = {load.vehicle.pk: load for load in plan.loads}
+        self.assertEqual(loads[self.van.pk].weight, 100)
+        self.assertEqual(loads[self.bike.pk].weight, 15)
+        self.assertEqual([reason for pk, reason in plan.unplaced], ["no vehicle with enough capacity"])
+
+    def test_save_skips_parcels_that_moved_on(self):
+        first, second = self.make_parcels("10", "10")
+        elsewhere = Location.objects.create(name="Eldoret station", location_tag="ELD", location_type="pickup_station",
+                                            address="-", city="Eldoret")
+        Parcel.objects.filter(pk=second.pk).update(destination_station=elsewhere)
+        plan = plan_loads(self.origin)
+        self.assertEqual([sorted(load.parcel_ids) for load in plan.loads], [[first.pk, second.pk]])
+        Parcel.objects.filter(pk=second.pk).update(status="in_transit")
+        assignments = plan.save(timezone.now())
+        self.assertEqual(plan.skipped, 1)
+        self.assertEqual([list(assignment.parcels.values_list("pk", flat=True)) for assignment in assignments], [[first.pk]])
+        self.assertEqual(assignments[0].destination_id, self.destination.pk)
+        self.assertIsNotNone(assignments[0].change_seq)
+        self.assertEqual(plan_loads(self.origin).planned, 0)
+
+
+class DispatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.station = Location.objects.bulk_create([
+            Location(name="Kilimani station", location_tag="KLM", location_type="pickup_station",
+                     address="-", city="Nairobi", latitude=Decimal("-1.290000"), longitude=Decimal("36.780000")),
+        ])[0]
+        cls.couriers = [make_staff(f"rider{i}", "courier", location=cls.station) for i in range(2)]
+        cls.parcels = Parcel.objects.bulk_create([
+            Parcel(tracking_number=f"HOME-{i}", status="at_station", destination_station=cls.station,
+                   home_delivery_location=f"{i} Argwings Kodhek Rd, {area}", weight=Decimal("2"))
+            for i, area in enumerate(["Kilimani", "Kilimani", "Lavington", "Lavington"])
+        ])
+
+    def test_shares_areas_among_couriers_and_saves(self):
+        plan = plan_dispatch([self.station])
+        self.assertEqual((plan.planned, plan.unassigned), (4, []))
+        self.assertEqual(sorted(len(run.parcel_ids) for run in plan.runs), [2, 2])
+        assignments = plan.save(timezone.now())
+        self.assertEqual(len(assignments), 4)
+        for assignment in DeliveryAssignment.objects.all():
+            # No geocoder: the station's position must not stand in for the home address
+            self.assertEqual((assignment.destination_latitude, assignment.destination_longitude), (None, None))
+            self.assertIsNotNone(assignment.change_seq)
+        self.assertEqual(plan_dispatch([self.station]).planned, 0)
+
+
+class RoutingTests(TestCase):
+    def test_solves_a_line_in_order(self):
+        points = np.array([0.0, 3.0, 1.0, 2.0])
+        matrix = np.abs(points[:, None] - points[None, :])
+        self.assertEqual(solve_route(matrix, return_to_depot=False), [2, 3, 1])
+
+    def test_stops_without_coordinates_are_left_unlocated(self):
+        depot, station = Location.objects.bulk_create([
+            Location(name="Depot", location_tag="DEP", location_type="pickup_station", address="-", city="Nairobi",
+                     latitude=Decimal("-1.300000"), longitude=Decimal("36.800000")),
+            Location(name="Far station", location_tag="FAR", location_type="pickup_station", address="-", city="Nairobi",
+                     latitude=Decimal("-1.100000"), longitude=Decimal("36.800000")),
+        ])
+        courier = make_staff("router", "courier", location=depot)
+        parcels = Parcel.objects.bulk_create([
+            Parcel(tracking_number=f"ROUTE-{i}", destination_station=station, weight=Decimal("1")) for i in range(4)
+        ])
+        departure = timezone.now()
+        lost = make_delivery(parcels[0], courier, departure_time=departure)
+        far = make_delivery(parcels[1], courier, departure_time=departure,
+                            destination_latitude=Decimal("-1.100000"), destination_longitude=Decimal("36.800000"))
+        near = make_delivery(parcels[2], courier, departure_time=departure,
+                             destination_latitude=Decimal("-1.290000"), destination_longitude=Decimal("36.800000"))
+        also_lost = make_delivery(parcels[3], courier, departure_time=departure)
+
+        # The destination station's position is not the home address, so it is never used for a stop
+        plan = optimize_route(courier, timezone.localdate(departure))
+        self.assertEqual([stop.pk for stop in plan.stops], [near.pk, far.pk])
+        self.assertEqual(plan.unlocated, [lost, also_lost])
+        self.assertEqual(
+            dict(DeliveryAssignment.objects.values_list("pk", "stop_sequence")),
+            {near.pk: 1, far.pk: 2, lost.pk: 3, also_lost.pk: 4},
+        )
+
+
+class PrunePingsTests(TestCase):
+    def test_thins_and_deletes_old_pings_only(self):
+        driver = make_staff("trucker", "driver")
+        assignment = TransitAssignment.objects.create(
+            vehicle=Vehicle.objects.create(plate_number="KDC 004D", type="truck"),
+            driver=driver,
+            departure_time=timezone.now(),
+        )
+        now = timezone.now()
+        ages = [datetime.timedelta(days=100), datetime.timedelta(days=10, seconds=0),
+                datetime.timedelta(days=10, seconds=-60), datetime.timedelta(days=10, seconds=-400),
+                datetime.timedelta(hours=1), datetime.timedelta(hours=1, seconds=-10)]
+        TransitLog.objects.bulk_create([
+            TransitLog(assignment=assignment, latitude=0, longitude=0, recorded_at=now - age) for age in ages
+        ])
+        TransitLog.objects.create(assignment=assignment, note="Departed")
 
-# Create your tests here.
+        call_command("prune_pings", stdout=io.StringIO())
+        self.assertEqual(
+            sorted(now - recorded_at for recorded_at in TransitLog.objects.filter(recorded_at__isnull=False)
+                   .values_list("recorded_at", flat=True)),
+            sorted([ages[1], ages[3], ages[4], ages[5]]),
+        )
+        self.assertTrue(TransitLog.objects.filter(note="Departed").exists())
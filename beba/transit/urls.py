@@ -10,11 +10,15 @@ urlpatterns = [
     path('vehicles/', views.VehicleListView.as_view(), name='vehicle_list'),
     path('vehicles/add/', views.VehicleCreateView.as_view(), name='vehicle_add'),
     path('vehicles/<int:pk>/edit/', views.VehicleUpdateView.as_view(), name='vehicle_edit'),
+    path('vehicles/positions/', views.LivePositionsView.as_view(), name='live_positions'),
+    path('pings/', views.PingIngestView.as_view(), name='ping_ingest'),
+    path('sync/', views.DeviceSyncView.as_view(), name='device_sync'),
 
     # Transit
     path('transit/', views.TransitListView.as_view(), name='transit_list'),
     path('transit/add/', views.TransitCreateView.as_view(), name='transit_add'),
     path('transit/<int:pk>/', views.TransitDetailView.as_view(), name='transit_detail'),
+    path('transit/<int:pk>/scans/', views.TransitScanView.as_view(), name='transit_scans'),
 
     # Delivery
     path('delivery/', views.DeliveryListView.as_view(), name='delivery_list'),
@@ -4,13 +4,22 @@ from django.views.generic import ListView, CreateView, UpdateView, DetailView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.urls import reverse_lazy
 from django.contrib import messages
-from django.shortcuts import redirect
+from django.shortcuts import redirect, get_object_or_404
+from django.http import HttpResponseNotModified, JsonResponse
+from django.views import View
+from django.views.decorators.gzip import gzip_page
+from django.utils.decorators import method_decorator
+import json
+from beba.pagination import KeysetPaginationMixin
 
 from .models import Vehicle, TransitAssignment, DeliveryAssignment
 from .forms import (
     VehicleForm, TransitAssignmentForm, DeliveryAssignmentForm,
     TransitLogForm, DeliveryLogForm
 )
+from .loading import LoadingError, load_parcels
+from .pings import PingError, ingest_pings, latest_positions
+from .sync import SyncState
 
 class TransitPermissionMixin(UserPassesTestMixin):
     def test_func(self):
@@ -48,11 +57,15 @@ class VehicleUpdateView(LoginRequiredMixin, TransitPermissionMixin, UpdateView):
     success_url = reverse_lazy('transit:vehicle_list')
 
 # --- Transit Assignments ---
-class TransitListView(LoginRequiredMixin, TransitPermissionMixin, ListView):
+class TransitListView(LoginRequiredMixin, TransitPermissionMixin, KeysetPaginationMixin, ListView):
     model = TransitAssignment
     template_name = 'transit/transit_list.html'
     context_object_name = 'assignments'
-    ordering = ['-departure_time']
+    paginate_by = 50
+    ordering = ['-departure_time', '-pk']
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('vehicle', 'driver__user', 'origin', 'destination')
 
 class TransitCreateView(LoginRequiredMixin, TransitPermissionMixin, CreateView):
     model = TransitAssignment
@@ -89,11 +102,15 @@ class TransitDetailView(LoginRequiredMixin, TransitPermissionMixin, DetailView):
         return self.render_to_response(self.get_context_data(log_form=log_form))
 
 # --- Delivery Assignments ---
-class DeliveryListView(LoginRequiredMixin, TransitPermissionMixin, ListView):
+class DeliveryListView(LoginRequiredMixin, TransitPermissionMixin, KeysetPaginationMixin, ListView):
     model = DeliveryAssignment
     template_name = 'transit/delivery_list.html'
     context_object_name = 'deliveries'
-    ordering = ['-departure_time']
+    paginate_by = 50
+    ordering = ['-departure_time', '-pk']
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('parcel', 'courier__user', 'vehicle', 'origin')
 
 class DeliveryCreateView(LoginRequiredMixin, TransitPermissionMixin, CreateView):
     model = DeliveryAssignment
@@ -134,4 +151,122 @@ class DeliveryDetailView(LoginRequiredMixin, TransitPermissionMixin, DetailView)
                 self.object.save()
             messages.success(request, "Delivery log added.")
             return redirect('transit:delivery_detail', pk=self.object.pk)
-        return self.render_to_response(self.get_context_data(log_form=log_form))
\ No newline at end of file
+        return self.render_to_response(self.get_context_data(log_form=log_form))
+
+# --- Scan-to-load ---
+class TransitApiPermissionMixin(UserPassesTestMixin):
+    """JSON endpoints used from devices in the field; each view names the roles it admits"""
+    allowed_roles = ("manager", "admin")
+
+    def test_func(self):
+        user = self.request.user
+        if user.is_superuser:
+            return True
+        try:
+            return user.staff_profile.role in self.allowed_roles and user.staff_profile.active
+        except AttributeError:
+            return False
+
+    def handle_no_permission(self):
+        return JsonResponse({"error": "You do not have permission to use this endpoint."}, status=403)
+
+class TransitScanView(LoginRequiredMixin, TransitApiPermissionMixin, View):
+    """
+    Scan session for loading one assignment.
+    POST {"tracking_numbers": [...]} (JSON) or repeated tracking_number form fields;
+    GET reports how many parcels are on board.
+    """
+    allowed_roles = ("warehouse", "driver", "manager", "admin")
+
+    def get(self, request, pk):
+        assignment = get_object_or_404(TransitAssignment, pk=pk)
+        return JsonResponse({
+            "assignment": assignment.pk,
+            "vehicle": assignment.vehicle.plate_number,
+            "status": assignment.status,
+            "on_board": assignment.parcels.count(),
+        })
+
+    def post(self, request, pk):
+        assignment = get_object_or_404(TransitAssignment.objects.select_related("vehicle", "origin"), pk=pk)
+        if request.content_type == "application/json":
+            try:
+                numbers = json.loads(request.body)["tracking_numbers"]
+            except (ValueError, KeyError, TypeError):
+                return JsonResponse({"error": "Expected {\"tracking_numbers\": [...]}."}, status=400)
+            if not isinstance(numbers, list) or not all(isinstance(number, str) for number in numbers):
+                return JsonResponse({"error": "tracking_numbers must be a list of strings."}, status=400)
+        else:
+            numbers = request.POST.getlist("tracking_number")
+
+        try:
+            result = load_parcels(assignment, numbers, staff=getattr(request.user, "staff_profile", None))
+        except LoadingError as exc:
+            return JsonResponse({"error": str(exc)}, status=409)
+        return JsonResponse(result.as_dict())
+
+# --- GPS pings ---
+class PingIngestView(LoginRequiredMixin, TransitApiPermissionMixin, View):
+    """
+    POST {"pings": [{"transit_assignment": id | "delivery_assignment": id,
+                     "lat": ..., "lon": ..., "at": "ISO 8601"}, ...]}
+    """
+    allowed_roles = ("driver", "courier", "manager", "admin")
+    http_method_names = ["post"]
+
+    def post(self, request):
+        try:
+            pings = json.loads(request.body)["pings"]
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({"error": "Expected {\"pings\": [...]}."}, status=400)
+        staff = None if request.user.is_superuser else request.user.staff_profile
+        try:
+            result = ingest_pings(pings, staff=staff)
+        except PingError as exc:
+            return JsonResponse({"error": str(exc)}, status=400)
+        return JsonResponse(result, status=202)
+
+class LivePositionsView(LoginRequiredMixin, TransitApiPermissionMixin, View):
+    """GET ?vehicle=<id>&courier=<staff id> (repeatable): latest known positions"""
+    allowed_roles = ("warehouse", "station", "manager", "admin")
+
+    def get(self, request):
+        try:
+            vehicle_ids = [int(value) for value in request.GET.getlist("vehicle")]
+            courier_ids = [int(value) for value in request.GET.getlist("courier")]
+        except ValueError:
+            return JsonResponse({"error": "vehicle and courier must be ids."}, status=400)
+        return JsonResponse(latest_positions(vehicle_ids, courier_ids))
+
+# --- Device sync ---
+MAX_SYNC_CURSOR = 2 ** 63 - 1  # change_seq is a 64-bit column
+
+@method_decorator(gzip_page, name="dispatch")
+class DeviceSyncView(LoginRequiredMixin, TransitApiPermissionMixin, View):
+    """
+    GET ?cursor=<n>: a driver's or courier's assignments and parcels changed
+    since the cursor from their last sync (omit it for a full download).
+    Send the previous ETag as If-None-Match to get 304 when nothing changed.
+    """
+    allowed_roles = ("driver", "courier")
+
+    def get(self, request):
+        staff = getattr(request.user, "staff_profile", None)
+        if staff is None:
+            return JsonResponse({"error": "Sync is only available to staff accounts."}, status=403)
+        cursor = request.GET.get("cursor", "0")
+        # isdigit() would let through characters such as "²" that int() rejects
+        if not (cursor.isascii() and cursor.isdecimal()) or int(cursor) > MAX_SYNC_CURSOR:
+            return JsonResponse({"error": "cursor must be a non-negative integer."}, status=400)
+        since = int(cursor)
+
+        state = SyncState(staff)
+        etag = state.etag(since)
+        # gzip_page weakens the ETag it sends, so accept it back in either form
+        if request.headers.get("If-None-Match", "").removeprefix("W/") == etag:
+            response = HttpResponseNotModified()
+        else:
+            response = JsonResponse(state.changes(since), json_dumps_params={"separators": (",", ":")})
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        return response